@@ -0,0 +1,68 @@
+# %%
+"""
+Cost per env step and accuracy of the cart-pole integrators (see src/envs/cartpole_dynamics.py).
+
+Accuracy is the error after one env step from random states, against RK4 with many substeps; cost is the wall time of env.step for the whole batch.
+
+Example: python auxiliary/benchmark_cartpole_integrators.py --device cpu --bs 100000
+"""
+import argparse
+import time
+import sys
+import os
+file_path = os.path.dirname(__file__)
+sys.path.append(os.path.join(file_path, ".."))
+from src.envs.env_creators import env_creators
+from src.envs.cartpole_dynamics import INTEGRATORS, cartpole_integrate
+import torch
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--device", type=str, default="cpu")
+parser.add_argument("--bs", type=int, default=100000)
+parser.add_argument("--substeps", type=lambda s: [int(i) for i in s.split(",")], default=[1, 2, 4])
+parser.add_argument("--steps", type=int, default=200)
+parser.add_argument("--compile-step", action="store_true")
+args = parser.parse_args()
+
+
+def make_env(integrator, substeps):
+    return env_creators["cartpole"](
+        random_seed=42, quiet=True, device=args.device, bs=args.bs, noise_level=0.1, max_steps=100, keep_stats=False,
+        run_name="benchmark", exp_name="benchmark", randomize=True, skip_to_steady_state=False,
+        compile_step=args.compile_step, integrator=integrator, integrator_substeps=substeps,
+    )
+
+def synchronize():
+    if args.device.startswith("cuda"):
+        torch.cuda.synchronize()
+
+# %% Accuracy of one step from random states, against RK4 with 256 substeps
+env = make_env("euler", 1)
+generator = torch.Generator(device=args.device).manual_seed(0)
+rand = lambda low, high, shape: low + (high - low) * torch.rand(shape, device=args.device, generator=generator)
+state = torch.stack([rand(-1., 1., (args.bs,)), rand(-1., 1., (args.bs,)), rand(-0.5, 0.5, (args.bs,)), rand(-1., 1., (args.bs,))], dim=-1)
+u = rand(env.u_min, env.u_max, (args.bs,))
+disturbance = torch.zeros((args.bs, 2), device=args.device)
+params = (env.m_cart, env.m_pole, env.l)
+reference = cartpole_integrate(state.double(), u.double(), disturbance.double(), *[p.double() for p in params], env.dt, integrator="rk4", substeps=256)
+for integrator in INTEGRATORS:
+    for substeps in args.substeps:
+        next_state = cartpole_integrate(state, u, disturbance, *params, env.dt, integrator=integrator, substeps=substeps)
+        error = (next_state.double() - reference).abs().amax(dim=0).tolist()
+        print(f"{integrator}, {substeps} substep(s): max error of (x, x_dot, theta, theta_dot) after one step " + ", ".join(f"{e:.2e}" for e in error))
+
+# %% Cost per env step
+for integrator in INTEGRATORS:
+    for substeps in args.substeps:
+        env = make_env(integrator, substeps)
+        u = torch.zeros((args.bs, 1), device=args.device)
+        with torch.no_grad():
+            for _ in range(10):    # Warm up (and compile)
+                env.step(u)
+            synchronize()
+            t_start = time.perf_counter()
+            for _ in range(args.steps):
+                env.step(u)
+            synchronize()
+            elapsed = time.perf_counter() - t_start
+        print(f"{integrator}, {substeps} substep(s): {1000 * elapsed / args.steps:.3f} ms per env step, {1e9 * elapsed / (args.steps * args.bs):.2f} ns per instance-step")
@@ -0,0 +1,79 @@
+# %%
+"""
+Equivalence and throughput of the compiled env step (compile_step=True) against the eager step, for the tank and the cart-pole.
+
+Example: python auxiliary/benchmark_env_step.py --device cpu --bs 100000
+"""
+import argparse
+import time
+import sys
+import os
+file_path = os.path.dirname(__file__)
+sys.path.append(os.path.join(file_path, ".."))
+from src.envs.env_creators import env_creators
+import torch
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--envs", type=lambda s: s.split(","), default=["tank", "cartpole"])
+parser.add_argument("--device", type=str, default="cpu")
+parser.add_argument("--bs", type=int, default=100000)
+parser.add_argument("--equivalence-steps", type=int, default=50)
+parser.add_argument("--benchmark-steps", type=int, default=200)
+parser.add_argument("--tol", type=float, default=1e-4, help="Tolerance on the absolute deviation of observations and the relative deviation of rewards")
+parser.add_argument("--randomize", action="store_true")
+args = parser.parse_args()
+
+
+def make_env(env_name, compile_step):
+    return env_creators[env_name](
+        random_seed=42, quiet=True, device=args.device, bs=args.bs, noise_level=0.1, max_steps=100, keep_stats=False,
+        run_name="benchmark", exp_name="benchmark", randomize=args.randomize, skip_to_steady_state=False, reward_shaping=[0., 1., 0.],
+        compile_step=compile_step,
+    )
+
+def random_actions(env, steps):
+    """Actions uniform in the action space, the same for both envs."""
+    generator = torch.Generator(device=args.device).manual_seed(0)
+    low = torch.tensor(env.action_space.low, device=args.device, dtype=torch.float)
+    high = torch.tensor(env.action_space.high, device=args.device, dtype=torch.float)
+    for _ in range(steps):
+        yield low + (high - low) * torch.rand((args.bs, env.num_actions), device=args.device, generator=generator)
+
+def synchronize():
+    if args.device.startswith("cuda"):
+        torch.cuda.synchronize()
+
+# %% Equivalence: same seeds and actions, compare observation, reward and done flags at every step
+for env_name in args.envs:
+    eager, compiled = make_env(env_name, False), make_env(env_name, True)
+    max_deviation = 0.
+    bitwise = True
+    mismatched_done = 0
+    for u in random_actions(eager, args.equivalence_steps):
+        obs_e, rew_e, done_e, _ = eager.step(u)
+        obs_c, rew_c, done_c, _ = compiled.step(u)
+        bitwise = bitwise and torch.equal(obs_e, obs_c) and torch.equal(rew_e, rew_c)
+        # Instances whose episode ends differently diverge afterwards, so they are excluded from the comparison of values
+        same = (done_e == done_c) & (eager.step_count == compiled.step_count)
+        mismatched_done += (done_e != done_c).sum().item()
+        obs_deviation = torch.where(same.unsqueeze(-1), obs_e - obs_c, 0.).abs().max().item()
+        rew_deviation = torch.where(same, (rew_e - rew_c) / (1. + rew_e.abs()), 0.).abs().max().item()
+        max_deviation = max(max_deviation, obs_deviation, rew_deviation)
+    ok = max_deviation <= args.tol and mismatched_done <= 1e-4 * args.bs * args.equivalence_steps
+    print(f"{env_name}: bitwise identical {bitwise}, max deviation {max_deviation:.2e}, mismatched done flags {mismatched_done} -> {'OK' if ok else 'MISMATCH'}")
+
+# %% Throughput
+for env_name in args.envs:
+    for compile_step in [False, True]:
+        env = make_env(env_name, compile_step)
+        actions = list(random_actions(env, args.benchmark_steps))
+        with torch.no_grad():
+            for u in actions[:10]:    # Warm up (and compile)
+                env.step(u)
+            synchronize()
+            t_start = time.perf_counter()
+            for u in actions:
+                env.step(u)
+            synchronize()
+            elapsed = time.perf_counter() - t_start
+        print(f"{env_name}, {'compiled' if compile_step else 'eager'}: {args.benchmark_steps * args.bs / elapsed:.3e} instance-steps/s")
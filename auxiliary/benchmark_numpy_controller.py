@@ -0,0 +1,80 @@
+# %%
+"""Compare the per-call latency of the bs=1 control path: torch QPUnrolledNetwork (as in visualize_trajectories.py), the folded/exported torch policy, and the NumPy runtime."""
+import numpy as np
+import sys
+import os
+file_path = os.path.dirname(__file__)
+sys.path.append(os.path.join(file_path, ".."))
+from src.modules.qp_unrolled_network import QPUnrolledNetwork
+from src.modules.folded_policy import ExportedQPPolicy
+from src.utils.numpy_controller import NumpyQPController
+import torch
+import time
+
+# Tank configuration; weights are random unless a checkpoint is given as the first argument
+device = "cpu"
+input_size = 8
+n = 2
+m = 64
+qp_iter = 10
+actions_num = 2
+action_low = np.zeros(actions_num)
+action_high = 8. * np.ones(actions_num)
+num_calls = 10000
+
+torch.manual_seed(42)
+net = QPUnrolledNetwork(device, input_size, n, m, qp_iter, None, True, True, is_test=True)
+running_mean = torch.rand((input_size,)) * 10.
+running_var = torch.rand((input_size,)) * 10. + 1.
+if len(sys.argv) > 1 and sys.argv[1].endswith(".pth"):
+    model = torch.load(sys.argv[1], map_location=device)["model"]
+    prefix = "a2c_network.policy_net."
+    net.load_state_dict({k[len(prefix):]: v for (k, v) in model.items() if k.startswith(prefix)})
+    running_mean = model["running_mean_std.running_mean"].to(dtype=torch.float)
+    running_var = model["running_mean_std.running_var"].to(dtype=torch.float)
+net.eval()
+
+exported = ExportedQPPolicy(net.fold(), actions_num, obs_mean=running_mean, obs_var=running_var, action_low=action_low, action_high=action_high)
+controller_64 = NumpyQPController.from_exported(exported, dtype=np.float64)
+controller_32 = NumpyQPController.from_exported(exported, dtype=np.float32)
+
+# Torch path of the experiment scripts: tensor creation, network with autograd enabled, and round-trip to NumPy
+t = lambda arr: torch.tensor(arr, device=device, dtype=torch.float).unsqueeze(0)
+a = lambda t: t.squeeze(0).detach().cpu().numpy()
+running_std = (running_var + 1e-5).sqrt()
+def torch_controller(obs):
+    obs_n = ((t(obs) - running_mean) / running_std).clamp(-5., 5.)
+    action = net(obs_n)[:, :actions_num].clamp(-1., 1.)
+    return a(t(action_low) + t(action_high - action_low) * (action + 1) / 2)
+
+def exported_controller(obs):
+    with torch.no_grad():
+        return a(exported(t(obs)))
+
+# %% Check consistency
+rng = np.random.default_rng(0)
+observations = 20. * rng.random((num_calls, input_size))
+for obs in observations[:100]:
+    u_torch = torch_controller(obs)
+    assert np.allclose(u_torch, exported_controller(obs), atol=1e-3)
+    assert np.allclose(u_torch, controller_64(obs), atol=1e-3)
+    assert np.allclose(u_torch, controller_32(obs), atol=1e-3)
+print("Outputs consistent")
+
+# %% Benchmark
+def benchmark(controller):
+    for obs in observations[:100]:
+        controller(obs)
+    t_start = time.perf_counter()
+    for obs in observations:
+        controller(obs)
+    return (time.perf_counter() - t_start) / num_calls * 1e6
+
+torch.set_num_threads(1)
+for name, controller in [
+    ("torch (QPUnrolledNetwork)", torch_controller),
+    ("torch (exported)", exported_controller),
+    ("numpy float64", controller_64),
+    ("numpy float32", controller_32),
+]:
+    print(f"{name}: {benchmark(controller):.1f} us/call")
@@ -0,0 +1,49 @@
+# %%
+"""
+Randomized tank dynamics: A x + B u from the per-instance parameters (structured perturbation), against batched products with dense per-instance matrices.
+
+Example: python auxiliary/benchmark_parametric_dynamics.py --device cpu --bs 100000
+"""
+import argparse
+import time
+import sys
+import os
+file_path = os.path.dirname(__file__)
+sys.path.append(os.path.join(file_path, ".."))
+from src.envs.env_creators import sys_param, tank_randomizer
+from src.utils.torch_utils import bmv
+import torch
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--device", type=str, default="cpu")
+parser.add_argument("--bs", type=int, default=100000)
+parser.add_argument("--repeats", type=int, default=100)
+args = parser.parse_args()
+
+t = lambda a: torch.tensor(a, dtype=torch.float, device=args.device).unsqueeze(0)
+A0, B0 = t(sys_param["tank"]["A"]), t(sys_param["tank"]["B"])
+rng = torch.Generator(device=args.device).manual_seed(0)
+A_params, B_params = tank_randomizer.sample(args.bs, args.device, rng)
+x = 20. * torch.rand((args.bs, 4), generator=rng, device=args.device)
+u = torch.rand((args.bs, 2), generator=rng, device=args.device)
+A, B = tank_randomizer.matrices(A0, B0, A_params, B_params)
+
+structured = lambda: bmv(A0, x) + bmv(B0, u) + tank_randomizer.delta_mv("A", A_params, x) + tank_randomizer.delta_mv("B", B_params, u)
+dense = lambda: bmv(A, x) + bmv(B, u)
+print(f"Max deviation: {(structured() - dense()).abs().max().item():.2e}")
+print(f"Memory per instance: parameters {4 * (A_params.shape[1] + B_params.shape[1])} bytes, dense matrices {4 * (A[0].numel() + B[0].numel())} bytes")
+
+# %% Throughput
+def synchronize():
+    if args.device.startswith("cuda"):
+        torch.cuda.synchronize()
+
+for name, f in [("structured", structured), ("dense", dense)]:
+    f()
+    synchronize()
+    t_start = time.perf_counter()
+    for _ in range(args.repeats):
+        f()
+    synchronize()
+    elapsed = time.perf_counter() - t_start
+    print(f"{name}: {1000 * elapsed / args.repeats:.3f} ms per batch of {args.bs}")
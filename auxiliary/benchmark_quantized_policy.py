@@ -0,0 +1,94 @@
+# %%
+"""Accuracy and throughput of the reduced-precision CPU inference modes of the learned QP (int8 layers, bf16 iterations), against float32, in closed loop on the tank batch test."""
+import sys
+import os
+file_path = os.path.dirname(__file__)
+sys.path.append(os.path.join(file_path, ".."))
+from src.envs.env_creators import env_creators
+from src.modules.qp_unrolled_network import QPUnrolledNetwork
+from src.modules.qp_solver import one_sided_constraints
+import torch
+import time
+
+# Tank configuration as in experiments/tank/test_qp.sh; weights are random unless a checkpoint is given as the first argument
+device = "cpu"
+input_size = 8
+n = 2
+m = 64
+qp_iter = 10
+bs = 10000
+max_steps = 500
+net_kwargs = dict(shared_PH=True, affine_qb=True, strict_affine_layer=True, obs_has_half_ref=True, force_feasible=True, is_test=True)
+
+torch.manual_seed(42)
+state_dict = None
+if len(sys.argv) > 1 and sys.argv[1].endswith(".pth"):
+    model = torch.load(sys.argv[1], map_location=device)["model"]
+    prefix = "a2c_network.policy_net."
+    state_dict = {k[len(prefix):]: v for (k, v) in model.items() if k.startswith(prefix)}
+
+def make_net(**kwargs):
+    torch.manual_seed(42)
+    net = QPUnrolledNetwork(device, input_size, n, m, qp_iter, None, **net_kwargs, **kwargs)
+    if state_dict is not None:
+        net.load_state_dict(state_dict)
+    return net.eval()
+
+nets = {
+    "float32": make_net(),
+    "int8": make_net(quantize=True),
+    "int8 + bf16 iterations": make_net(quantize=True, bf16_iterations=True),
+}
+
+# %% Open-loop accuracy and constraint satisfaction on random observations
+obs = 20. * torch.rand((bs, input_size), device=device)
+with torch.no_grad():
+    sols = {name: net(obs) for (name, net) in nets.items()}
+    reference = nets["float32"]
+    Pinv, H = reference.get_PH()
+    q, b = reference.get_qb(obs)
+    G, g = one_sided_constraints(H[0], b, reference.symmetric, reference.force_feasible)
+for name, sol in sols.items():
+    deviation = (sol[:, :n] - sols["float32"][:, :n]).abs().max().item()
+    # Violation of the (float32) constraints of the learned QP
+    violation = (-(sol @ G.t() + g)).clamp(min=0).amax(dim=-1)
+    print(f"{name}: max action deviation {deviation:.2e}, max constraint violation {violation.max().item():.2e}")
+
+# %% Throughput
+torch.set_num_threads(1)
+for batch_size in [1, 64, 4096]:
+    x = obs[:batch_size]
+    for name, net in nets.items():
+        with torch.no_grad():
+            for _ in range(10):
+                net(x)
+            num_calls = max(10, 20000 // batch_size)
+            t_start = time.perf_counter()
+            for _ in range(num_calls):
+                net(x)
+            elapsed = time.perf_counter() - t_start
+        print(f"bs={batch_size}, {name}: {num_calls * batch_size / elapsed:.0f} solves/s")
+torch.set_num_threads(os.cpu_count())
+
+# %% Closed-loop cost and constraint violation on the tank batch test (same seeds for all modes)
+def closed_loop(net):
+    env = env_creators["tank"](
+        random_seed=42, quiet=True, device=device, bs=bs, noise_level=0., max_steps=max_steps, keep_stats=True,
+        run_name="quantization", exp_name="quantization", randomize=False, skip_to_steady_state=False, reward_shaping=[0., 1., 0.],
+    )
+    low = torch.tensor(env.action_space.low, device=device, dtype=torch.float)
+    high = torch.tensor(env.action_space.high, device=device, dtype=torch.float)
+    obs = env.reset()
+    with torch.no_grad():
+        while not env.already_on_stats.all():
+            action = net(obs)[:, :env.action_space.shape[0]].clamp(-1., 1.)
+            obs, _, _, _ = env.step(low + (high - low) * (action + 1) / 2)
+    stats = env.stats
+    steps = stats["episode_length"].sum()
+    return stats["cumulative_cost"].sum() / steps, stats["constraint_violated"].astype(bool).sum() / steps
+
+cost_ref, violation_ref = closed_loop(nets["float32"])
+print(f"float32: average cost {cost_ref:.4f}, violation frequency (x1000) {1000 * violation_ref:.3f}")
+for name in ["int8", "int8 + bf16 iterations"]:
+    cost, violation = closed_loop(nets[name])
+    print(f"{name}: average cost {cost:.4f} ({100 * (cost - cost_ref) / cost_ref:+.2f}%), violation frequency (x1000) {1000 * violation:.3f}")
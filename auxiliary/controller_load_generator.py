@@ -0,0 +1,57 @@
+# %%
+"""Load generator for the controller server: many simulated plants, each requesting an action at its own cadence, and reporting round-trip latency percentiles."""
+import argparse
+import asyncio
+import json
+import time
+import numpy as np
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--unix-socket", type=str, default="")
+parser.add_argument("--port", type=int, default=8765)
+parser.add_argument("--num-plants", type=int, default=1000)
+parser.add_argument("--input-size", type=int, default=8)
+parser.add_argument("--period-min", type=float, default=0.01, help="Seconds between requests of the fastest plant")
+parser.add_argument("--period-max", type=float, default=0.1, help="Seconds between requests of the slowest plant")
+parser.add_argument("--duration", type=float, default=10.)
+parser.add_argument("--seed", type=int, default=0)
+args = parser.parse_args()
+
+
+async def connect():
+    if args.unix_socket:
+        return await asyncio.open_unix_connection(args.unix_socket)
+    return await asyncio.open_connection("127.0.0.1", args.port)
+
+async def request(reader, writer, message):
+    writer.write((json.dumps(message) + "\n").encode())
+    await writer.drain()
+    return json.loads(await reader.readline())
+
+async def plant(index, period, latencies, t_end):
+    """One plant with its own connection, sending a random observation every period seconds (with a random phase)."""
+    rng = np.random.default_rng(args.seed + index)
+    reader, writer = await connect()
+    await asyncio.sleep(period * rng.random())
+    while time.perf_counter() < t_end:
+        t_start = time.perf_counter()
+        response = await request(reader, writer, {"id": index, "obs": (20. * rng.random(args.input_size)).tolist()})
+        assert "action" in response, response
+        latencies.append(time.perf_counter() - t_start)
+        await asyncio.sleep(max(period - (time.perf_counter() - t_start), 0.))
+    writer.close()
+
+async def main():
+    rng = np.random.default_rng(args.seed)
+    periods = args.period_min + (args.period_max - args.period_min) * rng.random(args.num_plants)
+    latencies = []
+    t_end = time.perf_counter() + args.duration
+    await asyncio.gather(*[plant(i, period, latencies, t_end) for (i, period) in enumerate(periods)])
+    latencies = np.array(latencies)
+    print(f"{len(latencies)} requests ({len(latencies) / args.duration:.0f}/s)")
+    print("Client round trip (ms): p50 {:.3f}, p90 {:.3f}, p99 {:.3f}, max {:.3f}".format(*(1e3 * np.percentile(latencies, [50, 90, 99, 100]))))
+    reader, writer = await connect()
+    print("Server:", await request(reader, writer, {"cmd": "stats"}))
+    writer.close()
+
+asyncio.run(main())
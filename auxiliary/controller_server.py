@@ -0,0 +1,25 @@
+# %%
+"""Serve an exported (TorchScript) QP policy to many plants over a local socket, with micro-batching; see src/utils/controller_server.py for the protocol."""
+import argparse
+import asyncio
+import sys
+import os
+file_path = os.path.dirname(__file__)
+sys.path.append(os.path.join(file_path, ".."))
+from src.utils.controller_server import ControllerServer
+
+parser = argparse.ArgumentParser()
+parser.add_argument("checkpoint", type=str, help="Policy exported with run.py test ... --export-policy")
+parser.add_argument("--unix-socket", type=str, default="", help="Listen on this Unix socket instead of TCP")
+parser.add_argument("--port", type=int, default=8765)
+parser.add_argument("--device", type=str, default="cpu")
+parser.add_argument("--max-batch", type=int, default=256)
+parser.add_argument("--max-latency", type=float, default=1e-3, help="Seconds")
+parser.add_argument("--input-size", type=int, default=None, help="Dimension of the observation; by default, set by the first valid request")
+args = parser.parse_args()
+
+server = ControllerServer(args.checkpoint, device=args.device, max_batch=args.max_batch, max_latency=args.max_latency, input_size=args.input_size)
+try:
+    asyncio.run(server.serve(unix_path=args.unix_socket or None, port=args.port))
+except KeyboardInterrupt:
+    print(server.statistics())
@@ -0,0 +1,94 @@
+# %%
+"""
+Batch test of several checkpoints of learned-QP policies (--shared-PH --affine-qb) with the same architecture in one rollout, instead of one run.py test process per checkpoint.
+
+Example: compare epochs 1000, 2000 and the latest checkpoint of two seeds
+python auxiliary/evaluate_checkpoints.py tank --exp-names seed0,seed1 --epoch-indices 1000,2000,-1 --n-qp 2 --m-qp 64 --strict-affine-layer --obs-has-half-ref
+"""
+import argparse
+import glob
+import sys
+import os
+file_path = os.path.dirname(__file__)
+sys.path.append(os.path.join(file_path, ".."))
+from src.envs.env_creators import env_creators
+from src.modules.qp_unrolled_network import QPUnrolledNetwork
+from src.utils.ensemble_eval import EnsembleQPPolicy, evaluate_ensemble
+import torch
+
+parser = argparse.ArgumentParser()
+parser.add_argument("env", type=str)
+parser.add_argument("--exp-names", type=lambda s: s.split(","), required=True)
+parser.add_argument("--epoch-indices", type=lambda s: [int(i) for i in s.split(",")], default=[-1], help="-1 for using latest")
+parser.add_argument("--num-parallel", type=int, default=100000, help="Total number of env instances, split evenly among the checkpoints")
+parser.add_argument("--noise-level", type=float, default=0.5)
+parser.add_argument("--seed", type=int, default=42)
+parser.add_argument("--max-steps-per-episode", type=int, default=500)
+parser.add_argument("--device", type=str, default="cuda:0")
+parser.add_argument("--randomize", action="store_true")
+parser.add_argument("--n-qp", type=int, default=5)
+parser.add_argument("--m-qp", type=int, default=4)
+parser.add_argument("--qp-iter", type=int, default=10)
+parser.add_argument("--strict-affine-layer", action="store_true")
+parser.add_argument("--obs-has-half-ref", action="store_true")
+parser.add_argument("--symmetric", action="store_true")
+parser.add_argument("--no-b", action="store_true")
+parser.add_argument("--force-feasible", action="store_true")
+parser.add_argument("--output", type=str, default="", help="Optional CSV file for the summary")
+args = parser.parse_args()
+
+
+def checkpoint_name(exp_name, epoch_index):
+    checkpoint_dir = f"runs/{args.env}_{exp_name}/nn"
+    if epoch_index == -1:
+        return f"{checkpoint_dir}/{args.env}.pth"
+    list_of_files = glob.glob(f"{checkpoint_dir}/last_{args.env}_ep_{epoch_index}_rew_*.pth")
+    return max(list_of_files, key=os.path.getctime)
+
+checkpoints = [checkpoint_name(exp_name, epoch_index) for exp_name in args.exp_names for epoch_index in args.epoch_indices]
+K = len(checkpoints)
+
+env = env_creators[args.env](
+    random_seed=args.seed, quiet=True, device=args.device, bs=args.num_parallel // K * K, noise_level=args.noise_level,
+    max_steps=args.max_steps_per_episode, keep_stats=True, run_name="ensemble", exp_name="ensemble",
+    randomize=args.randomize, skip_to_steady_state=False, reward_shaping=[0., 1., 0.],
+)
+input_size = env.observation_space.shape[0]
+actions_num = env.action_space.shape[0]
+
+# %% Load the policies and their observation normalizers
+nets, obs_means, obs_vars = [], [], []
+prefix = "a2c_network.policy_net."
+for checkpoint in checkpoints:
+    model = torch.load(checkpoint, map_location=args.device)["model"]
+    net = QPUnrolledNetwork(
+        args.device, input_size, args.n_qp, args.m_qp, args.qp_iter, None,
+        shared_PH=True, affine_qb=True,
+        strict_affine_layer=args.strict_affine_layer,
+        obs_has_half_ref=args.obs_has_half_ref,
+        symmetric=args.symmetric,
+        no_b=args.no_b,
+        force_feasible=args.force_feasible,
+        is_test=True,
+    )
+    net.load_state_dict({k[len(prefix):]: v for (k, v) in model.items() if k.startswith(prefix)})
+    nets.append(net)
+    if "running_mean_std.running_mean" in model:
+        obs_means.append(model["running_mean_std.running_mean"].to(dtype=torch.float))
+        obs_vars.append(model["running_mean_std.running_var"].to(dtype=torch.float))
+assert len(obs_means) in (0, K), "Either all or none of the checkpoints must normalize observations"
+
+# %% Evaluate
+ensemble = EnsembleQPPolicy(nets)
+t = lambda a: torch.tensor(a, device=args.device, dtype=torch.float)
+_, summary = evaluate_ensemble(
+    ensemble, env, actions_num,
+    obs_mean=torch.stack(obs_means) if obs_means else None,
+    obs_var=torch.stack(obs_vars) if obs_vars else None,
+    action_low=t(env.action_space.low),
+    action_high=t(env.action_space.high),
+)
+summary["checkpoint"] = checkpoints
+print(summary.to_string(index=False))
+if args.output:
+    summary.to_csv(args.output, index=False)
@@ -0,0 +1,44 @@
+# %%
+"""Remove never-active rows of H from a trained QP policy, keeping the actions of the reduced policy within tol of the original ones."""
+import numpy as np
+import sys
+import os
+file_path = os.path.dirname(__file__)
+sys.path.append(os.path.join(file_path, ".."))
+from src.modules.qp_unrolled_network import QPUnrolledNetwork
+from src.utils.constraint_pruning import prune_constraints
+import torch
+
+# Double integrator configuration; weights are random unless a checkpoint is given as the first argument
+device = "cpu"
+input_size = 2
+n = 3
+m = 9
+qp_iter = 10
+tol = 1e-4
+obs_low, obs_high = -5. * np.ones(input_size), 5. * np.ones(input_size)
+
+torch.manual_seed(0)
+net = QPUnrolledNetwork(device, input_size, n, m, qp_iter, None, True, True, is_test=True, force_feasible=True, symmetric=True, no_b=True)
+prefix = "a2c_network.policy_net."
+checkpoint = sys.argv[1] if len(sys.argv) > 1 and sys.argv[1].endswith(".pth") else None
+if checkpoint is not None:
+    state = torch.load(checkpoint, map_location=device)
+    model = state["model"]
+    net.load_state_dict({k[len(prefix):]: v for (k, v) in model.items() if k.startswith(prefix)})
+
+# %% Provably redundant rows over the observation box
+reduced, report = prune_constraints(net, obs_low=obs_low, obs_high=obs_high, tol=tol)
+print(f"LP: m = {m} -> {reduced.m_qp}, pruned rows {report['pruned_rows']}, restored rows {report['restored_rows']}, max deviation {report['max_deviation']:.2e}")
+
+# %% Rows never active on a set of states (here sampled uniformly; in practice collected from rollouts)
+observations = torch.tensor(obs_low + (obs_high - obs_low) * np.random.rand(100000, input_size), dtype=torch.float)
+reduced, report = prune_constraints(net, observations=observations, tol=tol)
+print(f"Dataset: m = {m} -> {reduced.m_qp}, pruned rows {report['pruned_rows']}, restored rows {report['restored_rows']}, max deviation {report['max_deviation']:.2e}")
+
+# %% Save the reduced policy in the same checkpoint format; run it with --m-qp set to the reduced m
+if checkpoint is not None:
+    model = {k: v for (k, v) in model.items() if not k.startswith(prefix)}
+    model.update({prefix + k: v for (k, v) in reduced.state_dict().items()})
+    state["model"] = model
+    torch.save(state, checkpoint.replace(".pth", f"_pruned_m{reduced.m_qp}.pth"))
@@ -0,0 +1,35 @@
+# %%
+"""Run the learned QP and the MPC baseline under a wall-clock budget per control step, and report overruns and the outcome of the solves."""
+import sys
+import os
+file_path = os.path.dirname(__file__)
+sys.path.append(os.path.join(file_path, ".."))
+from src.envs.mpc_baseline_parameters import get_mpc_baseline_parameters
+from src.modules.qp_unrolled_network import QPUnrolledNetwork
+from src.utils.realtime_controller import DeadlineQPController
+import torch
+
+device = "cpu"
+cycle_time = 1e-3
+num_steps = 1000
+bs = 1
+
+# %% Learned QP (double integrator setting, random weights)
+torch.manual_seed(0)
+net = QPUnrolledNetwork(device, 2, 3, 9, 10, None, True, True, is_test=True, force_feasible=True, symmetric=True, no_b=True)
+controller = DeadlineQPController(net, cycle_time, block_iters=5, max_iters=200)
+for _ in range(num_steps):
+    obs = 10. * torch.rand((bs, 2), device=device) - 5.
+    sol, info = controller(obs)
+print("Learned QP:", controller.statistics())
+
+# %% MPC baseline (double integrator, N = 10)
+mpc_baseline = get_mpc_baseline_parameters("double_integrator", 10)
+mpc_baseline["obs_to_state_and_ref"] = lambda obs: (obs[:, :2], torch.zeros_like(obs[:, :2]))
+# The learned P, H, q, b are unused with the MPC baseline; shared_PH and affine_qb avoid building an MLP for them
+mpc_net = QPUnrolledNetwork(device, 2, 2, 12, 10, None, shared_PH=True, affine_qb=True, mpc_baseline=mpc_baseline)
+controller = DeadlineQPController(mpc_net, cycle_time, block_iters=10, max_iters=1000)
+for _ in range(num_steps):
+    obs = 10. * torch.rand((bs, 2), device=device) - 5.
+    sol, info = controller(obs)
+print("MPC:", controller.statistics())
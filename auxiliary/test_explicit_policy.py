@@ -0,0 +1,55 @@
+# %%
+"""Compile the explicit (piecewise-affine) solution of the learned QP and of the MPC template, and check it against the interior-point solver on many states."""
+import numpy as np
+import sys
+import os
+file_path = os.path.dirname(__file__)
+sys.path.append(os.path.join(file_path, ".."))
+from src.envs.env_creators import sys_param
+from src.envs.mpc_baseline_parameters import get_mpc_baseline_parameters
+from src.modules.qp_unrolled_network import QPUnrolledNetwork
+from src.modules.explicit_policy import compile_explicit_policy, get_affine_qp
+from src.modules.ip_solver import IPQPSolver
+import torch
+import time
+
+device = "cpu"
+num_states = 1000000
+
+# %% Learned QP (double integrator setting, random weights)
+torch.manual_seed(0)
+net = QPUnrolledNetwork(device, 2, 3, 9, 10, None, True, True, is_test=True, force_feasible=True, symmetric=True, no_b=True)
+obs_low, obs_high = -5. * np.ones(2), 5. * np.ones(2)
+t_start = time.time()
+explicit = compile_explicit_policy(net, obs_low, obs_high, verbose=True)
+print(f"Learned QP: {explicit.num_regions} regions, compiled in {time.time() - t_start:.1f} s")
+
+obs = torch.tensor(obs_low + (obs_high - obs_low) * np.random.rand(num_states, 2), dtype=torch.float)
+t_start = time.time()
+sol, region = explicit(obs)
+print(f"Lookup of {num_states} states: {time.time() - t_start:.2f} s, coverage {(region >= 0).float().mean().item():.4f}")
+
+def check_against_ip(net, obs, sol, region):
+    """Max deviation of the explicit solution from the interior-point solution of the same QP, over the covered observations where the interior-point solver converged."""
+    P, q0, Wq, G, g0, Wg = get_affine_qp(net)
+    oracle = IPQPSolver("cpu", P.shape[0], G.shape[0], P=P, H=G)
+    theta = obs.cpu().double()
+    sol_ip, _, _, converged = oracle(torch.tensor(q0) + theta @ torch.tensor(Wq).T, torch.tensor(g0) + theta @ torch.tensor(Wg).T)
+    covered = (region >= 0).cpu() & converged
+    return (sol.cpu().double()[covered] - sol_ip[covered]).abs().max().item() if covered.any() else float("nan")
+
+# Compare with the exact solution on a subset
+print(f"Max deviation from the interior-point solution: {check_against_ip(net, obs[:10000], sol[:10000], region[:10000]):.2e}")
+
+# %% MPC template (double integrator, N = 2)
+mpc_baseline = get_mpc_baseline_parameters("double_integrator", 2)
+mpc_baseline["obs_to_state_and_ref"] = lambda obs: (obs[:, :2], torch.zeros_like(obs[:, :2]))
+# The learned P, H, q, b are unused with the MPC baseline; shared_PH and affine_qb avoid building an MLP for them
+mpc_net = QPUnrolledNetwork(device, 2, 2, 12, 10, None, shared_PH=True, affine_qb=True, mpc_baseline=mpc_baseline)
+x_min, x_max = sys_param["double_integrator"]["x_min"], sys_param["double_integrator"]["x_max"]
+explicit_mpc = compile_explicit_policy(mpc_net, x_min * np.ones(2), x_max * np.ones(2))
+print(f"MPC: {explicit_mpc.num_regions} regions")
+
+obs = torch.tensor(x_min + (x_max - x_min) * np.random.rand(10000, 2), dtype=torch.float)
+sol, region = explicit_mpc(obs)
+print(f"MPC coverage {(region >= 0).float().mean().item():.4f}, max deviation from the interior-point solution: {check_against_ip(mpc_net, obs, sol, region):.2e}")
@@ -5,9 +5,11 @@ file_path = os.path.dirname(__file__)
 sys.path.append(os.path.join(file_path, ".."))
 from src.envs.mpc_baseline_parameters import get_mpc_baseline_parameters
 from src.modules.qp_solver import QPSolver
+from src.modules.ip_solver import IPQPSolver
 from src.utils.mpc_utils import mpc2qp
 from src.utils.osqp_utils import osqp_oracle
 from src.utils.np_batch_op import np_batch_op
+from src.utils.telemetry import STATUS_SOLVED
 import torch
 import time
 import scipy
@@ -17,7 +19,8 @@ import csv
 
 def compare(N, num_parallel, device="cuda:0", iterations=100, seed=42, max_cpu_workers=8):
     """
-    Compare parallelized solver vs. OSQP on MPC problem with horizon N.
+    Compare parallelized solver vs. batched interior-point oracle vs. OSQP on MPC problem with horizon N.
+    The accuracy of the interior-point oracle is reported as its max deviation from OSQP run to convergence, over the instances solved by both.
     """
 
     # Load model and config
@@ -64,6 +67,13 @@ def compare(N, num_parallel, device="cuda:0", iterations=100, seed=42, max_cpu_w
     Xs, primal_sols = solver(q, b, iters=iterations)
     t_parallel = time.time() - t
 
+    # Time solving with batched interior-point oracle (always on CPU, in double precision)
+    ip_solver = IPQPSolver("cpu", n, m, P=P.cpu(), H=H.cpu())
+    q_cpu, b_cpu = q.cpu(), b.cpu()
+    t = time.time()
+    sol_ip, lam_ip, iter_counts_ip, converged_ip = ip_solver(q_cpu, b_cpu)
+    t_ip = time.time() - t
+
     # Time solving with OSQP
     f = lambda t: t.detach().cpu().numpy()
     f_sparse = lambda t: scipy.sparse.csc_matrix(t.cpu().numpy())
@@ -73,7 +83,14 @@ def compare(N, num_parallel, device="cuda:0", iterations=100, seed=42, max_cpu_w
     sol_np, iter_counts = np_batch_op(osqp_oracle_with_iter_count, q_np, b_np, P_np, H_np, max_workers=max_cpu_workers)
     t_osqp = time.time() - t
 
-    return n, m, t_parallel, t_osqp
+    # Accuracy of the interior-point oracle against OSQP run to convergence (not timed)
+    osqp_oracle_with_stats = functools.partial(osqp_oracle, return_stats=True)
+    sol_ref, _, _, statuses, _, _ = np_batch_op(osqp_oracle_with_stats, q_np, b_np, P_np, H_np, max_workers=max_cpu_workers)
+    solved = converged_ip.numpy() & (statuses == STATUS_SOLVED)
+    ip_max_deviation = np.abs(sol_ip.numpy() - sol_ref)[solved].max() if solved.any() else np.nan
+    ip_converged = converged_ip.double().mean().item()
+
+    return n, m, t_parallel, t_ip, t_osqp, ip_max_deviation, ip_converged
 
 Ns_mpc = [2 ** i for i in range(1, 5)]
 nums_parallel = [2 ** i for i in range(1, 16)]
@@ -82,6 +99,6 @@ func_output = [compare(*args) for args in func_input]
 # Write to CSV
 with open("parallel_vs_osqp.csv", "w") as f:
     writer = csv.writer(f)
-    writer.writerow(["N_mpc", "num_parallel", "n_qp", "m_qp", "t_parallel", "t_osqp"])
+    writer.writerow(["N_mpc", "num_parallel", "n_qp", "m_qp", "t_parallel", "t_ip", "t_osqp", "ip_max_deviation", "ip_converged"])
     for args, output in zip(func_input, func_output):
         writer.writerow([*args, *output])
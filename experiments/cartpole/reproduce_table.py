@@ -1,8 +1,13 @@
 # %%
+import sys
+import os
+file_path = os.path.dirname(__file__)
+sys.path.append(os.path.join(file_path, "../.."))
 from glob import glob
 import pandas as pd
 import numpy as np
 import torch
+from src.utils.telemetry import read_telemetry, query_telemetry
 
 def read_csv(short_name):
     wildcard = f"{short_name}_2*"
@@ -10,8 +15,11 @@ def read_csv(short_name):
     return pd.read_csv(filename, dtype={"constraint_violated": "bool"})
 
 def read_mpc_iter_count(short_name):
-    wildcard = f"{short_name}_mpc_iter_count_2*"
-    filename = sorted(glob(f"test_results/{wildcard}"))[-1]
+    telemetry_files = sorted(glob(f"test_results/{short_name}_solver_telemetry_2*"))
+    if telemetry_files:
+        return query_telemetry(read_telemetry(telemetry_files[-1]), "iterations", backend="osqp")
+    # Results from before solver telemetry was recorded
+    filename = sorted(glob(f"test_results/{short_name}_mpc_iter_count_2*"))[-1]
     return np.genfromtxt(filename)
 
 
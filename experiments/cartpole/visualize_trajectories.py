@@ -135,7 +135,7 @@ while not done:
     action_all, problem_params = net(obs, return_problem_params=True)
     u = rescale_action(action_all[:, :m_sys])
     raw_obs, reward, done_t, info = env.step(u)
-    xs_qp.append(raw_obs[0, :4])
+    xs_qp.append(raw_obs[0, :4].clone())
     us_qp.append(u[0, :])
     obs = (raw_obs - running_mean) / running_std
     done = done_t.item()
@@ -150,7 +150,7 @@ obs = make_obs(x, x_ref, running_mean, running_std, False)
 while not done:
     action = mlp_player.get_action(obs.squeeze(0), is_deterministic=True)
     obs, reward, done_t, info = env.step(action.unsqueeze(0))
-    xs_mlp.append(obs[0, :4])
+    xs_mlp.append(obs[0, :4].clone())
     us_mlp.append(action)
     done = done_t.item()
 
@@ -17,7 +17,8 @@ u_min = sys_param["tank"]["u_min"] * np.ones(2)
 u_max = 1.0 * np.ones(2)
 
 # %% Oracle
-from src.utils.osqp_utils import osqp_oracle
+import torch
+from src.modules.ip_solver import IPQPSolver
 
 # min (x - x_ref)' * Q * (x - x_ref) + u' * R * u, s.t., x = (I - A)^{-1} * B * u, x_min <= x <= x_max, u_min <= u <= u_max; cast into min 0.5 * u' * P * u + q' * u, s.t., H * u + b >= 0
 
@@ -45,7 +46,10 @@ b = np.hstack([
     u_max
 ])
 
-u_opt = osqp_oracle(q, b, P, H)
+ip_solver = IPQPSolver("cpu", P.shape[0], H.shape[0], P=P, H=H)
+u_opt, _, _, converged = ip_solver(torch.tensor(q).unsqueeze(0), torch.tensor(b).unsqueeze(0))
+assert converged.item(), "The interior-point solver did not converge"
+u_opt = u_opt.squeeze(0).numpy()
 x_opt = inv_I_minus_A @ B @ u_opt
 
 # %% Evaluation
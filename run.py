@@ -35,6 +35,13 @@ def float_list(string):
     except ValueError:
         raise argparse.ArgumentTypeError("Argument must be a comma-separated list of floats")
 
+def int_list(string):
+    """Convert a string into a list of ints."""
+    try:
+        return [int(item) for item in string.split(',')]
+    except ValueError:
+        raise argparse.ArgumentTypeError("Argument must be a comma-separated list of ints")
+
 
 parser = argparse.ArgumentParser()
 parser.add_argument("train_or_test", type=str, help="Train or test")
@@ -67,7 +74,16 @@ parser.add_argument("--no-b", action="store_true")
 parser.add_argument("--warm-start", action="store_true")
 parser.add_argument("--ws-loss-coef", type=float, default=10.)
 parser.add_argument("--ws-update-rate", type=float, default=0.1)
+parser.add_argument("--temporal-warm-start", action="store_true", help="For test only; warm-start PDHG from the previous-step iterate of each env instance")
+parser.add_argument("--polish", action="store_true", help="Polish PDHG solutions with the exact solution of the guessed active set (learned QP in test mode with --shared-PH, and MPC baseline)")
+parser.add_argument("--screening", action="store_true", help="Use the unconstrained minimizer where feasible, and run PDHG only on the remaining instances")
 parser.add_argument("--batch-test", action="store_true")
+parser.add_argument("--quantize", action="store_true", help="For test on CPU only; dynamic int8 quantization of the MLP and (q, b) affine layers")
+parser.add_argument("--bf16-iterations", action="store_true", help="For test only; apply the PDHG iteration matrix in bfloat16")
+parser.add_argument("--anytime-checkpoints", type=int_list, default=None, help="For batch test of the learned QP; comma-separated PDHG iteration budgets evaluated in the same rollout, each on its own share of the env instances")
+parser.add_argument("--compile-env-step", action="store_true", help="Compile the elementwise part of the env step with torch.compile")
+parser.add_argument("--integrator", type=str, default="euler", choices=["euler", "semi_implicit_euler", "rk4"], help="Cartpole only; integrator of the dynamics")
+parser.add_argument("--integrator-substeps", type=int, default=1, help="Cartpole only; substeps of the integrator per env step")
 parser.add_argument("--run-name", type=str, default="")
 parser.add_argument("--randomize", action="store_true")
 parser.add_argument("--use-residual-loss", action="store_true")
@@ -82,9 +98,13 @@ parser.add_argument("--reward-shaping", type=float_list, default=[0., 1., 0.])
 
 parser.add_argument("--mpc-baseline-N", type=int, default=0)
 parser.add_argument("--use-osqp-for-mpc", action="store_true")
+parser.add_argument("--use-ip-for-mpc", action="store_true", help="Solve the MPC baseline exactly with the batched interior-point solver, on the device of the env")
 parser.add_argument("--mpc-terminal-cost-coef", type=float, default=0.)
+parser.add_argument("--mpc-pdhg-iter", type=int, default=100)
 parser.add_argument("--robust-mpc-method", type=str, default="none", choices=["none", "scenario", "tube"])
 parser.add_argument("--tube-mpc-tube-size", type=float, default=0.)
+parser.add_argument("--export-policy", type=str, default="", help="For test only; export the policy to this path instead of running the test")
+parser.add_argument("--export-format", type=str, default="torchscript", choices=["torchscript", "onnx", "numpy"])
 args = parser.parse_args()
 
 
@@ -110,6 +130,9 @@ default_env_config = {
     "randomize": args.randomize,
     "skip_to_steady_state": args.skip_to_steady_state,
     "reward_shaping": args.reward_shaping,
+    "compile_step": args.compile_env_step,
+    "integrator": args.integrator,
+    "integrator_substeps": args.integrator_substeps,
 }
 
 blacklist_keys = lambda d, blacklist: {k: d[k] for k in d if not (k in blacklist)}
@@ -168,9 +191,16 @@ if args.qp_unrolled:
         "train_warm_starter": args.warm_start and args.train_or_test == "train",
         "ws_loss_coef": args.ws_loss_coef,
         "ws_update_rate": args.ws_update_rate,
-        "mpc_baseline": None if (not args.mpc_baseline_N and not args.imitate_mpc_N) else {**get_mpc_baseline_parameters(args.env, args.mpc_baseline_N or args.imitate_mpc_N, noise_std=args.noise_level), "terminal_coef": args.mpc_terminal_cost_coef},
+        "temporal_warm_start": args.temporal_warm_start,
+        "polish": args.polish,
+        "screening": args.screening,
+        "quantize": args.quantize,
+        "bf16_iterations": args.bf16_iterations,
+        "anytime_checkpoints": sorted(set(args.anytime_checkpoints)) if args.anytime_checkpoints else None,
+        "mpc_baseline": None if (not args.mpc_baseline_N and not args.imitate_mpc_N) else {**get_mpc_baseline_parameters(args.env, args.mpc_baseline_N or args.imitate_mpc_N, noise_std=args.noise_level), "terminal_coef": args.mpc_terminal_cost_coef, "pdhg_iter": args.mpc_pdhg_iter},
         "imitate_mpc": args.imitate_mpc_N > 0,
         "use_osqp_for_mpc": args.use_osqp_for_mpc,
+        "use_ip_for_mpc": args.use_ip_for_mpc,
         "use_residual_loss": args.use_residual_loss,
         "symmetric": args.symmetric,
         "no_b": args.no_b,
@@ -223,8 +253,36 @@ if __name__ == "__main__":
                 checkpoint_name = max(list_of_files, key=os.path.getctime)
         else:
             checkpoint_name = None
-        runner.run({
-            'train': False,
-            'play': True,
-            'checkpoint' : checkpoint_name,
-        })
+        if not args.export_policy:
+            runner.run({
+                'train': False,
+                'play': True,
+                'checkpoint' : checkpoint_name,
+            })
+            if args.batch_test and args.anytime_checkpoints:
+                # Report closed-loop cost and violation for each iteration budget from the stats dumped by the env
+                import pandas as pd
+                from src.utils.anytime_stats import summarize_by_budget
+                # Named {run}_anytime_{timestamp}.csv, so that it does not match the glob of the stats files of later runs
+                tag = args.run_name or args.exp_name
+                stats_file = sorted(glob.glob(f"test_results/{tag}_2*.csv"))[-1]
+                timestamp = os.path.basename(stats_file)[len(tag) + 1:-len(".csv")]
+                summary = summarize_by_budget(pd.read_csv(stats_file), sorted(set(args.anytime_checkpoints)))
+                summary.to_csv(os.path.join("test_results", f"{tag}_anytime_{timestamp}.csv"), index=False)
+                print(summary.to_string(index=False))
+        else:
+            from src.utils.export import export_policy
+            player = runner.create_player()
+            player.restore(checkpoint_name)
+            normalizer = player.model.running_mean_std if player.normalize_input else None
+            export_policy(
+                player.model.a2c_network.policy_net,
+                args.export_policy,
+                player.actions_num,
+                obs_mean=normalizer.running_mean if normalizer is not None else None,
+                obs_var=normalizer.running_var if normalizer is not None else None,
+                obs_epsilon=normalizer.epsilon if normalizer is not None else 1e-5,
+                action_low=player.actions_low if player.clip_actions else None,
+                action_high=player.actions_high if player.clip_actions else None,
+                format=args.export_format,
+            )
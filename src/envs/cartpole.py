@@ -6,13 +6,33 @@ import os
 import random
 from datetime import datetime
 from icecream import ic
-from ..utils.torch_utils import conditional_fork_rng, bsolve, bqf, get_rng
+from ..utils.torch_utils import conditional_fork_rng, bqf, get_rng
+from .cartpole_dynamics import cartpole_integrate, INTEGRATORS
+from ..utils.episode_stats import EpisodeStatsBuffer, write_stats_file
+from ..utils.env_metrics import RunningMetrics
+
+
+def _state_column(index, doc):
+    """Property viewing column index of the state buffer; assigning to it writes into the buffer."""
+    def set_column(self, value):
+        self.state[:, index] = value
+    return property(lambda self: self.state[:, index], set_column, doc=doc)
 
 
 class CartPole():
+    # Named views of the state buffer (bs, 5), which is laid out as the observation: state (x, x_dot, theta, theta_dot), then reference
+    x = _state_column(0, "Cart position")
+    x_dot = _state_column(1, "Cart velocity")
+    theta = _state_column(2, "Pole angle")
+    theta_dot = _state_column(3, "Pole angular velocity")
+    x_ref = _state_column(4, "Reference cart position")
+
     def __init__(self, parameters, Q, R, noise_std, x_min, x_max, u_min, u_max, bs, barrier_thresh, max_steps, device="cuda:0", random_seed=None, quiet=False, keep_stats=False,
     reward_shaping_parameters={},
     run_name="",
+    compile_step=False,
+    integrator="euler",
+    substeps=1,
     **kwargs):
         """
         Class to model the Cart-Pole environment for control theory and reinforcement learning experiments.
@@ -46,6 +66,12 @@ class CartPole():
         run_name : str, optional
             Name of the experiment run.
         reward_shaping_parameters (dict, optional): Parameters for reward shaping.
+        compile_step : bool, optional
+            Compile the elementwise part of step (step_tensors) with torch.compile, with static shapes.
+        integrator : str, optional
+            Integrator of the dynamics over each time step, one of "euler" (explicit Euler), "semi_implicit_euler", "rk4".
+        substeps : int, optional
+            Number of substeps of the integrator per time step.
         """
         # Set random seed
         if random_seed is not None:
@@ -61,6 +87,9 @@ class CartPole():
 
         # Unpack parameters
         self.dt = parameters["dt"]
+        assert integrator in INTEGRATORS, f"Unknown integrator {integrator}"
+        self.integrator = integrator
+        self.substeps = substeps
         self.m_pole_min = parameters["m_pole"][0]
         self.m_pole_max = parameters["m_pole"][1]
         self.m_cart_min = parameters["m_cart"][0]
@@ -94,11 +123,8 @@ class CartPole():
         # States, references, inputs
         batch_zeros = lambda shape: torch.zeros((bs,) + shape, dtype=torch.float32, device=device)
         self.initial_state = batch_zeros((4,))
-        self.x = batch_zeros(tuple())
-        self.x_ref = batch_zeros(tuple())
-        self.x_dot = batch_zeros(tuple())
-        self.theta = batch_zeros(tuple())
-        self.theta_dot = batch_zeros(tuple())
+        self.state = batch_zeros((5,))
+        self.ref_selector = torch.tensor([1., 0., 0., 0.], device=device)   # Maps the reference to the state it is subtracted from
         self.u = batch_zeros((1,))
 
         # Episode information
@@ -118,21 +144,38 @@ class CartPole():
         self.max_steps = max_steps
         self.device = device
         self.quiet = quiet
+        self.reward_metrics = RunningMetrics(device)   # Reward terms averaged over steps, logged by RLGPUAlgoObserver unless quiet
         self.run_name = run_name
         self.reward_shaping_parameters = reward_shaping_parameters
 
         # Statistics for testing
         self.keep_stats = keep_stats
         self.already_on_stats = torch.zeros((bs,), dtype=torch.uint8, device=device)   # Each worker can only contribute once to the statistics, to avoid bias towards shorter episodes
-        self.stats = pd.DataFrame(columns=['initial_state', 'x_ref', 'episode_length', 'cumulative_cost', 'constraint_violated'])
+        self.stats_buffer = EpisodeStatsBuffer(bs, {
+            'initial_state': ((4,), torch.float32),
+            'x_ref': ((), torch.float32),
+            'episode_length': ((), torch.int32),
+            'cumulative_cost': ((), torch.float32),
+            'constraint_violated': ((), torch.bool),
+        }, device) if keep_stats else None
 
         self.info_dict = {}
+        self.step_function = torch.compile(self.step_tensors, dynamic=False) if compile_step else self.step_tensors
 
         self.reset()
 
     def obs(self):
-        """Returns the observation from the environment in the format (x, x_dot, theta, theta_dot, x_ref)."""
-        return torch.cat([t.unsqueeze(-1) for t in [self.x, self.x_dot, self.theta, self.theta_dot, self.x_ref]], dim=-1)
+        """Returns the observation from the environment in the format (x, x_dot, theta, theta_dot, x_ref).
+
+        This is the state buffer itself (no copy), which is overwritten in place by the next step or reset; clone it to keep it.
+        """
+        return self.state
+
+    def state_error(self, state=None):
+        """Returns the deviation (x - x_ref, x_dot, theta, theta_dot) of the given state buffer (by default, the current one) from its reference."""
+        if state is None:
+            state = self.state
+        return state[:, :4] - state[:, 4:] * self.ref_selector
 
     def cost(self, state_error=None, u=None):
         """Computes and returns the cost based on the state and control input.
@@ -141,16 +184,19 @@ class CartPole():
         u: torch.Tensor, optional. Defaults to the current control input.
         """
         if state_error is None:
-            state_error = torch.stack([self.x - self.x_ref, self.x_dot, self.theta, self.theta_dot], dim=-1)
+            state_error = self.state_error()
         if u is None:
             u = self.u
         return bqf(state_error, self.Q) + bqf(u, self.R)
 
-    def reward(self):
-        """Computes and returns the reward based on the cost and episode termination status."""
-        cost = self.cost()
+    def reward_terms(self, state_error, u, is_done):
+        """Computes the weighted reward terms for the given state errors, control inputs and done flags, as a pure function of tensors.
+
+        Returns a dict with the total reward 'rew_total', its weighted terms 'rew_main', 'rew_done', 'rew_steady', and the cost including the penalty for failure 'actual_costs'.
+        """
+        cost = self.cost(state_error, u)
         rew_main = -cost
-        rew_done = -1.0 * (self.is_done == 1)
+        rew_done = -1.0 * (is_done == 1)
 
         # Reward shaping for address steady-state error: c1 * exp(-c2 * (cost - c3))
         c1 = self.reward_shaping_parameters.get("steady_c1", 10.)
@@ -164,16 +210,27 @@ class CartPole():
 
         rew_total = coef_main * rew_main + coef_done * rew_done + coef_steady * rew_steady
 
-        self.info_dict["actual_costs"] = cost + coef_done * (self.is_done == 1)
+        return {
+            "rew_total": rew_total,
+            "rew_main": coef_main * rew_main,
+            "rew_done": coef_done * rew_done,
+            "rew_steady": coef_steady * rew_steady,
+            "actual_costs": cost + coef_done * (is_done == 1),
+        }
+
+    def reward(self, terms=None):
+        """Computes and returns the reward based on the cost and episode termination status.
+
+        terms : dict, optional. Output of reward_terms for the current state, if already computed (by the step function).
+        """
+        if terms is None:
+            terms = self.reward_terms(self.state_error(), self.u, self.is_done)
+        self.info_dict["actual_costs"] = terms["actual_costs"]
 
         if not self.quiet:
-            avg_rew_main = coef_main * rew_main.mean().item()
-            avg_rew_done = coef_done * rew_done.mean().item()
-            avg_rew_steady = coef_steady * rew_steady.mean().item()
-            avg_rew_total = rew_total.mean().item()
-            ic(avg_rew_main, avg_rew_done, avg_rew_steady, avg_rew_total)
+            self.reward_metrics.add(rew_main=terms["rew_main"], rew_done=terms["rew_done"], rew_steady=terms["rew_steady"], rew_total=terms["rew_total"])
 
-        return rew_total
+        return terms["rew_total"]
 
     def done(self):
         """Returns whether the episode has terminated."""
@@ -182,6 +239,8 @@ class CartPole():
     def info(self):
         """Returns additional information about the environment."""
         self.info_dict["already_on_stats"] = self.already_on_stats
+        self.info_dict["is_done"] = self.is_done
+        self.info_dict["reward_metrics"] = self.reward_metrics
         return self.info_dict
 
     def get_number_of_agents(self):
@@ -224,9 +283,9 @@ class CartPole():
             Boolean tensor of shape (bs,) specifying which environments need to be reset.
             If None, it will use the current 'is_done' status.
         x : torch.Tensor, optional
-            Initial position for the cart in reset environments. If None, it is randomly generated.
+            Initial position for the cart in reset environments, broadcastable to (bs,). If None, it is randomly generated.
         x_ref : torch.Tensor, optional
-            Reference position for the cart in reset environments. If None, it is randomly generated.
+            Reference position for the cart in reset environments, broadcastable to (bs,). If None, it is randomly generated.
         randomize_seed : int, optional
             Seed for random number generation if parameters like mass and length need to be randomized.
 
@@ -236,40 +295,38 @@ class CartPole():
         angular velocity (theta_dot), and other episode-specific counters and flags.
         - If randomize_seed is not None, the function will randomize the mass of the pole, cart, and the length of the pole.
         - Resets the cumulative cost and step count for environments that need resetting.
+        - Every call consumes the same number of draws from each generator, so the random sequence only depends on the seed.
         """
         is_done = self.is_done.bool() if need_reset is None else need_reset.bool()
-        size = is_done.sum().item()
-        self.step_count[is_done] = 0
-        self.cumulative_cost[is_done] = 0.
-        self.x_ref[is_done] = self.generate_ref(size) if x_ref is None else x_ref
+        where = lambda new, old: torch.where(is_done, new, old)
+        self.step_count.masked_fill_(is_done, 0)
+        self.cumulative_cost.masked_fill_(is_done, 0.)
+        # Candidates are drawn for the full batch and blended in, so that the reset has static shapes and does not synchronize with the host
+        x_ref = self.generate_ref(self.bs) if x_ref is None else x_ref.expand((self.bs,))
         if x is None:
-            x, x_dot, theta, theta_dot = self.generate_initial(size)
+            x, x_dot, theta, theta_dot = self.generate_initial(self.bs)
         else:
-            x_dot = torch.zeros((size,), device=self.device)
-            theta = torch.zeros((size,), device=self.device)
-            theta_dot = torch.zeros((size,), device=self.device)
-        self.initial_state[is_done, 0] = x
-        self.initial_state[is_done, 1] = x_dot
-        self.initial_state[is_done, 2] = theta
-        self.initial_state[is_done, 3] = theta_dot
-        self.x[is_done] = x
-        self.x_dot[is_done] = x_dot
+            x = x.expand((self.bs,))
+            x_dot = torch.zeros((self.bs,), device=self.device)
+            theta = torch.zeros((self.bs,), device=self.device)
+            theta_dot = torch.zeros((self.bs,), device=self.device)
         # Initialize theta with a small perturbation from 0 (upright position)
-        self.theta[is_done] = theta
-        self.theta_dot[is_done] = theta_dot
-        self.is_done[is_done] = 0
+        candidate = torch.stack([x, x_dot, theta, theta_dot, x_ref], dim=-1)
+        self.initial_state = torch.where(is_done.unsqueeze(-1), candidate[:, :4], self.initial_state)
+        self.state.copy_(torch.where(is_done.unsqueeze(-1), candidate, self.state))
+        self.is_done.masked_fill_(is_done, 0)
         if randomize_seed is not None:
             # Seed for randomization of dynamics is specified in function call; use it directly
             with torch.random.fork_rng():
                 torch.manual_seed(randomize_seed)
-                self.m_pole[is_done] = self.m_pole_min + (self.m_pole_max - self.m_pole_min) * torch.rand((size,), device=self.device)
-                self.m_cart[is_done] = self.m_cart_min + (self.m_cart_max - self.m_cart_min) * torch.rand((size,), device=self.device)
-                self.l[is_done] = self.l_min + (self.l_max - self.l_min) * torch.rand((size,), device=self.device)
+                self.m_pole = where(self.m_pole_min + (self.m_pole_max - self.m_pole_min) * torch.rand((self.bs,), device=self.device), self.m_pole)
+                self.m_cart = where(self.m_cart_min + (self.m_cart_max - self.m_cart_min) * torch.rand((self.bs,), device=self.device), self.m_cart)
+                self.l = where(self.l_min + (self.l_max - self.l_min) * torch.rand((self.bs,), device=self.device), self.l)
         else:
             # No seed specified; use predefined random number generator for randomization of dynamics
-            self.m_pole[is_done] = self.m_pole_min + (self.m_pole_max - self.m_pole_min) * torch.rand((size,), device=self.device, generator=self.rng_dynamics)
-            self.m_cart[is_done] = self.m_cart_min + (self.m_cart_max - self.m_cart_min) * torch.rand((size,), device=self.device, generator=self.rng_dynamics)
-            self.l[is_done] = self.l_min + (self.l_max - self.l_min) * torch.rand((size,), device=self.device, generator=self.rng_dynamics)
+            self.m_pole = where(self.m_pole_min + (self.m_pole_max - self.m_pole_min) * torch.rand((self.bs,), device=self.device, generator=self.rng_dynamics), self.m_pole)
+            self.m_cart = where(self.m_cart_min + (self.m_cart_max - self.m_cart_min) * torch.rand((self.bs,), device=self.device, generator=self.rng_dynamics), self.m_cart)
+            self.l = where(self.l_min + (self.l_max - self.l_min) * torch.rand((self.bs,), device=self.device, generator=self.rng_dynamics), self.l)
 
 
     def reset(self, x=None, x_ref=None, randomize_seed=None):
@@ -279,22 +336,35 @@ class CartPole():
         self.reset_done_envs(need_reset=need_reset, x=x, x_ref=x_ref, randomize_seed=randomize_seed)
         return self.obs()
 
-    def check_constraints(self):
-        """Checks and returns whether the state constraints are violated."""
-        return (self.x >= self.x_min) & (self.x <= self.x_max) & (self.theta >= self.theta_min) & (self.theta <= self.theta_max)
-
-    def write_episode_stats(self, i):
-        """Writes statistics for the i-th episode."""
-        self.already_on_stats[i] = 1
-        initial_state = self.initial_state[i, :].cpu().numpy()
-        x_ref = self.x_ref[i].item()
-        episode_length = self.step_count[i].item()
-        cumulative_cost = self.cumulative_cost[i].item()
-        constraint_violated = (self.is_done[i] == 1).item()
-        self.stats.loc[len(self.stats)] = [initial_state, x_ref, episode_length, cumulative_cost, constraint_violated]
+    def check_constraints(self, x=None, theta=None):
+        """Checks and returns whether the state constraints are satisfied, for the given (by default, the current) cart position and pole angle."""
+        if x is None:
+            x = self.x
+        if theta is None:
+            theta = self.theta
+        return (x >= self.x_min) & (x <= self.x_max) & (theta >= self.theta_min) & (theta <= self.theta_max)
+
+    def write_episode_stats(self, mask):
+        """Writes statistics for the episodes of the instances selected by the boolean tensor mask."""
+        self.already_on_stats |= mask
+        self.stats_buffer.record(
+            mask,
+            initial_state=self.initial_state,
+            x_ref=self.x_ref,
+            episode_length=self.step_count,
+            cumulative_cost=self.cumulative_cost,
+            constraint_violated=self.is_done == 1,
+        )
+
+    @property
+    def stats(self):
+        """Statistics of the written episodes as a DataFrame, one row per instance ordered by index."""
+        if self.stats_buffer is None:
+            return pd.DataFrame(columns=['i', 'initial_state', 'x_ref', 'episode_length', 'cumulative_cost', 'constraint_violated'])
+        return self.stats_buffer.to_dataframe(self.already_on_stats.bool())
 
     def dump_stats(self, filename=None):
-        """Dumps statistics to a CSV file."""
+        """Dumps statistics to a CSV file (or a Parquet file, if filename ends with .parquet)."""
         if filename is None:
             directory = "test_results"
             if not os.path.exists(directory):
@@ -302,57 +372,52 @@ class CartPole():
             timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
             tag = self.run_name
             filename = os.path.join(directory, f"{tag}_{timestamp}.csv")
-        self.stats.to_csv(filename, index=False)
+        write_stats_file(self.stats, filename)
 
-    def step(self, u):
-        """Takes a step in the environment with control input u and returns the new observation, reward, done flag, and info."""
-        self.reset_done_envs()
+    def step_tensors(self, state, u, noise, m_cart, m_pole, l, step_count, cumulative_cost, is_done):
+        """Elementwise part of step (input clamping, cost, dynamics, termination and reward) as a pure function of tensors, with the standard normal noise on the accelerations drawn by the caller.
+        This is the function compiled with torch.compile when compile_step is set; random draws, resets and statistics stay outside of it.
+
+        state : torch.Tensor. State buffer (bs, 5) before the step.
+
+        Returns the state (x, x_dot, theta, theta_dot) as a (bs, 4) tensor, control input, step count, cumulative cost and done flags after the step, and the reward terms (see reward_terms).
+        """
         u = torch.clamp(u, self.u_min, self.u_max)
-        self.u = u
-        self.cumulative_cost += self.cost()
-        self.step_count += 1
-
-        # Construct batch of matrices, each being [m_cart + m_pole, m_pole * l * cos(theta); m_pole * L * cos(theta), m_pole * l ^ 2]
-        lhs_mat = torch.stack([
-            torch.stack([self.m_cart + self.m_pole, self.m_pole * self.l * torch.cos(self.theta)], dim=-1),
-            torch.stack([self.m_pole * self.l * torch.cos(self.theta), self.m_pole * self.l ** 2], dim=-1),
-        ], dim=-2)
-        # Construct batch of vectors, each being [u + m_pole * l * theta_dot ^ 2 * sin(theta); m_pole * g * l * sin(theta)]
-        u_scalar = self.u.squeeze(-1)   # Remove singleton dimension for control input
-        rhs_vec = torch.stack([
-            u_scalar + self.m_pole * self.l * self.theta_dot ** 2 * torch.sin(self.theta),
-            self.m_pole * 9.8 * self.l * torch.sin(self.theta),
-        ], dim=-1)
-        # Solve for [x_ddot; theta_ddot]
-        acc = bsolve(lhs_mat, rhs_vec)
-        # Add noise to acceleration
-        acc += self.noise_std * torch.randn(acc.shape, device=self.device, generator=self.rng_process)
-        x_ddot = acc[..., 0]
-        theta_ddot = acc[..., 1]
-
-        # Update states
-        self.x += self.x_dot * self.dt
-        self.theta += self.theta_dot * self.dt
-        # Wrap to [-pi, pi]
-        self.theta = (self.theta + np.pi) % (2 * np.pi) - np.pi
-        self.x_dot += x_ddot * self.dt
-        self.theta_dot += theta_ddot * self.dt
+        cumulative_cost = cumulative_cost + self.cost(self.state_error(state), u)
+        step_count = step_count + 1
+
+        # Integrate, with the noise as a disturbance on the accelerations
+        next_state = cartpole_integrate(
+            state[:, :4], u.squeeze(-1), self.noise_std * noise, m_cart, m_pole, l, self.dt,
+            integrator=self.integrator, substeps=self.substeps,
+        )
 
         # Check constraints
-        self.is_done[self.check_constraints() == False] = 1   # 1 for failure
-        self.is_done[self.step_count >= self.max_steps] = 2   # 2 for timeout
+        is_done = is_done.masked_fill(torch.logical_not(self.check_constraints(next_state[:, 0], next_state[:, 2])), 1)   # 1 for failure
+        is_done = is_done.masked_fill(step_count >= self.max_steps, 2)   # 2 for timeout
+
+        terms = self.reward_terms(next_state - state[:, 4:] * self.ref_selector, u, is_done)
+        return next_state, u, step_count, cumulative_cost, is_done, terms
+
+    def step(self, u):
+        """Takes a step in the environment with control input u and returns the new observation, reward, done flag, and info."""
+        self.reset_done_envs()
+        noise = torch.randn((self.bs, 2), device=self.device, generator=self.rng_process)
+        next_state, self.u, self.step_count, self.cumulative_cost, self.is_done, terms = self.step_function(
+            self.state, u, noise, self.m_cart, self.m_pole, self.l, self.step_count, self.cumulative_cost, self.is_done
+        )
+        # The state is updated in place, so observations and named views stay valid
+        self.state[:, :4] = next_state
 
         # Write episode stats
         if self.keep_stats:
-            done_indices = torch.nonzero(self.is_done.to(dtype=torch.bool) & torch.logical_not(self.already_on_stats), as_tuple=False)
-            for i in done_indices:
-                self.write_episode_stats(i)
+            self.write_episode_stats(self.is_done.bool() & torch.logical_not(self.already_on_stats))
 
         # Return observation, reward, done, info
-        return self.obs(), self.reward(), self.done(), self.info()
+        return self.obs(), self.reward(terms), self.done(), self.info()
 
     def render(self, **kwargs):
         """Renders the environment. Currently, it just prints out state variables and average cost."""
-        ic(self.x, self.x_ref, self.xdot, self.theta, self.theta_dot)
+        ic(self.x, self.x_ref, self.x_dot, self.theta, self.theta_dot)
         avg_cost = (self.cumulative_cost / self.step_count).cpu().numpy()
         ic(avg_cost)
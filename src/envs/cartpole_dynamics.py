@@ -0,0 +1,78 @@
+import numpy as np
+import torch
+
+
+GRAVITY = 9.8
+
+INTEGRATORS = ["euler", "semi_implicit_euler", "rk4"]
+
+
+def cartpole_accelerations(theta, theta_dot, u, m_cart, m_pole, l):
+    """
+    Accelerations of the cart-pole, solving the 2x2 equations of motion
+        [m_cart + m_pole, m_pole * l * cos(theta); m_pole * l * cos(theta), m_pole * l ^ 2] [x_ddot; theta_ddot] = [u + m_pole * l * theta_dot ^ 2 * sin(theta); m_pole * g * l * sin(theta)]
+    in closed form (explicit inverse of the 2x2 matrix), without materializing the batch of matrices.
+
+    theta, theta_dot, u, m_cart, m_pole, l: Tensors of shape (bs,)
+
+    Returns: x_ddot, theta_ddot, each of shape (bs,)
+    """
+    sin_theta = torch.sin(theta)
+    cos_theta = torch.cos(theta)
+    m11 = m_cart + m_pole
+    m12 = m_pole * l * cos_theta
+    m22 = m_pole * l ** 2
+    r1 = u + m_pole * l * theta_dot ** 2 * sin_theta
+    r2 = m_pole * GRAVITY * l * sin_theta
+    det = m11 * m22 - m12 ** 2
+    x_ddot = (m22 * r1 - m12 * r2) / det
+    theta_ddot = (m11 * r2 - m12 * r1) / det
+    return x_ddot, theta_ddot
+
+
+def cartpole_derivative(state, u, disturbance, m_cart, m_pole, l):
+    """
+    Time derivative of the state (x, x_dot, theta, theta_dot).
+
+    state: (bs, 4)
+    u: Force on the cart (bs,)
+    disturbance: Additive disturbance on the accelerations (x_ddot, theta_ddot), held constant over the step (bs, 2)
+    m_cart, m_pole, l: Parameters of each instance (bs,)
+
+    Returns: (bs, 4)
+    """
+    x_ddot, theta_ddot = cartpole_accelerations(state[:, 2], state[:, 3], u, m_cart, m_pole, l)
+    return torch.stack([state[:, 1], state[:, 3], x_ddot + disturbance[:, 0], theta_ddot + disturbance[:, 1]], dim=-1)
+
+
+def cartpole_integrate(state, u, disturbance, m_cart, m_pole, l, dt, integrator="euler", substeps=1):
+    """
+    Integrate the cart-pole over one step of length dt, split into substeps of equal length with the input and disturbance held constant.
+
+    integrator:
+        "euler": explicit Euler, positions and velocities updated from the values at the start of the substep;
+        "semi_implicit_euler": velocities updated first, and positions updated with the new velocities;
+        "rk4": classical 4th-order Runge-Kutta.
+    Other parameters: See cartpole_derivative.
+
+    Returns: State after the step (bs, 4), with theta wrapped to [-pi, pi]
+    """
+    assert integrator in INTEGRATORS, f"Unknown integrator {integrator}"
+    f = lambda s: cartpole_derivative(s, u, disturbance, m_cart, m_pole, l)
+    h = dt / substeps
+    for _ in range(substeps):
+        if integrator == "euler":
+            state = state + h * f(state)
+        elif integrator == "semi_implicit_euler":
+            velocity = state[:, [1, 3]] + h * f(state)[:, 2:]
+            position = state[:, [0, 2]] + h * velocity
+            state = torch.stack([position[:, 0], velocity[:, 0], position[:, 1], velocity[:, 1]], dim=-1)
+        else:
+            k1 = f(state)
+            k2 = f(state + 0.5 * h * k1)
+            k3 = f(state + 0.5 * h * k2)
+            k4 = f(state + h * k3)
+            state = state + h / 6. * (k1 + 2. * k2 + 2. * k3 + k4)
+    # Wrap to [-pi, pi]; the dynamics are periodic in theta, so wrapping once per step is enough
+    theta = (state[:, 2] + np.pi) % (2 * np.pi) - np.pi
+    return torch.cat([state[:, :2], theta.unsqueeze(-1), state[:, 3:]], dim=-1)
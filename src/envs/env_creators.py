@@ -2,6 +2,7 @@ import numpy as np
 import torch
 from .linear_system import LinearSystem
 from .cartpole import CartPole
+from .parametric_dynamics import ParametricRandomizer
 
 sys_param = {
     "double_integrator": {
@@ -79,33 +80,40 @@ def tank_ref_generator(size, device, rng):
     x_ref = 20. * torch.rand((size, 4), generator=rng, device=device)
     return x_ref
 
-def tank_randomizer(size, device, rng):
+def tank_parameter_sampler(size, device, rng):
     """
-    Generate \Delta A, \Delta B for the tank environment.
+    Generate the parameters of the randomized tank dynamics (see tank_randomizer).
     """
-    Delta_A11 = 0.002 * (2. * torch.rand((size,), generator=rng, device=device) - 1.)   # Leakage of tank 1
-    Delta_A22 = 0.002 * (2. * torch.rand((size,), generator=rng, device=device) - 1.)   # Leakage of tank 2
-    Delta_A13 = 0.002 * (2. * torch.rand((size,), generator=rng, device=device) - 1.)   # Leakage from tank 3 to tank 1
-    Delta_A33 = -Delta_A13  # Conservation of tank 3
-    Delta_A24 = 0.002 * (2. * torch.rand((size,), generator=rng, device=device) - 1.)   # Leakage from tank 4 to tank 2
-    Delta_A44 = -Delta_A24  # Conservation of tank 4
-    zeros = torch.zeros((size,), device=device)   # Other elements are not perturbed
-    # A = [A11 0 A13 0; 0 A22 0 A24; 0 0 A33 0; 0 0 0 A44]
-    Delta_A = torch.stack([
-        torch.stack([Delta_A11, zeros, Delta_A13, zeros], dim=1),
-        torch.stack([zeros, Delta_A22, zeros, Delta_A24], dim=1),
-        torch.stack([zeros, zeros, Delta_A33, zeros], dim=1),
-        torch.stack([zeros, zeros, zeros, Delta_A44], dim=1)
+    uniform = lambda: 2. * torch.rand((size,), generator=rng, device=device) - 1.
+    A_params = 0.002 * torch.stack([
+        uniform(),   # Leakage of tank 1
+        uniform(),   # Leakage of tank 2
+        uniform(),   # Leakage from tank 3 to tank 1
+        uniform(),   # Leakage from tank 4 to tank 2
     ], dim=1)
+    B_params = 0.02 * torch.stack([
+        uniform(),   # Voltage perturbation on pump 1
+        uniform(),   # Voltage perturbation on pump 2
+    ], dim=1)
+    return A_params, B_params
 
-    multiplier_B1 = 0.02 * (2. * torch.rand((size,), generator=rng, device=device) - 1.)   # Voltage perturbation on pump 1
-    multiplier_B2 = 0.02 * (2. * torch.rand((size,), generator=rng, device=device) - 1.)   # Voltage perturbation on pump 2
-    B = torch.tensor(sys_param["tank"]["B"], device=device, dtype=torch.float).unsqueeze(0)
-    Delta_B1 = multiplier_B1.unsqueeze(-1) * B[:, :, 0]
-    Delta_B2 = multiplier_B2.unsqueeze(-1) * B[:, :, 1]
-    Delta_B = torch.stack([Delta_B1, Delta_B2], dim=2)
+def _tank_randomizer_basis():
+    """
+    Basis of \Delta A, \Delta B for the tank environment.
+    \Delta A = [dA11 0 dA13 0; 0 dA22 0 dA24; 0 0 -dA13 0; 0 0 0 -dA24], where the outflow of tanks 3 and 4 is conserved;
+    \Delta B scales each column of B (pump voltage).
+    """
+    A_basis = np.zeros((4, 4, 4))
+    A_basis[0, 0, 0] = 1.
+    A_basis[1, 1, 1] = 1.
+    A_basis[2, 0, 2], A_basis[2, 2, 2] = 1., -1.
+    A_basis[3, 1, 3], A_basis[3, 3, 3] = 1., -1.
+    B_basis = np.zeros((2, 4, 2))
+    B_basis[0, :, 0] = sys_param["tank"]["B"][:, 0]
+    B_basis[1, :, 1] = sys_param["tank"]["B"][:, 1]
+    return A_basis, B_basis
 
-    return Delta_A, Delta_B
+tank_randomizer = ParametricRandomizer(*_tank_randomizer_basis(), tank_parameter_sampler)
 
 
 env_creators = {
@@ -165,5 +173,11 @@ env_creators = {
         keep_stats=kwargs["keep_stats"],
         run_name=kwargs["run_name"],
         exp_name=kwargs["exp_name"],
+        device=kwargs.get("device", "cuda:0"),
+        random_seed=kwargs.get("random_seed", None),
+        quiet=kwargs.get("quiet", False),
+        compile_step=kwargs.get("compile_step", False),
+        integrator=kwargs.get("integrator", "euler"),
+        substeps=kwargs.get("integrator_substeps", 1),
     ),
 }
@@ -7,6 +7,8 @@ import pandas as pd
 import os
 from datetime import datetime
 from ..utils.torch_utils import bmv, bqf, bsolve, conditional_fork_rng, get_rng
+from ..utils.episode_stats import EpisodeStatsBuffer, write_stats_file
+from ..utils.env_metrics import RunningMetrics
 from icecream import ic
 
 
@@ -27,14 +29,15 @@ class LinearSystem():
         initial_generator=None,
         ref_generator=None,
         randomizer=None,
+        compile_step=False,
         **kwargs
     ):
         """
         Initializes the LinearSystem environment with given parameters.
 
         Parameters:
-            A (ndarray): System dynamics matrix. Perturbed by randomizer if specified.
-            B (ndarray): Input matrix. Perturbed by randomizer if specified.
+            A (ndarray): Nominal system dynamics matrix. Perturbed by randomizer if specified.
+            B (ndarray): Nominal input matrix. Perturbed by randomizer if specified.
             Q (ndarray): State cost matrix.
             R (ndarray): Control input cost matrix.
             sqrt_W (ndarray): Square root of the process noise covariance matrix.
@@ -57,7 +60,8 @@ class LinearSystem():
             run_name (str, optional): Name tag for the run, useful for logging.
             initial_generator (function, optional): Function that generates initial states.
             ref_generator (function, optional): Function that generates reference states.
-            randomizer (function, optional): Function that randomizes the system dynamics (returns \Delta A, \Delta B).
+            randomizer (ParametricRandomizer, optional): Randomization of the system dynamics, with parameters drawn per instance at reset.
+            compile_step (bool, optional): Compile the elementwise part of step (step_tensors) with torch.compile, with static shapes.
         """
         # Random seed and random number generators for different components
         if random_seed is not None:
@@ -85,10 +89,9 @@ class LinearSystem():
         self.B0 = self.B
         self.randomizer = randomizer
         self.reward_shaping_parameters = reward_shaping_parameters
-        if randomizer is not None:
-            # Copy the nominal A, B, and repeat A, B along the batch dimension to allow randomization later
-            self.A = self.A.repeat(bs, 1, 1)
-            self.B = self.B.repeat(bs, 1, 1)
+        # Parameters of the randomized dynamics of each instance (none without randomizer); A and B stay the nominal matrices
+        self.A_params = torch.zeros((bs, randomizer.num_A_params if randomizer is not None else 0), device=device)
+        self.B_params = torch.zeros((bs, randomizer.num_B_params if randomizer is not None else 0), device=device)
         self.sqrt_W = t(sqrt_W)
         self.x_min = t(x_min)
         self.x_max = t(x_max)
@@ -117,8 +120,18 @@ class LinearSystem():
         self.run_name = run_name
         self.keep_stats = keep_stats
         self.already_on_stats = torch.zeros((bs,), dtype=torch.uint8, device=device)   # Each worker can only contribute once to the statistics, to avoid bias towards shorter episodes
-        self.stats = pd.DataFrame(columns=['i', 'x0', 'x_ref', 'A', 'B', 'w0', 'episode_length', 'cumulative_cost', 'constraint_violated'])
+        self.stats_buffer = EpisodeStatsBuffer(bs, {
+            'x0': ((self.n,), torch.float),
+            'x_ref': ((self.n,), torch.float),
+            'A_params': ((self.A_params.shape[1],), torch.float),
+            'B_params': ((self.B_params.shape[1],), torch.float),
+            'w0': ((self.n,), torch.float),
+            'episode_length': ((), torch.long),
+            'cumulative_cost': ((), torch.float),
+            'constraint_violated': ((), torch.bool),
+        }, device) if keep_stats else None
         self.quiet = quiet
+        self.reward_metrics = RunningMetrics(device)   # Reward terms averaged over steps, logged by RLGPUAlgoObserver unless quiet
 
         if skip_to_steady_state:
             self.max_steps = 1
@@ -130,6 +143,7 @@ class LinearSystem():
 
         self.initial_generator = initial_generator
         self.ref_generator = ref_generator
+        self.step_function = torch.compile(self.step_tensors, dynamic=False) if compile_step else self.step_tensors
 
     def obs(self):
         """
@@ -146,14 +160,16 @@ class LinearSystem():
         """
         return bqf(x, self.Q) + bqf(u, self.R)
 
-    def reward(self):
+    def reward_terms(self, x, x_ref, u, is_done):
         """
-        Computes the reward based on the current state, control input, and various coefficients.
+        Computes the weighted reward terms for the given states, references, control inputs and done flags, as a pure function of tensors.
+
+        Returns a dict with the total reward 'rew_total', its weighted terms 'rew_main', 'rew_steady', 'rew_done', and the cost including the penalty for failure 'actual_costs'.
         """
-        cost = self.cost(self.x - self.x_ref, self.u)
+        cost = self.cost(x - x_ref, u)
         rew_main = -cost
-        rew_state_bar = torch.sum(torch.log(((self.x_max - self.x) / self.barrier_thresh).clamp(1e-8, 1.)) + torch.log(((self.x - self.x_min) / self.barrier_thresh).clamp(1e-8, 1.)), dim=-1)
-        rew_done = -1.0 * (self.is_done == 1)
+        rew_state_bar = torch.sum(torch.log(((self.x_max - x) / self.barrier_thresh).clamp(1e-8, 1.)) + torch.log(((x - self.x_min) / self.barrier_thresh).clamp(1e-8, 1.)), dim=-1)
+        rew_done = -1.0 * (is_done == 1)
 
         # Reward shaping for address steady-state error: c1 * exp(-c2 * (cost - c3))
         c1 = self.reward_shaping_parameters.get("steady_c1", 0.)
@@ -169,12 +185,27 @@ class LinearSystem():
 
         rew_total = coef_const + coef_main * rew_main + coef_steady * rew_steady + coef_bar * rew_state_bar + coef_done * rew_done
 
-        self.info_dict["actual_costs"] = cost + coef_done * (self.is_done == 1)
+        return {
+            "rew_total": rew_total,
+            "rew_main": coef_main * rew_main,
+            "rew_steady": coef_steady * rew_steady,
+            "rew_done": coef_done * rew_done,
+            "actual_costs": cost + coef_done * (is_done == 1),
+        }
+
+    def reward(self, terms=None):
+        """
+        Computes the reward based on the current state, control input, and various coefficients.
+
+        terms: Output of reward_terms for the current state, if already computed (by the step function)
+        """
+        if terms is None:
+            terms = self.reward_terms(self.x, self.x_ref, self.u, self.is_done)
+        self.info_dict["actual_costs"] = terms["actual_costs"]
 
         if not self.quiet:
-            avg_rew_main, avg_rew_state_bar, avg_rew_done, avg_rew_steady, avg_rew_total = coef_main * rew_main.mean().item(), coef_bar * rew_state_bar.mean().item(), coef_done * rew_done.mean().item(), rew_steady.mean().item(), rew_total.mean().item()
-            ic(avg_rew_main, avg_rew_done, avg_rew_steady, avg_rew_total)
-        return rew_total
+            self.reward_metrics.add(rew_main=terms["rew_main"], rew_done=terms["rew_done"], rew_steady=terms["rew_steady"], rew_total=terms["rew_total"])
+        return terms["rew_total"]
 
     def done(self):
         """
@@ -187,6 +218,8 @@ class LinearSystem():
         Returns additional information.
         """
         self.info_dict["already_on_stats"] = self.already_on_stats
+        self.info_dict["is_done"] = self.is_done
+        self.info_dict["reward_metrics"] = self.reward_metrics
         return self.info_dict
 
     def get_number_of_agents(self):
@@ -232,44 +265,47 @@ class LinearSystem():
         """
         Resets the environments that are marked as 'done', reinitializing their states and references.
 
+        Candidate initial states, references and (if randomized) system matrices are drawn for the full batch and blended in with torch.where,
+        so that the reset has static shapes and does not synchronize with the host, regardless of how many environments are done.
+
         Parameters:
         - need_reset (torch.Tensor, optional): A boolean tensor indicating which environments need to be reset.
                                             If None, the function will automatically determine this based on self.is_done.
-        - x (torch.Tensor, optional): Initial state tensor for the environments that need to be reset.
+        - x (torch.Tensor, optional): Initial state tensor for the environments that need to be reset, broadcastable to (bs, n).
                                     If None, random initial states are generated within defined bounds.
-        - x_ref (torch.Tensor, optional): Reference state tensor for the environments that need to be reset.
+        - x_ref (torch.Tensor, optional): Reference state tensor for the environments that need to be reset, broadcastable to (bs, n).
                                         If None, references are generated via self.generate_ref().
         - randomize_seed (int, optional): Seed for random number generation when randomizing system matrices A and B.
                                         If None, no seeding is applied.
 
         Side Effects:
-        - Modifies self.step_count, self.cum_cost, self.x_ref, self.x0, self.x, self.is_done, self.A, and self.B for the
+        - Modifies self.step_count, self.cum_cost, self.x_ref, self.x0, self.x, self.is_done, self.A_params, and self.B_params for the
         environments that are reset.
 
         Notes:
         - The function expects self.is_done, self.x_min, self.x_max, self.barrier_thresh, self.n, self.m, self.device,
         self.randomizer, self.A0, and self.B0 to be pre-defined.
-        - Utilizes the conditional_fork_rng context manager for conditional seeding.
-        """
-        is_done = self.is_done.bool() if need_reset is None else need_reset
-        size = torch.sum(is_done)
-        self.step_count[is_done] = 0
-        self.cum_cost[is_done] = 0
-        self.x_ref[is_done, :] = self.generate_ref(size) if x_ref is None else x_ref
-        self.x0[is_done, :] = self.generate_initial(size) if x is None else x
-        self.x[is_done, :] = self.x0[is_done, :]
-        self.is_done[is_done] = 0
+        - Every call consumes the same number of draws from each generator, so the random sequence only depends on the seed.
+        """
+        is_done = self.is_done.bool() if need_reset is None else need_reset.bool()
+        is_done_row = is_done.unsqueeze(-1)
+        self.step_count.masked_fill_(is_done, 0)
+        self.cum_cost.masked_fill_(is_done, 0.)
+        self.x_ref = torch.where(is_done_row, self.generate_ref(self.bs) if x_ref is None else x_ref, self.x_ref)
+        self.x0 = torch.where(is_done_row, self.generate_initial(self.bs) if x is None else x, self.x0)
+        self.x = torch.where(is_done_row, self.x0, self.x)
+        self.is_done.masked_fill_(is_done, 0)
         if self.randomizer is not None:
             if randomize_seed is not None:
                 # Seed for randomization of dynamics is specified in function call; use it directly
                 with torch.random.fork_rng():
                     torch.manual_seed(randomize_seed)
-                    Delta_A, Delta_B = self.randomizer(size, self.device, None)
+                    A_params, B_params = self.randomizer.sample(self.bs, self.device, None)
             else:
                 # No seed specified; use predefined random number generator for randomization of dynamics
-                Delta_A, Delta_B = self.randomizer(size, self.device, self.rng_dynamics)
-            self.A[is_done, :, :] = self.A0 + Delta_A
-            self.B[is_done, :, :] = self.B0 + Delta_B
+                A_params, B_params = self.randomizer.sample(self.bs, self.device, self.rng_dynamics)
+            self.A_params = torch.where(is_done_row, A_params, self.A_params)
+            self.B_params = torch.where(is_done_row, B_params, self.B_params)
 
 
     def reset(self, x=None, x_ref=None, randomize_seed=None):
@@ -279,35 +315,43 @@ class LinearSystem():
         self.reset_done_envs(torch.ones(self.bs, dtype=torch.bool, device=self.device), x, x_ref, randomize_seed)
         return self.obs()
 
-    def check_in_bound(self):
+    def check_in_bound(self, x=None):
         """
-        Checks whether the current state is within the predefined bounds.
+        Checks whether the state (by default, the current state) is within the predefined bounds.
         """
-        return ((self.x_min <= self.x) & (self.x <= self.x_max)).all(dim=-1)
+        if x is None:
+            x = self.x
+        return ((self.x_min <= x) & (x <= self.x_max)).all(dim=-1)
 
-    def write_episode_stats(self, i):
+    def write_episode_stats(self, mask):
         """
-        Logs statistics of the episode for the ith environment in the batch.
+        Logs statistics of the episodes of the environments selected by the boolean tensor mask.
         """
-        self.already_on_stats[i] = 1
-        x0 = self.x0[i, :].cpu().numpy()
-        x_ref = self.x_ref[i, :].cpu().numpy()
-
-        # Get the A and B matrices and flatten for the ith environment
-        index = 0 if self.randomizer is None else i
-        A = self.A[index, :, :].cpu().numpy().flatten()
-        B = self.B[index, :, :].cpu().numpy().flatten()
-
-        w0 = self.w0[i, :].cpu().numpy()
+        self.already_on_stats |= mask
+        self.stats_buffer.record(
+            mask,
+            x0=self.x0,
+            x_ref=self.x_ref,
+            A_params=self.A_params,
+            B_params=self.B_params,
+            w0=self.w0,
+            episode_length=self.step_count,
+            cumulative_cost=self.cum_cost,
+            constraint_violated=self.is_done == 1,
+        )
 
-        episode_length = self.step_count[i].item()
-        cumulative_cost = self.cum_cost[i].item()
-        constraint_violated = (self.is_done[i] == 1).item()
-        self.stats.loc[len(self.stats)] = [i.item(), x0, x_ref, A, B, w0, episode_length, cumulative_cost, constraint_violated]
+    @property
+    def stats(self):
+        """
+        Statistics of the logged episodes as a DataFrame, one row per environment ordered by index; the dynamics are identified by the parameters of the randomizer.
+        """
+        if self.stats_buffer is None:
+            return pd.DataFrame(columns=['i', 'x0', 'x_ref', 'A_params', 'B_params', 'w0', 'episode_length', 'cumulative_cost', 'constraint_violated'])
+        return self.stats_buffer.to_dataframe(self.already_on_stats.bool())
 
     def dump_stats(self, filename=None):
         """
-        Writes the accumulated statistics to a CSV file.
+        Writes the accumulated statistics to a CSV file (or a Parquet file, if filename ends with .parquet).
         """
         if filename is None:
             directory = 'test_results'
@@ -316,31 +360,50 @@ class LinearSystem():
             timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
             tag = self.run_name
             filename = os.path.join(directory, f"{tag}_{timestamp}.csv")
-        self.stats = self.stats.sort_values(by='i')
-        self.stats.to_csv(filename, index=False)
+        write_stats_file(self.stats, filename)
 
-    def step(self, u):
+    def dynamics(self, x, u, A_params, B_params):
         """
-        Executes one step in the environment based on the given control input.
+        Computes A x + B u for each environment, as the nominal products plus the structured perturbation of the randomizer (if any).
+        """
+        x_next = bmv(self.A0, x) + bmv(self.B0, u)
+        if self.randomizer is not None:
+            x_next = x_next + self.randomizer.delta_mv("A", A_params, x) + self.randomizer.delta_mv("B", B_params, u)
+        return x_next
+
+    def step_tensors(self, x, x_ref, u, noise, A_params, B_params, w0, step_count, cum_cost, is_done):
+        """
+        Elementwise part of step (input clamping, cost, dynamics, termination and reward) as a pure function of tensors, with the standard normal noise drawn by the caller.
+        This is the function compiled with torch.compile when compile_step is set; random draws, resets and statistics stay outside of it.
+
+        Returns the control input, state, first noise vector, step count, cumulative cost and done flags after the step, and the reward terms (see reward_terms).
         """
-        self.reset_done_envs()
         u = u.clamp(self.u_min, self.u_max)
-        self.u = u
-        self.cum_cost += self.cost(self.x - self.x_ref, u)
-        w = bmv(self.sqrt_W, torch.randn((self.bs, self.n), generator=self.rng_process, device=self.device))
-        self.w0[self.step_count == 0, :] = w[self.step_count == 0, :]
+        cum_cost = cum_cost + self.cost(x - x_ref, u)
+        w = bmv(self.sqrt_W, noise)
+        w0 = torch.where((step_count == 0).unsqueeze(-1), w, w0)
         if not self.skip_to_steady_state:
-            self.x = bmv(self.A, self.x) + bmv(self.B, u) + w
+            x = self.dynamics(x, u, A_params, B_params) + w
         else:
-            self.x = bsolve(torch.eye(self.n, device=self.device).unsqueeze(0) - self.A, bmv(self.B, u))
-        self.step_count += 1
-        self.is_done[self.step_count >= self.max_steps] = 2  # 2 for timeout
-        self.is_done[torch.logical_not(self.check_in_bound()).nonzero()] = 1   # 1 for failure
+            A, B = self.randomizer.matrices(self.A0, self.B0, A_params, B_params) if self.randomizer is not None else (self.A0, self.B0)
+            x = bsolve(torch.eye(self.n, device=x.device).unsqueeze(0) - A, bmv(B, u))
+        step_count = step_count + 1
+        is_done = is_done.masked_fill(step_count >= self.max_steps, 2)  # 2 for timeout
+        is_done = is_done.masked_fill(torch.logical_not(self.check_in_bound(x)), 1)   # 1 for failure
+        return u, x, w0, step_count, cum_cost, is_done, self.reward_terms(x, x_ref, u, is_done)
+
+    def step(self, u):
+        """
+        Executes one step in the environment based on the given control input.
+        """
+        self.reset_done_envs()
+        noise = torch.randn((self.bs, self.n), generator=self.rng_process, device=self.device)
+        self.u, self.x, self.w0, self.step_count, self.cum_cost, self.is_done, terms = self.step_function(
+            self.x, self.x_ref, u, noise, self.A_params, self.B_params, self.w0, self.step_count, self.cum_cost, self.is_done
+        )
         if self.keep_stats:
-            done_indices = torch.nonzero(self.is_done.to(dtype=torch.bool) & torch.logical_not(self.already_on_stats), as_tuple=False)
-            for i in done_indices:
-                self.write_episode_stats(i)
-        return self.obs(), self.reward(), self.done(), self.info()
+            self.write_episode_stats(self.is_done.bool() & torch.logical_not(self.already_on_stats))
+        return self.obs(), self.reward(terms), self.done(), self.info()
 
     def render(self, **kwargs):
         """
@@ -0,0 +1,68 @@
+import numpy as np
+import torch
+
+
+class ParametricRandomizer():
+    """
+    Randomization of the dynamics of a LinearSystem that is linear in a few parameters per instance:
+        A = A0 + sum_k p_k A_basis[k],  B = B0 + sum_k q_k B_basis[k].
+
+    Only the parameter vectors p, q are stored per instance, instead of dense copies of A and B.
+    The perturbations of A x and B u are computed from the nonzero entries of the basis matrices, so their cost scales with the number of perturbed entries rather than with the size of the matrices.
+    """
+    def __init__(self, A_basis, B_basis, sampler):
+        """
+        A_basis: Basis of the perturbation of A (K, n, n)
+        B_basis: Basis of the perturbation of B (J, n, m)
+        sampler: Function (size, device, rng) -> (p (size, K), q (size, J)) drawing the parameters of size instances
+        """
+        self.basis = {
+            "A": np.asarray(A_basis, dtype=np.float32),
+            "B": np.asarray(B_basis, dtype=np.float32),
+        }
+        self.num_A_params = self.basis["A"].shape[0]
+        self.num_B_params = self.basis["B"].shape[0]
+        self.sampler = sampler
+        self._entries = {}
+
+    def sample(self, size, device, rng):
+        """
+        Draw the parameters (p, q) of size instances.
+        """
+        return self.sampler(size, device, rng)
+
+    def entries(self, which, device):
+        """
+        Nonzero entries of the basis of A or B (which is "A" or "B") as tensors on device: parameter index, row, column, and value of each entry.
+        """
+        key = (which, str(device))
+        if key not in self._entries:
+            basis = self.basis[which]
+            k, i, j = np.nonzero(basis)
+            to_tensor = lambda a, dtype: torch.tensor(a, dtype=dtype, device=device)
+            self._entries[key] = (to_tensor(k, torch.long), to_tensor(i, torch.long), to_tensor(j, torch.long), to_tensor(basis[k, i, j], torch.float))
+        return self._entries[key]
+
+    def delta_mv(self, which, params, v):
+        """
+        Perturbation (sum_k params[:, k] * basis[k]) @ v of each instance.
+
+        which: "A" or "B"
+        params: Parameters of the instances (bs, K)
+        v: Vectors (bs, n) for A, or (bs, m) for B
+
+        Returns: (bs, n)
+        """
+        k, i, j, value = self.entries(which, v.device)
+        contribution = params[:, k] * value * v[:, j]
+        out = torch.zeros((v.shape[0], self.basis[which].shape[1]), dtype=v.dtype, device=v.device)
+        return out.index_add(1, i, contribution)
+
+    def matrices(self, A0, B0, A_params, B_params):
+        """
+        Dense matrices A (bs, n, n), B (bs, n, m) of each instance, from the nominal matrices A0 (1, n, n), B0 (1, n, m) and the parameters.
+        """
+        t = lambda a: torch.tensor(a, device=A_params.device)
+        A = A0 + torch.einsum("bk,kij->bij", A_params, t(self.basis["A"]))
+        B = B0 + torch.einsum("bk,kij->bij", B_params, t(self.basis["B"]))
+        return A, B
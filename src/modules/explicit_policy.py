@@ -0,0 +1,327 @@
+import torch
+from torch import nn
+import numpy as np
+from scipy.optimize import linprog
+from icecream import ic
+
+from .ip_solver import IPQPSolver
+from .qp_solver import one_sided_constraints
+
+
+def get_affine_qp(net):
+    """
+    Extract the parametric QP solved by a QPUnrolledNetwork as a function of its input (observation) theta:
+    minimize    (1/2)x'Px + (q0 + Wq theta)'x
+    subject to  Gx + g0 + Wg theta >= 0.
+
+    The learned QP requires shared_PH and affine_qb; the symmetric (and buffered) constraints are rewritten as one-sided ones.
+    If the network runs the (non-robust) MPC baseline, the QP of the MPC template is extracted instead.
+
+    Returns: (P, q0, Wq, G, g0, Wg) as float64 NumPy arrays
+    """
+    f = lambda t: t.detach().cpu().double().numpy()
+    with torch.no_grad():
+        # Observations 0, e_1, ..., e_{input_size}
+        obs = torch.cat([torch.zeros((1, net.input_size), device=net.device), torch.eye(net.input_size, device=net.device)], dim=0)
+        if net.mpc_baseline is not None:
+            assert net.mpc_baseline.get("robust_method", None) is None, "Robust MPC has no single QP template"
+            _, _, P, q, H, b = net.get_mpc_qp(obs)
+            P = f(P)
+        else:
+            assert net.shared_PH and net.affine_qb, "Requires shared_PH and affine_qb"
+            Pinv, H = net.get_PH()
+            P = np.linalg.inv(f(Pinv[0]))
+            q, b = net.get_qb(obs)
+            # Rewrite the constraint set of the projection in PDHG as Gx + g >= 0
+            H, b = one_sided_constraints(H[0], b, net.symmetric, net.force_feasible)
+    G, q, g = f(H), f(q), f(b)
+    q0, Wq = q[0], (q[1:] - q[0]).T
+    g0, Wg = g[0], (g[1:] - g[0]).T
+    return P, q0, Wq, G, g0, Wg
+
+
+def _chebyshev_ball(C, c, lo, hi, eq=None):
+    """
+    Largest ball inside {theta: C theta + c >= 0, lo <= theta <= hi}, optionally restricted to the hyperplane eq = (a, a0): a'theta + a0 = 0.
+
+    Returns: (center, radius), with radius = -inf if the set is empty
+    """
+    d = lo.shape[0]
+    norms = np.linalg.norm(C, axis=1)
+    # Variables (theta, radius); maximize radius
+    A_ub = np.concatenate([
+        np.concatenate([-C, norms[:, None]], axis=1),
+        np.concatenate([-np.eye(d), np.ones((d, 1))], axis=1),
+        np.concatenate([np.eye(d), np.ones((d, 1))], axis=1),
+    ], axis=0)
+    b_ub = np.concatenate([c, -lo, hi])
+    A_eq, b_eq = None, None
+    if eq is not None:
+        A_eq = np.concatenate([eq[0], [0.]])[None, :]
+        b_eq = np.array([-eq[1]])
+    cost = np.zeros(d + 1)
+    cost[-1] = -1.
+    res = linprog(cost, A_ub=A_ub, b_ub=b_ub, A_eq=A_eq, b_eq=b_eq, bounds=[(None, None)] * d + [(0, None)], method="highs")
+    if not res.success:
+        return None, -np.inf
+    return res.x[:d], res.x[-1]
+
+
+class ExplicitQPPolicy(nn.Module):
+    """
+    Explicit solution of a parametric QP: a piecewise-affine map x = K_r theta + k_r on critical regions {theta: C_r theta + c_r >= 0} covering a box of theta.
+
+    Regions are located with a binary space partition of the box by axis-aligned hyperplanes;
+    each leaf lists the (few) regions intersecting it, which are then tested directly.
+    Evaluation is vectorized over the batch, so evaluating millions of states is a sequence of gathers and small matmuls.
+    """
+    def __init__(self, region_C, region_c, region_K, region_k, tree, leaf_regions, obs_low, obs_high, active_sets=None, tol=1e-4):
+        """
+        region_C, region_c: Region inequalities, padded to (R, max_rows, d) and (R, max_rows); padding rows are 0 theta + 1 >= 0
+        region_K, region_k: Affine laws, (R, n, d) and (R, n)
+        tree: Dict of arrays of length T describing the BSP: "dim", "value", "left", "right" (-1 for leaves), "leaf_start", "leaf_count"
+        leaf_regions: Concatenated region indices of all leaves
+        obs_low, obs_high: Box covered by the regions
+        active_sets: Optional boolean array (R, num_constraints) of the active set of each region
+        tol: Tolerance of the region membership test; regions overlap by this margin so that points on shared facets are not lost to float32 rounding
+        """
+        super().__init__()
+        t = lambda a, dtype=torch.float: torch.as_tensor(np.asarray(a), dtype=dtype)
+        self.register_buffer("region_C", t(region_C))
+        self.register_buffer("region_c", t(region_c))
+        self.register_buffer("region_K", t(region_K))
+        self.register_buffer("region_k", t(region_k))
+        self.register_buffer("tree_dim", t(tree["dim"], torch.long))
+        self.register_buffer("tree_value", t(tree["value"]))
+        self.register_buffer("tree_left", t(tree["left"], torch.long))
+        self.register_buffer("tree_right", t(tree["right"], torch.long))
+        self.register_buffer("leaf_start", t(tree["leaf_start"], torch.long))
+        self.register_buffer("leaf_count", t(tree["leaf_count"], torch.long))
+        self.register_buffer("leaf_regions", t(leaf_regions, torch.long))
+        self.register_buffer("obs_low", t(obs_low))
+        self.register_buffer("obs_high", t(obs_high))
+        self.active_sets = active_sets
+        self.tol = tol
+        self.depth = int(tree["depth"])
+        self.max_leaf_count = int(np.max(tree["leaf_count"])) if len(tree["leaf_count"]) > 0 else 0
+
+    @property
+    def num_regions(self):
+        return self.region_K.shape[0]
+
+    def locate(self, obs):
+        """
+        Find the region containing each observation.
+
+        obs: (bs, d)
+
+        Returns: Region indices (bs,), -1 where the observation is outside the box or not covered by any region
+        """
+        bs = obs.shape[0]
+        node = torch.zeros((bs,), dtype=torch.long, device=obs.device)
+        for _ in range(self.depth):
+            is_leaf = self.tree_left[node] < 0
+            value = obs.gather(1, self.tree_dim[node].clamp(min=0).unsqueeze(1)).squeeze(1)
+            child = torch.where(value > self.tree_value[node], self.tree_right[node], self.tree_left[node])
+            node = torch.where(is_leaf, node, child)
+
+        region = torch.full((bs,), -1, dtype=torch.long, device=obs.device)
+        start, count = self.leaf_start[node], self.leaf_count[node]
+        for j in range(self.max_leaf_count):
+            candidate = self.leaf_regions[(start + j).clamp(max=self.leaf_regions.shape[0] - 1)]
+            lhs = (self.region_C[candidate] @ obs.unsqueeze(-1)).squeeze(-1) + self.region_c[candidate]
+            inside = (lhs >= -self.tol).all(dim=1)
+            region = torch.where((j < count) & (region < 0) & inside, candidate, region)
+
+        in_box = ((obs >= self.obs_low - self.tol) & (obs <= self.obs_high + self.tol)).all(dim=1)
+        return torch.where(in_box, region, torch.full_like(region, -1))
+
+    @torch.no_grad()
+    def forward(self, obs, chunk_size=65536):
+        """
+        obs: (bs, d)
+
+        Returns: Solutions (bs, n), NaN where not covered, and the region indices (bs,)
+        """
+        if self.num_regions == 0:
+            # Nothing is covered
+            sol = torch.full((obs.shape[0], self.region_K.shape[1]), float("nan"), device=obs.device)
+            return sol, torch.full((obs.shape[0],), -1, dtype=torch.long, device=obs.device)
+        sols, regions = [], []
+        for obs_chunk in obs.split(chunk_size):
+            region = self.locate(obs_chunk)
+            r = region.clamp(min=0)
+            sol = (self.region_K[r] @ obs_chunk.unsqueeze(-1)).squeeze(-1) + self.region_k[r]
+            sols.append(torch.where((region >= 0).unsqueeze(-1), sol, torch.full_like(sol, float("nan"))))
+            regions.append(region)
+        return torch.cat(sols), torch.cat(regions)
+
+
+def _critical_region(P_inv, q0, Wq, G, g0, Wg, active):
+    """
+    Affine law and region of an active set, from the KKT conditions Px + q = G_A' lambda_A, G_A x + g_A = 0.
+
+    Returns: (K, k, C, c) with x = K theta + k on {C theta + c >= 0}, or None if the active constraints are linearly dependent
+    """
+    inactive = ~active
+    if active.any():
+        G_A = G[active]
+        M = G_A @ P_inv @ G_A.T
+        if np.linalg.matrix_rank(M) < M.shape[0]:
+            return None
+        M_inv = np.linalg.inv(M)
+        L = M_inv @ (G_A @ P_inv @ Wq - Wg[active])
+        l = M_inv @ (G_A @ P_inv @ q0 - g0[active])
+        K = P_inv @ (G_A.T @ L - Wq)
+        k = P_inv @ (G_A.T @ l - q0)
+    else:
+        L, l = np.zeros((0, Wq.shape[1])), np.zeros((0,))
+        K, k = -P_inv @ Wq, -P_inv @ q0
+    # Dual feasibility of the active constraints and primal feasibility of the inactive ones
+    C = np.concatenate([L, G[inactive] @ K + Wg[inactive]], axis=0)
+    c = np.concatenate([l, G[inactive] @ k + g0[inactive]])
+    return K, k, C, c
+
+
+def _build_bsp(bboxes, lo, hi, leaf_size, max_depth):
+    """Axis-aligned BSP of the box [lo, hi]; each leaf lists the regions whose bounding boxes intersect it."""
+    tree = {key: [] for key in ["dim", "value", "left", "right", "leaf_start", "leaf_count"]}
+    leaf_regions = []
+    depth_reached = 0
+
+    def build(cell_lo, cell_hi, candidates, depth):
+        nonlocal depth_reached
+        depth_reached = max(depth_reached, depth)
+        node = len(tree["dim"])
+        for key in tree:
+            tree[key].append(-1 if key != "value" else 0.)
+        if len(candidates) <= leaf_size or depth >= max_depth:
+            tree["leaf_start"][node] = len(leaf_regions)
+            tree["leaf_count"][node] = len(candidates)
+            leaf_regions.extend(candidates)
+            return node
+        dim = int(np.argmax(cell_hi - cell_lo))
+        value = 0.5 * (cell_lo[dim] + cell_hi[dim])
+        left_hi, right_lo = cell_hi.copy(), cell_lo.copy()
+        left_hi[dim], right_lo[dim] = value, value
+        tree["dim"][node], tree["value"][node] = dim, value
+        tree["left"][node] = build(cell_lo, left_hi, [r for r in candidates if bboxes[r][0][dim] <= value], depth + 1)
+        tree["right"][node] = build(right_lo, cell_hi, [r for r in candidates if bboxes[r][1][dim] >= value], depth + 1)
+        return node
+
+    build(lo.copy(), hi.copy(), list(range(len(bboxes))), 0)
+    tree = {key: np.array(value) for key, value in tree.items()}
+    tree["depth"] = depth_reached
+    return tree, np.array(leaf_regions, dtype=np.int64)
+
+
+def compile_explicit_policy(net, obs_low, obs_high,
+        num_samples=1000,
+        max_regions=10000,
+        leaf_size=8,
+        max_depth=24,
+        active_tol=1e-6,
+        min_radius=1e-7,
+        seed=0,
+        verbose=False,
+    ):
+    """
+    Compile the QP of a fixed-PH QPUnrolledNetwork (or its MPC template) into an ExplicitQPPolicy over the box [obs_low, obs_high] of network inputs.
+
+    Active sets are discovered by solving the QP at random samples and then, for each new region, just across each of its facets
+    (i.e., exploring neighboring regions); regions with empty interior or linearly dependent active constraints are skipped,
+    and the observations they cover are reported as not covered by ExplicitQPPolicy.
+
+    Note: The explicit policy is the exact minimizer of the QP, i.e., the limit of the PDHG iterations rather than the truncated qp_iter iterations.
+
+    net: QPUnrolledNetwork; see get_affine_qp for the requirements
+    obs_low, obs_high: Bounds of the observation box, (d,)
+    num_samples: Number of random samples used to seed the exploration
+    max_regions: Maximum number of regions
+    leaf_size, max_depth: Target number of regions per leaf, and maximum depth of the search tree
+    active_tol: Threshold on the multipliers for a constraint to be considered active
+    min_radius: Minimum Chebyshev radius of regions and facets to be considered full-dimensional
+    seed: Seed of the random samples
+
+    Returns: ExplicitQPPolicy
+    """
+    P, q0, Wq, G, g0, Wg = get_affine_qp(net)
+    P_inv = np.linalg.inv(P)
+    lo, hi = np.asarray(obs_low, dtype=np.float64), np.asarray(obs_high, dtype=np.float64)
+    d = lo.shape[0]
+    step = 1e-5 * np.max(hi - lo)
+
+    oracle = IPQPSolver("cpu", P.shape[0], G.shape[0], P=P, H=G)
+    def active_sets_at(thetas):
+        theta_t = torch.tensor(thetas, dtype=torch.double)
+        q = torch.tensor(q0).unsqueeze(0) + theta_t @ torch.tensor(Wq).T
+        g = torch.tensor(g0).unsqueeze(0) + theta_t @ torch.tensor(Wg).T
+        _, lam, _, converged = oracle(q, g)
+        # The active set of a non-converged solve is unreliable, so such samples are not explored
+        return (lam > active_tol).numpy()[converged.numpy()]
+
+    rng = np.random.default_rng(seed)
+    samples = lo + (hi - lo) * rng.random((num_samples, d))
+    queue = list(active_sets_at(samples))
+    seen = set()
+    regions = []
+    while queue and len(regions) < max_regions:
+        active = queue.pop()
+        key = active.tobytes()
+        if key in seen:
+            continue
+        seen.add(key)
+        region = _critical_region(P_inv, q0, Wq, G, g0, Wg, active)
+        if region is None:
+            continue
+        K, k, C, c = region
+        _, radius = _chebyshev_ball(C, c, lo, hi)
+        if radius < min_radius:
+            continue
+
+        # Keep the facets of the region (non-redundant rows), and step across each of them to discover neighbors.
+        # Each row is tested against the rows that remain (kept or not yet tested), and dropped as soon as it is found redundant,
+        # so that of several rows defining the same facet exactly one is kept.
+        remaining = np.ones((C.shape[0],), dtype=bool)
+        keep, neighbors = [], []
+        for i in range(C.shape[0]):
+            remaining[i] = False
+            norm = np.linalg.norm(C[i])
+            if norm == 0.:
+                continue
+            center, facet_radius = _chebyshev_ball(C[remaining], c[remaining], lo, hi, eq=(C[i], c[i]))
+            if facet_radius < min_radius:
+                continue
+            remaining[i] = True
+            keep.append(i)
+            neighbor = center - step * C[i] / norm
+            if ((neighbor >= lo) & (neighbor <= hi)).all():
+                neighbors.append(neighbor)
+        if neighbors:
+            queue.extend(active_sets_at(np.stack(neighbors)))
+        C, c = C[keep], c[keep]
+
+        # Bounding box of the region within the box, for the search tree
+        bbox_lo, bbox_hi = np.empty(d), np.empty(d)
+        for j in range(d):
+            for sign, bound in [(1., bbox_lo), (-1., bbox_hi)]:
+                res = linprog(sign * np.eye(d)[j], A_ub=-C, b_ub=c, bounds=list(zip(lo, hi)), method="highs")
+                bound[j] = res.x[j] if res.success else (lo[j] if sign > 0 else hi[j])
+        regions.append((K, k, C, c, active, (bbox_lo, bbox_hi)))
+        if verbose:
+            num_regions, num_active, num_facets, queue_length = len(regions), int(active.sum()), len(keep), len(queue)
+            ic(num_regions, num_active, num_facets, queue_length)
+
+    # Pack into padded tables
+    R = len(regions)
+    max_rows = max([r[2].shape[0] for r in regions] + [1])
+    region_C = np.zeros((R, max_rows, d))
+    region_c = np.ones((R, max_rows))
+    for idx, (_, _, C, c, _, _) in enumerate(regions):
+        region_C[idx, :C.shape[0]] = C
+        region_c[idx, :C.shape[0]] = c
+    region_K = np.stack([r[0] for r in regions]) if R > 0 else np.zeros((0, P.shape[0], d))
+    region_k = np.stack([r[1] for r in regions]) if R > 0 else np.zeros((0, P.shape[0]))
+    active_sets = np.stack([r[4] for r in regions]) if R > 0 else np.zeros((0, G.shape[0]), dtype=bool)
+    tree, leaf_regions = _build_bsp([r[5] for r in regions], lo, hi, leaf_size, max_depth)
+    return ExplicitQPPolicy(region_C, region_c, region_K, region_k, tree, leaf_regions, lo, hi, active_sets=active_sets).to(net.device)
@@ -0,0 +1,100 @@
+import torch
+from torch import nn
+from typing import Optional
+
+from .qp_solver import pdhg_project
+
+
+class FoldedQPPolicy(nn.Module):
+    """
+    Inference-only policy obtained by folding a QPUnrolledNetwork with fixed P, H and affine (q, b); see QPUnrolledNetwork.fold.
+
+    Since everything before and after the PDHG iterations is affine in the observation, the policy reduces to:
+    B = W_B obs + c_B,
+    X_{k+1} = proj(A X_k + B), k = 0, ..., iters - 1, with X_0 = 0,
+    x = W_z z + W_obs obs + c_x, where z is the second half of X_iters.
+    """
+    def __init__(self, A, W_B, c_B, W_z, W_obs, c_x, iters, symmetric_constraint=False, buffered=False):
+        """
+        A: Iteration matrix of PDHG, (2m, 2m)
+        W_B, c_B: Affine map from observation to the constant term B of the PDHG iteration, (2m, input_size) and (2m,)
+        W_z, W_obs, c_x: Affine map from (z, obs) to the primal solution, (n, m), (n, input_size) and (n,)
+        iters: Number of PDHG iterations
+        symmetric_constraint, buffered: Projection rules, as in QPSolver
+        """
+        super().__init__()
+        self.m = A.shape[0] // 2
+        self.n = c_x.shape[0]
+        self.input_size = W_B.shape[1]
+        self.iters = iters
+        self.symmetric_constraint = symmetric_constraint
+        self.buffered = buffered
+        # Disabled for export to graph formats that do not support in-place updates of views
+        self.inplace_projection = True
+        # Stored transposed and contiguous, so that each step is a single addmm on row-major batches
+        self.register_buffer("At", A.t().contiguous())
+        self.register_buffer("W_Bt", W_B.t().contiguous())
+        self.register_buffer("c_B", c_B.contiguous())
+        self.register_buffer("W_zt", W_z.t().contiguous())
+        self.register_buffer("W_obst", W_obs.t().contiguous())
+        self.register_buffer("c_x", c_x.contiguous())
+
+    def forward(self, x, iters: Optional[int] = None, X0: Optional[torch.Tensor] = None):
+        """
+        x: Observation (bs, input_size)
+        iters: Optional number of PDHG iterations, overriding the one used when folding
+        X0: Optional initial primal-dual variables (bs, 2m)
+
+        Returns: Primal solution (bs, n)
+
+        Note: All matrices are buffers, so no autograd graph is recorded unless x requires grad.
+        """
+        iters = self.iters if iters is None else iters
+        B = torch.addmm(self.c_B, x, self.W_Bt)
+        X = torch.zeros_like(B) if X0 is None else X0
+        for k in range(iters):
+            X = torch.addmm(B, X, self.At)
+            X = pdhg_project(X, self.m, self.symmetric_constraint, self.buffered, self.inplace_projection)
+        return torch.addmm(torch.addmm(self.c_x, x, self.W_obst), X[:, self.m:], self.W_zt)
+
+
+class ExportedQPPolicy(nn.Module):
+    """
+    Self-contained deployment graph of a folded policy: observation normalization, the folded QP policy, and action rescaling.
+
+    Mirrors what the rl_games player does around the network at test time, so that the output is the action applied to the env.
+    Written to be compatible with both torch.jit.script and torch.onnx.export, with a dynamic batch dimension.
+    """
+    def __init__(self, folded, actions_num,
+            obs_mean=None, obs_var=None, obs_epsilon=1e-5, obs_clip=5.,
+            action_low=None, action_high=None,
+        ):
+        """
+        folded: FoldedQPPolicy
+        actions_num: Number of leading entries of the QP solution used as action
+        obs_mean, obs_var: Running statistics of the observation normalizer (running_mean_std); normalization is skipped if not given
+        obs_epsilon, obs_clip: Constants of the observation normalizer; the normalized observation is clamped to [-obs_clip, obs_clip]
+        action_low, action_high: Bounds of the action space; if given, the action is clamped to [-1, 1] and mapped affinely to [action_low, action_high]
+        """
+        super().__init__()
+        self.folded = folded
+        self.actions_num = actions_num
+        self.normalize_obs = obs_mean is not None
+        self.rescale_action = action_low is not None
+        self.obs_epsilon = obs_epsilon
+        self.obs_clip = obs_clip
+        device = folded.c_x.device
+        t = lambda v, default: torch.as_tensor(v, dtype=torch.float, device=device) if v is not None else default
+        # Buffers are always registered (with neutral values when unused) so that the scripted module has a fixed set of attributes
+        self.register_buffer("obs_mean", t(obs_mean, torch.zeros((folded.input_size,), device=device)))
+        self.register_buffer("obs_var", t(obs_var, torch.ones((folded.input_size,), device=device)))
+        self.register_buffer("action_low", t(action_low, -torch.ones((actions_num,), device=device)))
+        self.register_buffer("action_high", t(action_high, torch.ones((actions_num,), device=device)))
+
+    def forward(self, obs):
+        if self.normalize_obs:
+            obs = torch.clamp((obs - self.obs_mean) / torch.sqrt(self.obs_var + self.obs_epsilon), -self.obs_clip, self.obs_clip)
+        action = self.folded(obs)[:, :self.actions_num]
+        if self.rescale_action:
+            action = self.action_low + (self.action_high - self.action_low) * (torch.clamp(action, -1., 1.) + 1.) / 2.
+        return action
@@ -0,0 +1,123 @@
+import torch
+from torch import nn
+
+from ..utils.torch_utils import bmv
+
+
+def _max_step(v, dv):
+    """Largest step in [0, 1] such that v + step * dv >= 0, computed row-wise for v, dv of shape (bs, m)."""
+    ratio = torch.where(dv < 0, -v / dv, torch.full_like(v, float("inf")))
+    return ratio.amin(dim=-1).clamp(max=1.)
+
+
+class IPQPSolver(nn.Module):
+    """
+    Solve QP problem:
+    minimize    (1/2)x'Px + q'x
+    subject to  Hx + b >= 0,
+    where x in R^n, b in R^m,
+    to high accuracy with a primal-dual interior-point method (Mehrotra predictor-corrector), vectorized across the batch.
+
+    Intended as a batched replacement of osqp_oracle for computing ground-truth solutions of many small dense QPs; not differentiable.
+    """
+    def __init__(self, device, n, m,
+            P=None, H=None,
+            tol=1e-9,
+            max_iter=50,
+            dtype=torch.double,
+        ):
+        """
+        Initialize the interior-point solver.
+
+        device: PyTorch device
+
+        n, m: dimensions of decision variable x and constraint vector b
+
+        P, H: Optional matrices that define the QP. If not provided, must be supplied during forward pass.
+
+        tol: Tolerance on the infinity norms of the primal and dual residuals, and on the average complementarity
+
+        max_iter: Maximum number of interior-point iterations
+
+        dtype: Floating point type used internally; double precision is needed for tight tolerances
+
+        Note: Assumes that P is positive definite.
+        """
+        super().__init__()
+        self.device = device
+        self.n = n
+        self.m = m
+        self.dtype = dtype
+        create_tensor = lambda t: (torch.tensor(t, dtype=dtype, device=device).unsqueeze(0) if t is not None else None) if type(t) != torch.Tensor else t.to(dtype=dtype, device=device).unsqueeze(0)
+        self.bP = create_tensor(P)       # (1, n, n)
+        self.bH = create_tensor(H)       # (1, m, n)
+        self.tol = tol
+        self.max_iter = max_iter
+
+    @torch.no_grad()
+    def forward(self, q, b, P=None, H=None):
+        """
+        Solves the QP problem.
+
+        q, b: Coefficients in the objective and constraint, (bs, n) and (bs, m)
+        P, H: Optional matrices defining the QP, (bs, n, n) and (bs, m, n) or with singleton batch dimension. Must be provided if not initialized.
+
+        Returns: Primal solution x (bs, n), dual solution lambda >= 0 (bs, m) satisfying Px + q = H'lambda, number of iterations (bs,),
+        and whether each instance converged to tol (bs,); instances that are infeasible or did not converge within max_iter have converged == False, and their x, lambda are the last iterates
+        """
+        bs = q.shape[0]
+        to_batch = lambda M: M.unsqueeze(0) if M.dim() == 2 else M
+        q = q.to(dtype=self.dtype)
+        b = b.to(dtype=self.dtype)
+        bP = self.bP if self.bP is not None else to_batch(P.to(dtype=self.dtype))
+        bH = self.bH if self.bH is not None else to_batch(H.to(dtype=self.dtype))
+        bHt = bH.transpose(-1, -2)
+
+        # Start from x = 0 with strictly positive slack s and multiplier lambda
+        x = torch.zeros((bs, self.n), dtype=self.dtype, device=q.device)
+        s = (bmv(bH, x) + b).clamp(min=1.)
+        lam = torch.ones((bs, self.m), dtype=self.dtype, device=q.device)
+        iter_counts = torch.full((bs,), self.max_iter, dtype=torch.long, device=q.device)
+        active = torch.ones((bs,), dtype=torch.bool, device=q.device)
+
+        for k in range(self.max_iter + 1):
+            # Residuals of the KKT conditions: Px + q - H'lambda = 0, Hx + b - s = 0, s * lambda = 0
+            r_d = bmv(bP, x) + q - bmv(bHt, lam)
+            r_p = bmv(bH, x) + b - s
+            mu = (s * lam).sum(dim=-1) / self.m
+            converged = (r_p.abs().amax(dim=-1) < self.tol) & (r_d.abs().amax(dim=-1) < self.tol) & (mu < self.tol)
+            iter_counts = torch.where(converged & active, torch.full_like(iter_counts, k), iter_counts)
+            active = active & ~converged
+            if k == self.max_iter or not active.any():
+                break
+
+            # Eliminate ds and dlambda from the Newton system, leaving (P + H' diag(lambda / s) H) dx = rhs, solved by batched Cholesky
+            w = lam / s
+            K = bP + bHt @ (w.unsqueeze(-1) * bH)
+            L, info = torch.linalg.cholesky_ex(K)
+            ok = active & (info == 0)
+
+            def newton_direction(r_c):
+                rhs = -r_d - bmv(bHt, (r_c + lam * r_p) / s)
+                dx = torch.cholesky_solve(rhs.unsqueeze(-1), L).squeeze(-1)
+                ds = bmv(bH, dx) + r_p
+                dlam = -(r_c + lam * ds) / s
+                return dx, ds, dlam
+
+            # Predictor (affine scaling) step
+            dx_aff, ds_aff, dlam_aff = newton_direction(s * lam)
+            alpha_aff = torch.minimum(_max_step(s, ds_aff), _max_step(lam, dlam_aff)).unsqueeze(-1)
+            mu_aff = ((s + alpha_aff * ds_aff) * (lam + alpha_aff * dlam_aff)).sum(dim=-1) / self.m
+            sigma = (mu_aff / mu).clamp(min=0., max=1.) ** 3
+
+            # Corrector step with centering, reusing the factorization
+            dx, ds, dlam = newton_direction(s * lam + ds_aff * dlam_aff - (sigma * mu).unsqueeze(-1))
+            alpha = 0.99 * torch.minimum(_max_step(s, ds), _max_step(lam, dlam)).unsqueeze(-1)
+
+            # Only update instances that are still running and whose factorization succeeded
+            mask = ok.unsqueeze(-1)
+            x = torch.where(mask, x + alpha * dx, x)
+            s = torch.where(mask, s + alpha * ds, s)
+            lam = torch.where(mask, lam + alpha * dlam, lam)
+
+        return x, lam, iter_counts, ~active
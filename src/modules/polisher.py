@@ -0,0 +1,109 @@
+import torch
+from torch import nn
+import numpy as np
+from collections import OrderedDict
+
+from .qp_solver import one_sided_constraints, projection_active_set
+
+
+class ActiveSetPolisher(nn.Module):
+    """
+    Polish the approximate solution of PDHG into the exact solution of the QP with fixed P, H.
+
+    The active set is guessed from the last projection of PDHG; the equality-constrained KKT system of that active set,
+    Px + q = G_A' lambda_A, G_A x + g_A = 0,
+    is then solved exactly, and the result is accepted only if it is primal and dual feasible.
+
+    The Cholesky factorization of G_A P^{-1} G_A' depends only on the active set, so factorizations are kept in an LRU cache keyed by the active-set bitmask;
+    in steady-state control only a few active sets recur, so the extra cost per call is a few triangular solves per distinct active set in the batch.
+    """
+    def __init__(self, device, n, m, H, P=None, Pinv=None, symmetric_constraint=False, buffered=False, cache_size=64, tol=1e-6):
+        """
+        device: PyTorch device
+
+        n, m: dimensions of decision variable x and constraint vector b
+
+        H, P, Pinv: Matrices defining the QP; exactly one of P and Pinv must be specified
+
+        symmetric_constraint, buffered: Constraint set, as in QPSolver
+
+        cache_size: Maximum number of cached factorizations
+
+        tol: Tolerance for the feasibility check of the polished solution
+        """
+        super().__init__()
+        assert (P is None) != (Pinv is None), "Exactly one of P and Pinv must be specified"
+        t = lambda M: torch.as_tensor(M, dtype=torch.float, device=device)
+        self.device = device
+        self.n = n
+        self.m = m
+        self.Pinv = t(Pinv) if Pinv is not None else torch.linalg.inv(t(P))
+        self.G, _ = one_sided_constraints(H=t(H), symmetric_constraint=symmetric_constraint, buffered=buffered)
+        self.symmetric_constraint = symmetric_constraint
+        self.buffered = buffered
+        self.cache_size = cache_size
+        self.tol = tol
+        self.cache = OrderedDict()
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    def get_factorization(self, active):
+        """
+        Look up or compute the factorization for an active set.
+
+        active: Boolean NumPy array (r,)
+
+        Returns: (indices of active rows, Cholesky factor of G_A P^{-1} G_A', P^{-1} G_A'), or None if the active rows are linearly dependent
+        """
+        key = np.packbits(active).tobytes()
+        if key in self.cache:
+            self.cache_hits += 1
+            self.cache.move_to_end(key)
+            return self.cache[key]
+        self.cache_misses += 1
+        idx = torch.as_tensor(np.flatnonzero(active), device=self.device)
+        if idx.numel() == 0:
+            # Unconstrained minimizer
+            factorization = (idx, None, None)
+        else:
+            G_A = self.G[idx]
+            PinvGAt = self.Pinv @ G_A.t()
+            L, info = torch.linalg.cholesky_ex(G_A @ PinvGAt)
+            factorization = (idx, L, PinvGAt) if info.item() == 0 else None
+        self.cache[key] = factorization
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+        return factorization
+
+    def forward(self, z, q, b):
+        """
+        z: Second half of the last PDHG iterate (bs, m), i.e., after projection
+        q, b: Coefficients in the objective and constraint, (bs, n) and (bs, m)
+
+        Returns: Polished solutions (bs, n), and a boolean mask (bs,) of the instances where polishing succeeded (other rows are zeros)
+        """
+        bs = q.shape[0]
+        _, g = one_sided_constraints(b=b, symmetric_constraint=self.symmetric_constraint, buffered=self.buffered)
+        active = projection_active_set(z, self.symmetric_constraint, self.buffered)
+        sets, inverse = torch.unique(active, dim=0, return_inverse=True)
+        x = torch.zeros((bs, self.n), device=q.device)
+        success = torch.zeros((bs,), dtype=torch.bool, device=q.device)
+        for i, active_set in enumerate(sets.cpu().numpy()):
+            factorization = self.get_factorization(active_set)
+            if factorization is None:
+                continue
+            rows = (inverse == i).nonzero().squeeze(1)
+            q_i, g_i = q[rows], g[rows]
+            x_i = -q_i @ self.Pinv.t()
+            lam_ok = torch.ones((rows.shape[0],), dtype=torch.bool, device=q.device)
+            idx, L, PinvGAt = factorization
+            if idx.numel() > 0:
+                # lambda_A = (G_A P^{-1} G_A')^{-1} (G_A P^{-1} q - g_A), x = P^{-1} (G_A' lambda_A - q)
+                rhs = q_i @ PinvGAt - g_i[:, idx]
+                lam = torch.cholesky_solve(rhs.t(), L).t()
+                x_i = x_i + lam @ PinvGAt.t()
+                lam_ok = (lam >= -self.tol).all(dim=1)
+            slack_ok = (x_i @ self.G.t() + g_i >= -self.tol).all(dim=1)
+            x[rows] = x_i
+            success[rows] = lam_ok & slack_ok
+        return x, success
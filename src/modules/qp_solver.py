@@ -7,6 +7,75 @@ import numpy as np
 from .preconditioner import Preconditioner
 from ..utils.torch_utils import bmv, bma, bsolve
 
+def pdhg_project(X, m: int, symmetric_constraint: bool = False, buffered: bool = False, inplace: bool = True):
+    """
+    Projection step of PDHG on the primal-dual variable X = [u; z] of shape (bs, 2m); see QPSolver for the meaning of the flags.
+
+    inplace: Whether to project in place where possible; set to False for graphs that do not support mutation of views (e.g., ONNX export).
+    (Arguments are annotated so that the function can be compiled by TorchScript.)
+    """
+    if not symmetric_constraint:
+        # Project to [0, +\infty)
+        if inplace:
+            F.relu(X[:, m:], inplace=True)
+        else:
+            X = torch.cat((X[:, :m], F.relu(X[:, m:])), dim=1)
+    else:
+        if not buffered:
+            # Project to [-1, 1]
+            projected = torch.clamp(X[:, m:], -1, 1)
+            X = torch.cat((X[:, :m], projected), dim=1)
+        else:
+            # Hybrid projection: epsilon to [0, +\infty), the rest decision variables to [-1 - eps, 1 + eps]
+            # Project epsilon
+            if inplace:
+                F.relu(X[:, -1:], inplace=True)
+                eps = X[:, -1:]
+            else:
+                eps = F.relu(X[:, -1:])
+            # Project the rest variables
+            projected = torch.clamp(X[:, m:-1], -1 - eps, 1 + eps)
+            # Concatenate
+            X = torch.cat((X[:, :m], projected, eps), dim=1)
+    return X
+
+
+def one_sided_constraints(H=None, b=None, symmetric_constraint=False, buffered=False):
+    """
+    Rewrite the constraint of the QP (Hx + b in the set that PDHG projects onto; see QPSolver for the flags) as one-sided inequalities Gx + g >= 0.
+
+    H: Optional constraint matrix (m, n)
+    b: Optional constraint vectors (..., m)
+
+    Returns: G (r, n) and g (..., r); None for the ones whose input is not given
+    """
+    if not symmetric_constraint:
+        return H, b
+    elif not buffered:
+        # -1 <= Hx + b <= 1
+        G = torch.cat([H, -H], 0) if H is not None else None
+        g = torch.cat([b + 1, -b + 1], -1) if b is not None else None
+    else:
+        # -1 - eps <= H_x x + b_x <= 1 + eps, eps >= 0, where eps is given by the last row
+        G = torch.cat([H[:-1] + H[-1:], -H[:-1] + H[-1:], H[-1:]], 0) if H is not None else None
+        g = torch.cat([b[..., :-1] + b[..., -1:] + 1, -b[..., :-1] + b[..., -1:] + 1, b[..., -1:]], -1) if b is not None else None
+    return G, g
+
+def projection_active_set(z, symmetric_constraint=False, buffered=False):
+    """
+    Rows of the one-sided constraints (see one_sided_constraints) at which the last PDHG projection of z (bs, m) is active, i.e., clipped to the boundary.
+
+    Returns: Boolean tensor (bs, r)
+    """
+    if not symmetric_constraint:
+        return z <= 0
+    elif not buffered:
+        return torch.cat([z <= -1, z >= 1], -1)
+    else:
+        eps = z[:, -1:]
+        return torch.cat([z[:, :-1] <= -1 - eps, z[:, :-1] >= 1 + eps, eps <= 0], -1)
+
+
 class QPSolver(nn.Module):
     """
     Solve QP problem:
@@ -22,6 +91,8 @@ class QPSolver(nn.Module):
             keep_X=True,
             symmetric_constraint=False,
             buffered=False,
+            polisher=None,
+            screening=False,
         ):
         """
         Initialize the QP solver.
@@ -48,6 +119,10 @@ class QPSolver(nn.Module):
         1. Project epsilon to [0, +\infty)
         2. Project H_x x + b_x to [-1 - eps, 1 + eps]
 
+        polisher: Optional ActiveSetPolisher; when given, the last primal solution is replaced by the polished one wherever polishing succeeds
+
+        screening: Flag for screening with the unconstrained minimizer; when True, x = -P^{-1}q is used for the rows where it satisfies the constraints, and PDHG only runs on the remaining rows
+
         Note: Assumes that H is full column rank when m >= n, and full row rank otherwise.
         """
         super().__init__()
@@ -71,6 +146,13 @@ class QPSolver(nn.Module):
         self.keep_X = keep_X
         self.symmetric_constraint = symmetric_constraint
         self.buffered = buffered
+        self.polisher = polisher
+        self.screening = screening
+        # Masks of the instances polished / screened in the last forward pass
+        self.last_polished = None
+        self.last_screened = None
+        # Optional reduced-precision dtype (e.g., torch.bfloat16) of the iteration matrix A; the addition of B and the projection stay in the dtype of q, b
+        self.iteration_dtype = None
 
         self.bIm = torch.eye(m, device=device).unsqueeze(0)
         self.X0 = torch.zeros((1, 2 * self.m), device=self.device)
@@ -222,12 +304,50 @@ class QPSolver(nn.Module):
         return primal_residual, dual_residual
 
 
+    def screen(self, q, b, P=None, H=None, Pinv=None):
+        """
+        Computes the unconstrained minimizer x = -P^{-1}q, and checks whether it satisfies the constraints (in which case it is the solution).
+
+        q, b: Coefficients in the objective and constraint
+        P, H, Pinv: Optional matrices defining the QP. Must be provided if not initialized.
+
+        Returns: Unconstrained minimizers (bs, n), and a boolean mask (bs,) of the rows where they are feasible
+        """
+        if self.bP is not None:
+            bP_param, op = self.bP, bsolve
+        elif self.bPinv is not None:
+            bP_param, op = self.bPinv, bma
+        elif P is not None:
+            bP_param, op = P, bsolve
+        else:
+            bP_param, op = Pinv, bma
+        bH = self.bH if self.bH is not None else H
+        x = -op(bP_param, q)
+        # One-sided slacks of z = Hx + b with respect to the constraint set
+        _, slack = one_sided_constraints(b=bmv(bH, x) + b, symmetric_constraint=self.symmetric_constraint, buffered=self.buffered)
+        return x, (slack >= 0).all(dim=-1)
+
+    @staticmethod
+    def get_sol_steps(iters, only_last_primal=True, checkpoints=None):
+        """
+        Iteration counts after which the primal solution is computed, mapped to their index in the output primal_sols.
+        """
+        if checkpoints is not None:
+            return {k: i for (i, k) in enumerate(checkpoints)}
+        elif only_last_primal:
+            return {iters: 0}
+        else:
+            return {k: k for k in range(iters + 1)}
+
     def forward(
         self, q, b,
         P=None, H=None, Pinv=None,
         iters=1000,
         only_last_primal=True,
-        return_residuals=False
+        return_residuals=False,
+        X0=None,
+        X0_mask=None,
+        checkpoints=None,
     ):
         """
         Solves the QP problem using PDHG.
@@ -237,8 +357,61 @@ class QPSolver(nn.Module):
         iters: Number of PDHG iterations
         only_last_primal: Flag for returning only the last primal solution (when True, primal_sols is (bs, 1, n); otherwise (bs, iters + 1, n))
         return_residuals: Flag for returning residuals
+        X0: Optional initial primal-dual variables (bs, 2m), overriding the default initialization (zeros or the output of the warm starter)
+        X0_mask: Optional boolean tensor (bs,) selecting the rows where X0 is used; the other rows keep the default initialization
+        checkpoints: Optional sorted list of iteration counts ending with iters; when given, primal_sols is (bs, len(checkpoints), n), with the primal solution after each of these iterations (anytime inference), and only_last_primal is ignored
 
         Returns: History of primal-dual variables, primal solutions, and optionally residuals of the last iteration
+
+        Note: With screening, the rows solved by the unconstrained minimizer x report the PDHG fixed point (u, z) = (0, Hx + b) at every iteration, and zero residuals.
+        Note: The polisher is skipped when checkpoints are given, since it would only apply to the last checkpoint.
+        """
+        assert checkpoints is None or checkpoints[-1] == iters, "The last checkpoint must be iters"
+        if not self.screening:
+            return self._forward(q, b, P, H, Pinv, iters, only_last_primal, return_residuals, X0, X0_mask, checkpoints)
+
+        bs = q.shape[0]
+        x_unc, feasible = self.screen(q, b, P, H, Pinv)
+        self.last_screened = feasible
+        bH = self.bH if self.bH is not None else H
+        X_star = torch.cat([torch.zeros_like(b), bmv(bH, x_unc) + b], 1)
+        Xs = X_star.unsqueeze(1).repeat(1, iters + 1, 1) if self.keep_X else None
+        primal_sols = x_unc.unsqueeze(1).repeat(1, len(self.get_sol_steps(iters, only_last_primal, checkpoints)), 1)
+        residuals = (torch.zeros_like(b), torch.zeros_like(q))
+        polished = torch.zeros((bs,), dtype=torch.bool, device=q.device)
+
+        # Run PDHG only on the rows that fail the check, compacted
+        rows = torch.logical_not(feasible).nonzero().squeeze(1)
+        if rows.numel() > 0:
+            sub = lambda t: t[rows] if (t is not None and t.shape[0] == bs) else t
+            outputs = self._forward(sub(q), sub(b), sub(P), sub(H), sub(Pinv), iters, only_last_primal, return_residuals, sub(X0), sub(X0_mask), checkpoints)
+            if self.keep_X:
+                Xs = Xs.index_copy(0, rows, outputs[0])
+            primal_sols = primal_sols.index_copy(0, rows, outputs[1])
+            if return_residuals:
+                residuals = tuple(r.index_copy(0, rows, r_sub) for (r, r_sub) in zip(residuals, outputs[2]))
+            if self.polisher is not None and checkpoints is None:
+                polished[rows] = self.last_polished
+        if self.polisher is not None and checkpoints is None:
+            self.last_polished = polished
+
+        if return_residuals:
+            return Xs, primal_sols, residuals
+        else:
+            return Xs, primal_sols
+
+    def _forward(
+        self, q, b,
+        P=None, H=None, Pinv=None,
+        iters=1000,
+        only_last_primal=True,
+        return_residuals=False,
+        X0=None,
+        X0_mask=None,
+        checkpoints=None,
+    ):
+        """
+        Solves the QP problem using PDHG on all rows; see forward for the arguments and return values.
         """
         # q: (bs, n), b: (bs, m)
         bs = q.shape[0]
@@ -246,45 +419,40 @@ class QPSolver(nn.Module):
             Xs = torch.zeros((bs, iters + 1, 2 * self.m), device=self.device)
         else:
             Xs = None
-        primal_sols = torch.zeros((bs, (iters if not only_last_primal else 0) + 1, self.n), device=self.device)
+        # Output index of the primal solution after each iteration count that is reported
+        sol_steps = self.get_sol_steps(iters, only_last_primal, checkpoints)
+        primal_sols = torch.zeros((bs, len(sol_steps), self.n), device=self.device)
         if self.warm_starter is not None:
             with torch.set_grad_enabled(self.is_warm_starter_trainable):
                 qd, bd, Pd, Hd, Pinvd = map(lambda t: t.detach() if t is not None else None, [q, b, P, H, Pinv])
                 P_param_to_ws = Pd if Pd is not None else Pinvd
                 self.X0 = self.warm_starter(qd, bd, P_param_to_ws, Hd)
         get_sol = self.get_sol if self.get_sol is not None else self.get_sol_transform(H, P, Pinv)
-        if self.keep_X:
-            Xs[:, 0, :] = self.X0.clone()
-        if not only_last_primal:
-            primal_sols[:, 0, :] = get_sol(self.X0[:, self.m:], q, b)
         X = self.X0
+        if X0 is not None:
+            X = X0 if X0_mask is None else torch.where(X0_mask.unsqueeze(-1), X0, X)
+        if self.keep_X:
+            Xs[:, 0, :] = X.clone()
+        if 0 in sol_steps:
+            primal_sols[:, sol_steps[0], :] = get_sol(X[:, self.m:], q, b)
         A, B = self.get_AB(q, b, H, P, Pinv)
+        if self.iteration_dtype is not None:
+            A = A.to(self.iteration_dtype)
         for k in range(1, iters + 1):
             # PDHG update
-            X = bmv(A, X) + B   # (bs, 2m)
-            if not self.symmetric_constraint:
-                # Project to [0, +\infty)
-                F.relu(X[:, self.m:], inplace=True)
+            if self.iteration_dtype is None:
+                X = bmv(A, X) + B   # (bs, 2m)
             else:
-                if not self.buffered:
-                    # Project to [-1, 1]
-                    projected = torch.clamp(X[:, self.m:], -1, 1)
-                    X = torch.cat((X[:, :self.m], projected), dim=1)
-                else:
-                    # Hybrid projection: epsilon to [0, +\infty), the rest decision variables to [-1 - eps, 1 + eps]
-                    # Project epsilon
-                    F.relu(X[:, -1:], inplace=True)
-                    # Project the rest variables
-                    projected = torch.clamp(X[:, self.m:-1], -1 - X[:, -1:], 1 + X[:, -1:])
-                    # Concatenate
-                    X = torch.cat((X[:, :self.m], projected, X[:, -1:]), dim=1)
+                X = bmv(A, X.to(self.iteration_dtype)).to(B.dtype) + B
+            X = pdhg_project(X, self.m, self.symmetric_constraint, self.buffered)
             if self.keep_X:
                 Xs[:, k, :] = X.clone()
-            if not only_last_primal:
-                primal_sols[:, k, :] = get_sol(X[:, self.m:], q, b)
+            if k in sol_steps:
+                primal_sols[:, sol_steps[k], :] = get_sol(X[:, self.m:], q, b)
 
-        if only_last_primal:
-            primal_sols[:, 0, :] = get_sol(X[:, self.m:], q, b)
+        if self.polisher is not None and checkpoints is None:
+            x_polished, self.last_polished = self.polisher(X[:, self.m:], q, b)
+            primal_sols[:, -1, :] = torch.where(self.last_polished.unsqueeze(-1), x_polished, primal_sols[:, -1, :])
 
         # Compute residuals for the last step if the flag is set
         if return_residuals:
@@ -4,13 +4,18 @@ import numpy as np
 import scipy
 import functools
 from ..modules.qp_solver import QPSolver
+from ..modules.folded_policy import FoldedQPPolicy
 from ..modules.warm_starter import WarmStarter
-from ..utils.torch_utils import make_psd, interpolate_state_dicts
+from ..modules.polisher import ActiveSetPolisher
+from ..modules.ip_solver import IPQPSolver
+from ..utils.torch_utils import make_psd, ParameterAverager, ParameterVersionCache
 from ..utils.mpc_utils import mpc2qp, scenario_robust_mpc, tube_robust_mpc
 from ..utils.osqp_utils import osqp_oracle
 from ..utils.np_batch_op import np_batch_op
+from ..utils.controller_pool import ControllerPool
+from ..utils.telemetry import STATUS_MAX_ITER_REACHED, STATUS_SOLVED
 import os
-from concurrent.futures import ThreadPoolExecutor
+import time
 
 
 class StrictAffineLayer(nn.Module):
@@ -61,11 +66,19 @@ class QPUnrolledNetwork(nn.Module):
         ws_loss_shaper=lambda x: x ** (1 / 2),
         mpc_baseline=None,
         use_osqp_for_mpc=False,
+        use_ip_for_mpc=False,
         imitate_mpc=False,
         use_residual_loss=False,
         force_feasible=False,
         feasible_lambda=10,
         is_test=False,
+        telemetry=None,
+        temporal_warm_start=False,
+        polish=False,
+        screening=False,
+        anytime_checkpoints=None,
+        quantize=False,
+        bf16_iterations=False,
     ):
         """mlp_builder is a function mapping (input_size, output_size) to a nn.Sequential object.
 
@@ -90,11 +103,29 @@ class QPUnrolledNetwork(nn.Module):
 
         If mpc_baseline != None and imitate_mpc == True, then the forward function returns the solution of the learned QP problem, but a loss term is computed using the MPC problem. Can be used for supervised imitation learning.
 
+        The MPC problem is solved by PDHG by default; if use_osqp_for_mpc == True, it is solved exactly by OSQP on CPU, instance by instance,
+        and if use_ip_for_mpc == True, it is solved exactly by the batched interior-point solver IPQPSolver (in double precision, on the device of the input).
+
         If force_feasible == True, solve the following problem instead of the original QP problem:
         minimize_{x,y}    (1/2)x'Px + q'x + lambda * y^2
         s.t.       Hx + b + y * 1 >= 0, y >= 0,
         where x in R^n, y in R.
         In this case, the solution returned will be of dimension (n + 1).
+
+        telemetry is an optional SolverTelemetry that receives per-solve metrics of the MPC baseline; nothing is recorded if not given.
+
+        If temporal_warm_start == True, PDHG (for both the learned QP and the MPC baseline) is initialized from the last primal-dual iterate of the same env instance at the previous step, except for instances whose episode ends at the current or the previous step.
+        This requires the env to put "is_done" into info, and is only applied to forward passes that receive it; since minibatch replays of PPO would run without the warm start, it is only supported in test mode.
+
+        If polish == True, the PDHG solution is polished into the exact QP solution by an ActiveSetPolisher where possible; this applies to the learned QP when P, H are fixed (test mode with shared_PH), and to the MPC baseline solved by PDHG.
+
+        If screening == True, the solvers (of both the learned QP and the MPC baseline) first try the unconstrained minimizer -P^{-1}q, and only run PDHG on the instances where it is infeasible.
+
+        If anytime_checkpoints is a list of iteration counts, the learned QP is solved once with max(anytime_checkpoints) iterations, and the primal solutions at all checkpoints are kept in self.anytime_sols;
+        instance i of the batch acts with the solution at checkpoint anytime_checkpoints[i % len(anytime_checkpoints)], so that each iteration budget runs its own closed loop within the same rollout (used for batch testing with several budgets at once).
+
+        If quantize == True (CPU test mode only), the linear layers of the MLP and of the (q, b) affine layer are replaced by dynamically quantized int8 layers when the solver is initialized, i.e., after the state dict is loaded.
+        If bf16_iterations == True (test mode only), the PDHG iteration matrix is applied in bfloat16; the projection and the map to the primal solution stay in float32.
         """
 
         super().__init__()
@@ -129,6 +160,8 @@ class QPUnrolledNetwork(nn.Module):
         else:
             self.P_params = nn.Parameter(torch.randn((self.n_P_param,), device=device))
             self.H_params = nn.Parameter(torch.randn((self.n_H_param,), device=device))
+            # P, H depend only on the parameters, so they are assembled once per optimizer step and reused across forward passes
+            self.PH_cache = ParameterVersionCache(self.get_PH, [self.P_params, self.H_params])
 
         if not self.affine_qb:
             self.n_mlp_output += (self.n_q_param + self.n_b_param)
@@ -151,6 +184,8 @@ class QPUnrolledNetwork(nn.Module):
         self.ws_loss_coef = ws_loss_coef
         self.ws_update_rate = ws_update_rate
         self.ws_loss_shaper = ws_loss_shaper
+        # The delayed warm starter tracks the trained one as a moving average, updated once per optimizer step
+        self.ws_averager = ParameterAverager(self.warm_starter, self.warm_starter_delayed, ws_update_rate) if train_warm_starter else None
 
         # P, H are fixed when the model is in test mode, and they are constant across all states (i.e., shared_PH == True)
         self.fixed_PH = is_test and shared_PH
@@ -159,7 +194,9 @@ class QPUnrolledNetwork(nn.Module):
         self.autonomous_losses = {}
 
         self.mpc_baseline = mpc_baseline
+        assert not (use_osqp_for_mpc and use_ip_for_mpc), "Choose at most one exact solver for the MPC baseline"
         self.use_osqp_for_mpc = use_osqp_for_mpc
+        self.use_ip_for_mpc = use_ip_for_mpc
 
         self.imitate_mpc = imitate_mpc
 
@@ -172,14 +209,40 @@ class QPUnrolledNetwork(nn.Module):
 
         self.solver = None
 
-        self.info = {}
+        # Per-solve metrics (iterations, wall time, status, residuals) of the MPC baseline
+        self.telemetry = telemetry
 
-        # Reserved for storing the controllers for each simulation instance when robust MPC is enabled
-        self.robust_controllers = []
+        # Reserved for the worker pool owning the controllers of the simulation instances when robust MPC is enabled
+        self.controller_pool = None
 
         # Store info returned by env
         self.env_info = {}
 
+        # Last primal-dual iterate and done flags of each env instance, keyed by the solver it seeds ("qp" or "mpc")
+        assert not temporal_warm_start or is_test, "Temporal warm start is only supported in test mode"
+        self.temporal_warm_start = temporal_warm_start
+        self.temporal_cache = {}
+
+        # Active-set polishing; the polisher of the MPC baseline is created at its first solve, since the QP dimensions are not known before
+        self.polish = polish
+        self.mpc_polisher = None
+
+        # Interior-point solver of the MPC baseline (use_ip_for_mpc); created at its first solve, like the polisher
+        self.mpc_ip_solver = None
+
+        # Unconstrained-minimizer screening before PDHG
+        self.screening = screening
+
+        # Reduced-precision inference, applied in initialize_solver
+        assert not (quantize or bf16_iterations) or is_test, "Reduced-precision inference is only supported in test mode"
+        assert not quantize or torch.device(device).type == "cpu", "Dynamic quantization is only supported on CPU"
+        self.quantize = quantize
+        self.bf16_iterations = bf16_iterations
+
+        # Anytime inference with several iteration budgets; solutions (bs, len(anytime_checkpoints), n) of the last forward pass
+        self.anytime_checkpoints = sorted(anytime_checkpoints) if anytime_checkpoints else None
+        self.anytime_sols = None
+
         # When running batch testing, mask envs already done, to speed up computation (implemented for robust mpc); initialized at inference time since batch size is not known during initialization
         self.is_active = None
 
@@ -192,11 +255,19 @@ class QPUnrolledNetwork(nn.Module):
         # is_warm_starter_trainable is always False, since the warm starter is trained via another inference independent of the solver
         # When self.fixed_PH == True, the solver is initialized with fixed P, H matrices; otherwise, P, H are not passed to the solver during initialization time, but computed during the forward pass instead
         if not self.fixed_PH:
-            self.solver = QPSolver(self.device, n_qp_actual, m_qp_actual, warm_starter=self.warm_starter_delayed, is_warm_starter_trainable=False, symmetric_constraint=self.symmetric, buffered=self.force_feasible)
+            self.solver = QPSolver(self.device, n_qp_actual, m_qp_actual, warm_starter=self.warm_starter_delayed, is_warm_starter_trainable=False, symmetric_constraint=self.symmetric, buffered=self.force_feasible, screening=self.screening)
         else:
             # Should be called after loading state dict
             Pinv, H = self.get_PH()
-            self.solver = QPSolver(self.device, n_qp_actual, m_qp_actual, Pinv=Pinv.squeeze(0), H=H.squeeze(0), warm_starter=self.warm_starter_delayed, is_warm_starter_trainable=False, symmetric_constraint=self.symmetric, buffered=self.force_feasible)
+            polisher = ActiveSetPolisher(self.device, n_qp_actual, m_qp_actual, H.squeeze(0), Pinv=Pinv.squeeze(0), symmetric_constraint=self.symmetric, buffered=self.force_feasible) if self.polish else None
+            self.solver = QPSolver(self.device, n_qp_actual, m_qp_actual, Pinv=Pinv.squeeze(0), H=H.squeeze(0), warm_starter=self.warm_starter_delayed, is_warm_starter_trainable=False, symmetric_constraint=self.symmetric, buffered=self.force_feasible, polisher=polisher, screening=self.screening)
+
+        if self.bf16_iterations:
+            self.solver.iteration_dtype = torch.bfloat16
+        if self.quantize:
+            # Quantize only the layers producing the QP parameters; P, H (and thus the solver) keep full precision
+            qconfig_spec = {name: torch.ao.quantization.default_dynamic_qconfig for name in ["mlp", "qb_affine_layer"] if getattr(self, name) is not None}
+            torch.ao.quantization.quantize_dynamic(self, qconfig_spec, dtype=torch.qint8, inplace=True)
 
     def compute_warm_starter_loss(self, q, b, Pinv, H, solver_Xs):
         qd, bd, Pinvd, Hd = map(lambda t: t.detach() if t is not None else None, [q, b, Pinv, H])
@@ -204,22 +275,50 @@ class QPUnrolledNetwork(nn.Module):
         gt = solver_Xs[:, -1, :].detach()
         return self.ws_loss_coef * self.ws_loss_shaper(((gt - X0) ** 2).sum(dim=-1).mean())
 
-    def parallel_controller_creation(self, controller_creator, xref_np, bs):
+    def get_temporal_warm_start(self, key, bs):
         """
-        Create robust MPC controlller in parallel
-        """
-        # Helper function for parallel execution
-        def task_creator(index):
-            return controller_creator(self.mpc_baseline, xref_np[index, :])
-
-        with ThreadPoolExecutor() as executor:
-            # Executing the tasks in parallel
-            results = executor.map(task_creator, range(bs))
+        Get the initialization of PDHG from the previous-step solution of each env instance.
 
-        # Collecting the results
-        self.robust_controllers.extend(results)
-
-    def run_mpc_baseline(self, x, use_osqp_oracle=False):
+        Returns: (X0, X0_mask) to be passed to QPSolver, or (None, None) if temporal warm starting is not applicable
+        """
+        X_prev, is_done_prev = self.temporal_cache.get(key, (None, None))
+        if not self.temporal_warm_start or X_prev is None or X_prev.shape[0] != bs or "is_done" not in self.env_info:
+            return None, None
+        # The env resets done instances at the start of its next step, so an instance done now is solved at its terminal state,
+        # and one that was done at the previous step is solved at the first state of a new episode; both start from the default initialization
+        return X_prev, torch.logical_not(self.env_info["is_done"].bool() | is_done_prev)
+
+    def update_temporal_warm_start(self, key, Xs):
+        """Cache the last primal-dual iterate and the done flags of each env instance, if the current forward pass comes from a rollout."""
+        if self.temporal_warm_start and "is_done" in self.env_info:
+            self.temporal_cache[key] = (Xs[:, -1, :].detach(), self.env_info["is_done"].bool().clone())
+
+    def get_mpc_qp(self, x):
+        """
+        Translate the (non-robust) MPC baseline at observations x into the QP form; returns (n, m, P, q, H, b) as mpc2qp.
+        """
+        x0, xref = self.mpc_baseline["obs_to_state_and_ref"](x)
+        t = lambda a: torch.tensor(a, device=x.device, dtype=torch.float)
+        eps = 1e-3
+        return mpc2qp(
+            self.mpc_baseline["n_mpc"],
+            self.mpc_baseline["m_mpc"],
+            self.mpc_baseline["N"],
+            t(self.mpc_baseline["A"]),
+            t(self.mpc_baseline["B"]),
+            t(self.mpc_baseline["Q"]),
+            t(self.mpc_baseline["R"]),
+            self.mpc_baseline["x_min"] + eps,
+            self.mpc_baseline["x_max"] - eps,
+            self.mpc_baseline["u_min"],
+            self.mpc_baseline["u_max"],
+            x0,
+            xref,
+            normalize=self.mpc_baseline.get("normalize", False),
+            Qf=self.mpc_baseline.get("terminal_coef", 0.) * t(np.eye(self.mpc_baseline["n_mpc"])) if self.mpc_baseline.get("Qf", None) is None else t(self.mpc_baseline["Qf"]),
+        )
+
+    def run_mpc_baseline(self, x, use_osqp_oracle=False, use_ip_oracle=False):
         robust_method = self.mpc_baseline.get("robust_method", None)
         x0, xref = self.mpc_baseline["obs_to_state_and_ref"](x)
         bs = x.shape[0]
@@ -231,71 +330,102 @@ class QPUnrolledNetwork(nn.Module):
 
         if robust_method is None:
             # Run vanilla MPC without robustness
-            eps = 1e-3
-            n, m, P, q, H, b = mpc2qp(
-                self.mpc_baseline["n_mpc"],
-                self.mpc_baseline["m_mpc"],
-                self.mpc_baseline["N"],
-                t(self.mpc_baseline["A"]),
-                t(self.mpc_baseline["B"]),
-                t(self.mpc_baseline["Q"]),
-                t(self.mpc_baseline["R"]),
-                self.mpc_baseline["x_min"] + eps,
-                self.mpc_baseline["x_max"] - eps,
-                self.mpc_baseline["u_min"],
-                self.mpc_baseline["u_max"],
-                x0,
-                xref,
-                normalize=self.mpc_baseline.get("normalize", False),
-                Qf=self.mpc_baseline.get("terminal_coef", 0.) * t(np.eye(self.mpc_baseline["n_mpc"])) if self.mpc_baseline.get("Qf", None) is None else t(self.mpc_baseline["Qf"]),
-            )
-            if not use_osqp_oracle:
-                solver = QPSolver(x.device, n, m, P=P, H=H)
-                Xs, primal_sols = solver(q, b, iters=100)
-                sol = primal_sols[:, -1, :]
+            n, m, P, q, H, b = self.get_mpc_qp(x)
+            if use_ip_oracle:
+                if self.mpc_ip_solver is None:
+                    self.mpc_ip_solver = IPQPSolver(x.device, n, m, P=P, H=H)
+                t_start = time.time()
+                sol, _, iter_counts, converged = self.mpc_ip_solver(q, b)
+                sol = sol.to(dtype=q.dtype)
+                if self.telemetry is not None:
+                    if x.is_cuda:
+                        torch.cuda.synchronize(x.device)
+                    # Solves are batched, so the wall time is amortized over the batch
+                    self.telemetry.record(
+                        "ip",
+                        iterations=f(iter_counts),
+                        wall_time=(time.time() - t_start) / bs,
+                        status=np.where(f(converged), STATUS_SOLVED, STATUS_MAX_ITER_REACHED),
+                        instance=np.arange(bs),
+                    )
+            elif not use_osqp_oracle:
+                if self.polish and self.mpc_polisher is None:
+                    self.mpc_polisher = ActiveSetPolisher(x.device, n, m, H, P=P)
+                solver = QPSolver(x.device, n, m, P=P, H=H, polisher=self.mpc_polisher, screening=self.screening)
+                pdhg_iter = self.mpc_baseline.get("pdhg_iter", 100)
+                X0, X0_mask = self.get_temporal_warm_start("mpc", bs)
+                if self.telemetry is None:
+                    Xs, primal_sols = solver(q, b, iters=pdhg_iter, X0=X0, X0_mask=X0_mask)
+                    sol = primal_sols[:, -1, :]
+                else:
+                    t_start = time.time()
+                    Xs, primal_sols, (primal_residual, dual_residual) = solver(q, b, iters=pdhg_iter, return_residuals=True, X0=X0, X0_mask=X0_mask)
+                    sol = primal_sols[:, -1, :]
+                    # Solutions are exact where they were polished or screened
+                    exact = [mask for mask in [solver.last_polished, solver.last_screened] if mask is not None]
+                    if x.is_cuda:
+                        torch.cuda.synchronize(x.device)
+                    # Solves are batched, so the wall time is amortized over the batch
+                    self.telemetry.record(
+                        "pdhg",
+                        iterations=pdhg_iter if solver.last_screened is None else np.where(f(solver.last_screened), 0, pdhg_iter),
+                        wall_time=(time.time() - t_start) / bs,
+                        status=STATUS_MAX_ITER_REACHED if not exact else np.where(f(functools.reduce(torch.logical_or, exact)), STATUS_SOLVED, STATUS_MAX_ITER_REACHED),
+                        primal_residual=f(primal_residual.abs().amax(dim=-1)),
+                        dual_residual=f(dual_residual.abs().amax(dim=-1)),
+                        instance=np.arange(bs),
+                    )
+                self.update_temporal_warm_start("mpc", Xs)
             else:
-                osqp_oracle_with_iter_count = functools.partial(osqp_oracle, return_iter_count=True)
+                osqp_oracle_with_stats = functools.partial(osqp_oracle, return_stats=True)
                 if q.shape[0] > 1:
-                    sol_np, iter_counts = np_batch_op(osqp_oracle_with_iter_count, f(q), f(b), f_sparse(P), f_sparse(H))
+                    sol_np, iter_counts, run_times, statuses, primal_residuals, dual_residuals = np_batch_op(osqp_oracle_with_stats, f(q), f(b), f_sparse(P), f_sparse(H))
                     sol = t(sol_np)
                 else:
-                    sol_np, iter_count = osqp_oracle_with_iter_count(f(q[0, :]), f(b[0, :]), f_sparse(P), f_sparse(H))
+                    sol_np, *stats = osqp_oracle_with_stats(f(q[0, :]), f(b[0, :]), f_sparse(P), f_sparse(H))
                     sol = t(sol_np).unsqueeze(0)
-                    iter_counts = np.array([iter_count])
-                # Save OSQP iteration counts into the info dict
-                if "osqp_iter_counts" not in self.info:
-                    self.info["osqp_iter_counts"] = iter_counts
-                else:
-                    self.info["osqp_iter_counts"] = np.concatenate([self.info["osqp_iter_counts"], iter_counts])
+                    iter_counts, run_times, statuses, primal_residuals, dual_residuals = map(lambda v: np.array([v]), stats)
+                # Save OSQP statistics into the telemetry
+                if self.telemetry is not None:
+                    self.telemetry.record(
+                        "osqp",
+                        iterations=iter_counts,
+                        wall_time=run_times,
+                        status=statuses,
+                        primal_residual=primal_residuals,
+                        dual_residual=dual_residuals,
+                        instance=np.arange(bs),
+                    )
             return sol, (P.unsqueeze(0), q, H.unsqueeze(0), b)
 
         elif robust_method in ["scenario", "tube"]:
             # Set up scenario or tube MPC
-            if not self.robust_controllers:
+            if self.controller_pool is None:
                 # Create a controller for each simulation instance, according to the current reference (note: this assumes that the mapping from instance index to reference is constant)
+                # The controllers are created inside the worker processes, each owning a fixed shard of instances for the whole test
                 controller_creator = {
                     "scenario": scenario_robust_mpc,
                     "tube": tube_robust_mpc,
                 }[robust_method]
                 xref_np = f(xref)
-                self.parallel_controller_creation(controller_creator, xref_np, bs)
+                self.controller_pool = ControllerPool(controller_creator, self.mpc_baseline, xref_np)
                 self.is_active = np.ones((bs,), dtype=bool)
 
             # Get solutions according to current state
             x0_np = f(x0)
             already_on_stats = f(self.env_info.get("already_on_stats", torch.zeros((bs,), dtype=bool))).astype(bool)
             self.is_active = np.logical_not(already_on_stats) & self.is_active   # Skip computation for instances already done
-            get_solution = lambda i: self.robust_controllers[i](x0_np[i, :], is_active=self.is_active[i])
-            sol_np, running_time = np_batch_op(get_solution, np.arange(bs))
+            sol_np, running_time = self.controller_pool.step(x0_np, self.is_active)
             sol = t(sol_np)
 
-            # Save running time to info dict
+            # Save running time to telemetry
             non_zero_mask = running_time != 0.  # Filter out instances that are already done
-            running_time_eff = running_time[non_zero_mask]
-            if "running_time" not in self.info:
-                self.info["running_time"] = running_time_eff
-            else:
-                self.info["running_time"] = np.concatenate([self.info["running_time"], running_time_eff])
+            if self.telemetry is not None:
+                self.telemetry.record(
+                    {"scenario": "do_mpc", "tube": "cvxpy"}[robust_method],
+                    wall_time=running_time[non_zero_mask],
+                    instance=np.arange(bs)[non_zero_mask],
+                )
 
             return sol, None
 
@@ -371,11 +501,44 @@ class QPUnrolledNetwork(nn.Module):
 
         return q, b
 
+    @torch.no_grad()
+    def fold(self):
+        """
+        Fold the policy into a FoldedQPPolicy for fast inference.
+
+        Requires fixed P, H (test mode with shared_PH), affine (q, b), no MPC baseline and no warm starter, so that the maps obs -> B and (z, obs) -> x are affine.
+        The affine maps are recovered exactly by evaluating the original pipeline at obs = 0 and at the unit vectors.
+        """
+        assert self.fixed_PH, "Folding requires shared_PH in test mode"
+        assert self.affine_qb, "Folding requires affine q, b"
+        assert self.mpc_baseline is None, "Folding is not applicable to the MPC baseline"
+        assert self.warm_starter_delayed is None, "Folding does not support the warm starter"
+        if self.solver is None:
+            self.initialize_solver()
+        solver = self.solver
+
+        # Observations 0, e_1, ..., e_{input_size}
+        obs = torch.cat([torch.zeros((1, self.input_size), device=self.device), torch.eye(self.input_size, device=self.device)], dim=0)
+        q, b = self.get_qb(obs)
+        A, B = solver.get_AB(q, b)
+        c_B = B[0, :]
+        W_B = (B[1:, :] - c_B).t()
+
+        # Primal solution at z = 0 for each observation, and at z = e_1, ..., e_m for obs = 0
+        sol_obs = solver.get_sol(torch.zeros((self.input_size + 1, solver.m), device=self.device), q, b)
+        c_x = sol_obs[0, :]
+        W_obs = (sol_obs[1:, :] - c_x).t()
+        z = torch.cat([torch.zeros((1, solver.m), device=self.device), torch.eye(solver.m, device=self.device)], dim=0)
+        sol_z = solver.get_sol(z, q[:1, :].expand(solver.m + 1, -1), b[:1, :].expand(solver.m + 1, -1))
+        W_z = (sol_z[1:, :] - sol_z[0, :]).t()
+
+        return FoldedQPPolicy(A.squeeze(0), W_B, c_B, W_z, W_obs, c_x, self.qp_iter, symmetric_constraint=self.symmetric, buffered=self.force_feasible)
+
     def forward(self, x, return_problem_params=False, info=None):
         if info is not None:
             self.env_info = info
         if self.mpc_baseline is not None:
-            mpc_sol, mpc_problem_params = self.run_mpc_baseline(x, use_osqp_oracle=self.use_osqp_for_mpc)
+            mpc_sol, mpc_problem_params = self.run_mpc_baseline(x, use_osqp_oracle=self.use_osqp_for_mpc, use_ip_oracle=self.use_ip_for_mpc)
 
         if (self.mpc_baseline is not None) and (not self.imitate_mpc):
             # MPC solution is directly used as the final solution
@@ -395,26 +558,38 @@ class QPUnrolledNetwork(nn.Module):
 
             # Compute P, H, if they are not fixed
             if not self.fixed_PH:
-                Pinv, H = self.get_PH(mlp_out)
+                Pinv, H = self.get_PH(mlp_out) if not self.shared_PH else self.PH_cache()
             else:
                 Pinv, H = None, None
 
             # Compute q, b
             q, b = self.get_qb(x, mlp_out)
 
-            # Update parameters of warm starter with a delay to stabilize training
+            # Update parameters of warm starter with a delay to stabilize training; no-op unless the optimizer has stepped since the last update
             if self.train_warm_starter:
-                self.warm_starter_delayed.load_state_dict(interpolate_state_dicts(self.warm_starter_delayed.state_dict(), self.warm_starter.state_dict(), self.ws_update_rate))
+                self.ws_averager.maybe_update()
 
             # Run solver forward
+            X0, X0_mask = self.get_temporal_warm_start("qp", bs)
+            checkpoints = self.anytime_checkpoints
+            qp_iter = self.qp_iter if checkpoints is None else checkpoints[-1]
             if self.use_residual_loss:
-                Xs, primal_sols, residuals = self.solver(q, b, Pinv=Pinv, H=H, iters=self.qp_iter, return_residuals=True)
+                Xs, primal_sols, residuals = self.solver(q, b, Pinv=Pinv, H=H, iters=qp_iter, return_residuals=True, X0=X0, X0_mask=X0_mask, checkpoints=checkpoints)
                 primal_residual, dual_residual = residuals
                 residual_loss = ((primal_residual ** 2).sum(dim=-1) + (dual_residual ** 2).sum(dim=-1)).mean()
                 self.autonomous_losses["residual"] = 1e-3 * residual_loss
             else:
-                Xs, primal_sols = self.solver(q, b, Pinv=Pinv, H=H, iters=self.qp_iter)
-            sol = primal_sols[:, -1, :]
+                Xs, primal_sols = self.solver(q, b, Pinv=Pinv, H=H, iters=qp_iter, X0=X0, X0_mask=X0_mask, checkpoints=checkpoints)
+            if checkpoints is None:
+                sol = primal_sols[:, -1, :]
+                self.update_temporal_warm_start("qp", Xs)
+            else:
+                # Instance i acts with the solution at checkpoint i % len(checkpoints), and continues from the iterate at that checkpoint
+                self.anytime_sols = primal_sols
+                rows = torch.arange(bs, device=x.device)
+                budget_index = rows % len(checkpoints)
+                sol = primal_sols[rows, budget_index, :]
+                self.update_temporal_warm_start("qp", Xs[rows, torch.tensor(checkpoints, device=x.device)[budget_index], :].unsqueeze(1))
 
             # Compute warm starter loss
             if self.train_warm_starter:
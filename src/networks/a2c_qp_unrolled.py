@@ -3,6 +3,7 @@ from torch import nn
 import torch.nn.functional as F
 from rl_games.algos_torch.network_builder import NetworkBuilder, A2CBuilder
 from ..modules.qp_unrolled_network import QPUnrolledNetwork
+from ..utils.telemetry import SolverTelemetry
 import atexit
 from datetime import datetime
 import os
@@ -33,6 +34,13 @@ class A2CQPUnrolled(A2CBuilder.Network):
             }
             return self._build_mlp(**policy_mlp_args)
 
+        # When testing the MPC baseline, per-solve telemetry is flushed to disk incrementally during the test
+        if self.mpc_baseline is not None and self.is_test:
+            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+            telemetry = SolverTelemetry(filename=os.path.join('test_results', f"{self.run_name}_solver_telemetry_{timestamp}.csv"))
+        else:
+            telemetry = None
+
         self.policy_net = QPUnrolledNetwork(
             self.device,
             self.n_obs,
@@ -52,11 +60,19 @@ class A2CQPUnrolled(A2CBuilder.Network):
             ws_update_rate=self.ws_update_rate,
             mpc_baseline=self.mpc_baseline,
             use_osqp_for_mpc=self.use_osqp_for_mpc,
+            use_ip_for_mpc=self.use_ip_for_mpc,
             use_residual_loss=self.use_residual_loss,
             imitate_mpc=self.imitate_mpc,
             force_feasible=self.force_feasible,
             feasible_lambda=self.feasible_lambda,
             is_test=self.is_test,
+            telemetry=telemetry,
+            temporal_warm_start=self.temporal_warm_start,
+            polish=self.polish,
+            screening=self.screening,
+            anytime_checkpoints=self.anytime_checkpoints,
+            quantize=self.quantize,
+            bf16_iterations=self.bf16_iterations,
         )
 
         # TODO: exploit structure in value function?
@@ -90,21 +106,25 @@ class A2CQPUnrolled(A2CBuilder.Network):
     def cleanup(self):
         # Implement the housekeeping logic here
         # For example, dumping internal state to a file
+        telemetry = self.policy_net.telemetry
+        if telemetry is None:
+            return
         directory = 'test_results'
         if not os.path.exists(directory):
             os.makedirs(directory)
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        telemetry.flush()
         if self.mpc_baseline is not None and self.use_osqp_for_mpc:
             # When MPC is run using OSQP, dump the iteration counts (collected by QPUnrolledNetwork) to CSV
             tag = f"{self.run_name}_mpc_iter_count"
             filename = os.path.join(directory, f"{tag}_{timestamp}.csv")
-            iter_counts = self.policy_net.info['osqp_iter_counts']
+            iter_counts = telemetry.query('iterations', backend='osqp')
             np.savetxt(filename, iter_counts, fmt='%d')
         if self.mpc_baseline is not None and self.mpc_baseline.get("robust_method", None) is not None:
             # When robust MPC is used, dump the per-step times (collected by QPUnrolledNetwork) to CSV
             tag = f"{self.run_name}_running_time"
             filename = os.path.join(directory, f"{tag}_{timestamp}.csv")
-            running_time = self.policy_net.info['running_time']
+            running_time = telemetry.query('wall_time', backend=['do_mpc', 'cvxpy'])
             np.savetxt(filename, running_time, fmt='%f')
 
     def forward(self, obs_dict):
@@ -138,12 +158,19 @@ class A2CQPUnrolled(A2CBuilder.Network):
         self.ws_update_rate = params["custom"]["ws_update_rate"]
         self.mpc_baseline = params["custom"]["mpc_baseline"]
         self.use_osqp_for_mpc = params["custom"]["use_osqp_for_mpc"]
+        self.use_ip_for_mpc = params["custom"]["use_ip_for_mpc"]
         self.use_residual_loss = params["custom"]["use_residual_loss"]
         self.imitate_mpc = params["custom"]["imitate_mpc"]
         self.force_feasible = params["custom"]["force_feasible"]
         self.feasible_lambda = params["custom"]["feasible_lambda"]
         self.is_test = params["custom"]["train_or_test"] == "test"
         self.run_name = params["custom"]["run_name"]
+        self.temporal_warm_start = params["custom"]["temporal_warm_start"]
+        self.polish = params["custom"]["polish"]
+        self.screening = params["custom"]["screening"]
+        self.anytime_checkpoints = params["custom"]["anytime_checkpoints"]
+        self.quantize = params["custom"]["quantize"]
+        self.bf16_iterations = params["custom"]["bf16_iterations"]
 
 class A2CQPUnrolledBuilder(NetworkBuilder):
     def __init__(self, **kwargs):
@@ -0,0 +1,40 @@
+import pandas as pd
+
+
+def summarize_interleaved(stats, labels, label_name, penalty=100000):
+    """
+    Summarizes the episode statistics of a batch test run where env instance i is run with configuration labels[i % len(labels)] (e.g., an iteration budget or a checkpoint).
+
+    Parameters:
+    stats (pd.DataFrame): Episode statistics written by the env (columns 'i', 'episode_length', 'cumulative_cost', 'constraint_violated').
+    labels (list): Configurations, in the order in which they are interleaved over the instances.
+    label_name (str): Name of the column holding the labels in the summary.
+    penalty (float): Cost added per constraint violation in the penalized average cost.
+
+    Returns:
+    pd.DataFrame: One row per configuration with the number of episodes, average cost per step (plain and penalized), and frequency of constraint violation per step.
+    """
+    group = stats["i"] % len(labels)
+    rows = []
+    for index, label in enumerate(labels):
+        df = stats[group == index]
+        steps = df["episode_length"].sum()
+        violations = df["constraint_violated"].astype(bool).sum()
+        rows.append({
+            label_name: label,
+            "episodes": len(df),
+            "avg_cost": df["cumulative_cost"].sum() / steps,
+            "avg_cost_penalized": (df["cumulative_cost"].sum() + penalty * violations) / steps,
+            "violation_freq": violations / steps,
+        })
+    return pd.DataFrame(rows)
+
+
+def summarize_by_budget(stats, checkpoints, penalty=100000):
+    """
+    Summarizes the episode statistics of a batch test run with anytime inference, where env instance i acts with the QP solution after checkpoints[i % len(checkpoints)] PDHG iterations.
+
+    Returns:
+    pd.DataFrame: See summarize_interleaved, with the budgets in column 'qp_iter'.
+    """
+    return summarize_interleaved(stats, checkpoints, "qp_iter", penalty=penalty)
@@ -0,0 +1,181 @@
+import numpy as np
+import torch
+from scipy.optimize import linprog
+
+from ..modules.qp_unrolled_network import QPUnrolledNetwork
+from ..modules.explicit_policy import get_affine_qp
+from ..modules.ip_solver import IPQPSolver
+
+
+def _one_sided_to_row(net):
+    """Map each one-sided constraint (see get_affine_qp) to the row of the learned H it comes from; the row of the slack variable (force_feasible) maps to -1."""
+    rows = np.arange(net.m_qp)
+    slack = [-1] if net.force_feasible else []
+    if net.symmetric:
+        # Lower and upper sides of each row
+        rows = np.concatenate([rows, rows])
+    return np.concatenate([rows, slack]).astype(int)
+
+
+def active_rows_on_dataset(net, observations, active_tol=1e-6, chunk_size=65536):
+    """
+    Rows of H that are active at the exact QP solution for at least one observation.
+    Observations whose QP the solver does not solve to tolerance (e.g., infeasible ones) count as having all rows active, so that no row is pruned on the basis of an unreliable active set.
+
+    Parameters:
+    net (QPUnrolledNetwork): Policy with shared_PH and affine_qb.
+    observations (torch.Tensor): Network inputs, shape (N, input_size), e.g., collected from rollouts.
+    active_tol (float): Threshold on the multipliers for a constraint to be considered active.
+    chunk_size (int): Number of QPs solved at once.
+
+    Returns:
+    np.ndarray: Boolean mask of shape (m_qp,).
+    """
+    P, q0, Wq, G, g0, Wg = get_affine_qp(net)
+    oracle = IPQPSolver("cpu", P.shape[0], G.shape[0], P=P, H=G)
+    row_of = _one_sided_to_row(net)
+    active = np.zeros((net.m_qp,), dtype=bool)
+    for obs in observations.detach().cpu().double().split(chunk_size):
+        q = torch.tensor(q0).unsqueeze(0) + obs @ torch.tensor(Wq).T
+        g = torch.tensor(g0).unsqueeze(0) + obs @ torch.tensor(Wg).T
+        _, lam, _, converged = oracle(q, g)
+        ever_active = ((lam > active_tol) | ~converged.unsqueeze(-1)).any(dim=0).numpy()
+        active[row_of[ever_active & (row_of >= 0)]] = True
+    return active
+
+
+def redundant_rows_on_box(net, obs_low, obs_high, tol=1e-9):
+    """
+    Rows of H that are provably never active for observations in the box [obs_low, obs_high]: each of their one-sided constraints is implied by the remaining constraints, for every observation in the box.
+
+    Rows are tested one at a time against the constraints that remain, so that all the returned rows can be removed together.
+    Each test is an LP over (x, obs): minimize the slack of the constraint subject to the other constraints; the constraint is implied if the minimum is nonnegative.
+
+    Returns:
+    np.ndarray: Boolean mask of shape (m_qp,).
+    """
+    _, _, _, G, g0, Wg = get_affine_qp(net)
+    row_of = _one_sided_to_row(net)
+    n = G.shape[1]
+    bounds = [(None, None)] * n + list(zip(obs_low, obs_high))
+    remaining = np.ones((G.shape[0],), dtype=bool)
+    redundant = np.zeros((net.m_qp,), dtype=bool)
+    for row in range(net.m_qp):
+        sides = np.flatnonzero(row_of == row)
+        others = remaining.copy()
+        others[sides] = False
+        A_ub = -np.concatenate([G[others], Wg[others]], axis=1)
+        implied = True
+        for i in sides:
+            res = linprog(np.concatenate([G[i], Wg[i]]), A_ub=A_ub, b_ub=g0[others], bounds=bounds, method="highs")
+            if not res.success or res.fun + g0[i] < -tol:
+                implied = False
+                break
+        if implied:
+            redundant[row] = True
+            remaining = others
+    return redundant
+
+
+def reduce_network(net, keep):
+    """
+    Build a QPUnrolledNetwork with only the selected rows of H (and of b).
+
+    Parameters:
+    net (QPUnrolledNetwork): Policy with shared_PH and affine_qb.
+    keep (np.ndarray): Boolean mask of shape (m_qp,) of the rows to keep.
+
+    Returns:
+    QPUnrolledNetwork: Reduced network with m_qp = keep.sum(); the warm starter, which depends on m_qp, is not carried over.
+    """
+    assert net.shared_PH and net.affine_qb, "Requires shared_PH and affine_qb"
+    keep_idx = torch.as_tensor(np.flatnonzero(keep), device=net.device)
+    reduced = QPUnrolledNetwork(
+        net.device, net.input_size, net.n_qp, len(keep_idx), net.qp_iter, None,
+        shared_PH=True,
+        affine_qb=True,
+        strict_affine_layer=net.strict_affine_layer,
+        obs_has_half_ref=net.obs_has_half_ref,
+        symmetric=net.symmetric,
+        no_b=net.no_b,
+        force_feasible=net.force_feasible,
+        feasible_lambda=net.feasible_lambda,
+        is_test=net.fixed_PH,
+        temporal_warm_start=net.temporal_warm_start,
+        polish=net.polish,
+        screening=net.screening,
+    )
+    with torch.no_grad():
+        reduced.P_params.copy_(net.P_params)
+        reduced.H_params.copy_(net.H_params.view(net.m_qp, net.n_qp)[keep_idx].flatten())
+        if not net.strict_affine_layer:
+            # Output of the affine layer is (q, b)
+            out_idx = torch.cat([torch.arange(net.n_q_param, device=net.device), net.n_q_param + keep_idx]) if not net.no_b else torch.arange(net.n_q_param, device=net.device)
+            reduced.qb_affine_layer.weight.copy_(net.qb_affine_layer.weight[out_idx])
+            if net.qb_affine_layer.bias is not None:
+                reduced.qb_affine_layer.bias.copy_(net.qb_affine_layer.bias[out_idx])
+        else:
+            reduced.qb_affine_layer.q_layer.load_state_dict(net.qb_affine_layer.q_layer.state_dict())
+            reduced.qb_affine_layer.b_layer.weight.copy_(net.qb_affine_layer.b_layer.weight[keep_idx])
+            reduced.qb_affine_layer.b_layer.bias.copy_(net.qb_affine_layer.b_layer.bias[keep_idx])
+    return reduced
+
+
+def prune_constraints(net, observations=None, obs_low=None, obs_high=None, active_tol=1e-6, tol=1e-4, num_check_samples=10000, seed=0):
+    """
+    Remove rows of H that are never active, while keeping the actions of the reduced policy within tol of the original ones.
+
+    A row is removed if it is never active at the exact QP solution over the observations (when given),
+    or provably redundant over the box [obs_low, obs_high] (when given); at least one of the two must be given.
+
+    Note: Removing such rows leaves the exact QP solution unchanged, but PDHG with fixed iterations runs on a different iteration matrix,
+    so the actions of the reduced policy are compared against the original one on the observations (or on random samples of the box).
+    While the max deviation exceeds tol, the pruned row whose restoration reduces it the most is put back;
+    with all rows restored the reduced policy is the original one, so this always ends within tol.
+
+    Parameters:
+    tol (float): Tolerance on the max absolute difference of the primal solutions; float("inf") keeps all the prunable rows pruned.
+
+    Returns:
+    tuple: Reduced QPUnrolledNetwork, and a report dict with keys "kept_rows", "pruned_rows", "restored_rows" (prunable rows put back to meet tol), "max_deviation" (max absolute difference of the primal solutions).
+    """
+    assert observations is not None or obs_low is not None, "Either observations or the observation box must be given"
+    prunable = np.zeros((net.m_qp,), dtype=bool)
+    if observations is not None:
+        prunable |= ~active_rows_on_dataset(net, observations, active_tol=active_tol)
+    if obs_low is not None:
+        prunable |= redundant_rows_on_box(net, np.asarray(obs_low, dtype=np.float64), np.asarray(obs_high, dtype=np.float64))
+    keep = ~prunable
+
+    if observations is not None:
+        check_obs = observations.to(device=net.device, dtype=torch.float)
+    else:
+        rng = np.random.default_rng(seed)
+        check_obs = torch.tensor(obs_low + (np.asarray(obs_high) - obs_low) * rng.random((num_check_samples, net.input_size)), device=net.device, dtype=torch.float)
+    with torch.no_grad():
+        reference = net(check_obs)[:, :net.n_qp]
+
+    def deviation_of(reduced):
+        with torch.no_grad():
+            return (reference - reduced(check_obs)[:, :net.n_qp]).abs().max().item()
+
+    reduced = reduce_network(net, keep)
+    deviation = deviation_of(reduced)
+    restored = []
+    while deviation > tol and not keep.all():
+        candidates = []
+        for row in np.flatnonzero(~keep):
+            trial = keep.copy()
+            trial[row] = True
+            candidate = reduce_network(net, trial)
+            candidates.append((deviation_of(candidate), row, candidate))
+        deviation, row, reduced = min(candidates, key=lambda t: t[:2])
+        keep[row] = True
+        restored.append(row)
+    report = {
+        "kept_rows": np.flatnonzero(keep),
+        "pruned_rows": np.flatnonzero(~keep),
+        "restored_rows": np.array(restored, dtype=int),
+        "max_deviation": deviation,
+    }
+    return reduced, report
@@ -0,0 +1,148 @@
+import numpy as np
+import os
+import atexit
+import traceback
+import multiprocessing as mp
+
+
+def _as_array(raw, shape, dtype):
+    """
+    Wraps a shared ctypes buffer as a NumPy array without copying.
+
+    Parameters:
+    raw (multiprocessing.RawArray): Shared buffer.
+    shape (tuple): Shape of the array.
+    dtype (np.dtype): Data type matching the ctypes type of the buffer.
+
+    Returns:
+    np.ndarray: View of the shared buffer.
+    """
+    return np.frombuffer(raw, dtype=dtype).reshape(shape)
+
+def _pool_worker(conn, controller_creator, mpc_baseline_parameters, xref, indices, buffers, shapes):
+    """
+    Worker loop owning the controllers of a fixed shard of simulation instances.
+
+    The controllers are created inside the worker and live there for the whole test, so that their internal state (e.g., the initial guess of the solver) carries over between steps.
+    Each step, the worker reads the states of its shard from shared memory, and writes back the actions and running times.
+
+    Parameters:
+    conn (multiprocessing.connection.Connection): Pipe used to receive commands and report completion.
+    controller_creator (callable): Function mapping (mpc_baseline_parameters, xref) to a controller, e.g., scenario_robust_mpc.
+    mpc_baseline_parameters (dict): Parameters of the MPC baseline.
+    xref (np.ndarray): References of all instances, shape (bs, n).
+    indices (np.ndarray): Indices of the instances owned by this worker.
+    buffers (tuple): Shared buffers for states, actions, running times and active flags.
+    shapes (tuple): Shapes of the shared buffers.
+    """
+    try:
+        raw_states, raw_actions, raw_running_times, raw_is_active = buffers
+        shape_states, shape_actions, shape_running_times = shapes
+        states = _as_array(raw_states, shape_states, np.float64)
+        actions = _as_array(raw_actions, shape_actions, np.float64)
+        running_times = _as_array(raw_running_times, shape_running_times, np.float64)
+        is_active = _as_array(raw_is_active, shape_running_times, np.uint8)
+        controllers = [controller_creator(mpc_baseline_parameters, xref[i, :]) for i in indices]
+        conn.send(None)
+    except Exception:
+        conn.send(traceback.format_exc())
+        return
+
+    while True:
+        command = conn.recv()
+        if command == "stop":
+            break
+        try:
+            for i, controller in zip(indices, controllers):
+                actions[i, :], running_times[i] = controller(states[i, :], is_active=bool(is_active[i]))
+            conn.send(None)
+        except Exception:
+            conn.send(traceback.format_exc())
+    conn.close()
+
+
+class ControllerPool():
+    """
+    Pool of worker processes, each owning the robust MPC controllers of a fixed shard of simulation instances.
+
+    Unlike np_batch_op, which ships closures capturing the controllers to the workers at every step, the controllers are created once inside the workers,
+    and only the states, actions and running times are exchanged through shared memory.
+    """
+    def __init__(self, controller_creator, mpc_baseline_parameters, xref, max_workers=int(os.environ.get("MAX_CPU_WORKERS", 8))):
+        """
+        Parameters:
+        controller_creator (callable): Function mapping (mpc_baseline_parameters, xref) to a controller; the controller maps (x0, is_active) to (u0, running_time).
+        mpc_baseline_parameters (dict): Parameters of the MPC baseline; must contain n_mpc and m_mpc.
+        xref (np.ndarray): References of all instances, shape (bs, n_mpc); the mapping from instance index to reference is assumed to be constant.
+        max_workers (int): Maximum number of worker processes.
+        """
+        bs = xref.shape[0]
+        n = mpc_baseline_parameters["n_mpc"]
+        m = mpc_baseline_parameters["m_mpc"]
+        self.bs = bs
+        shapes = ((bs, n), (bs, m), (bs,))
+        buffers = (
+            mp.RawArray('d', bs * n),
+            mp.RawArray('d', bs * m),
+            mp.RawArray('d', bs),
+            mp.RawArray('B', bs),
+        )
+        self._states = _as_array(buffers[0], shapes[0], np.float64)
+        self._actions = _as_array(buffers[1], shapes[1], np.float64)
+        self._running_times = _as_array(buffers[2], shapes[2], np.float64)
+        self._is_active = _as_array(buffers[3], shapes[2], np.uint8)
+
+        # Fork so that the controller creator and the parameters (which may contain lambdas) need not be pickled
+        ctx = mp.get_context("fork")
+        self._conns = []
+        self._processes = []
+        for indices in np.array_split(np.arange(bs), min(max_workers, bs)):
+            parent_conn, child_conn = ctx.Pipe()
+            process = ctx.Process(
+                target=_pool_worker,
+                args=(child_conn, controller_creator, mpc_baseline_parameters, xref, indices, buffers, shapes),
+                daemon=True,
+            )
+            process.start()
+            child_conn.close()
+            self._conns.append(parent_conn)
+            self._processes.append(process)
+        self._gather()
+        atexit.register(self.close)
+
+    def _gather(self):
+        """Wait for all workers to finish the current command, and re-raise the first failure."""
+        errors = [conn.recv() for conn in self._conns]
+        errors = [e for e in errors if e is not None]
+        if errors:
+            raise RuntimeError(f"Controller pool worker failed:\n{errors[0]}")
+
+    def step(self, x0, is_active):
+        """
+        Compute actions for all instances.
+
+        Parameters:
+        x0 (np.ndarray): Current states, shape (bs, n_mpc).
+        is_active (np.ndarray): Boolean mask of shape (bs,); inactive instances are skipped and return zero action and zero running time.
+
+        Returns:
+        tuple: Actions of shape (bs, m_mpc) and running times of shape (bs,).
+        """
+        self._states[:] = x0
+        self._is_active[:] = is_active
+        for conn in self._conns:
+            conn.send("step")
+        self._gather()
+        return self._actions.copy(), self._running_times.copy()
+
+    def close(self):
+        """Stop the workers. Safe to call multiple times."""
+        for conn, process in zip(self._conns, self._processes):
+            if process.is_alive():
+                try:
+                    conn.send("stop")
+                except (BrokenPipeError, OSError):
+                    pass
+            process.join(timeout=1)
+        self._conns = []
+        self._processes = []
@@ -0,0 +1,210 @@
+import asyncio
+import collections
+import concurrent.futures
+import json
+import os
+import time
+import numpy as np
+import torch
+
+
+def load_exported_policy(filename, device="cpu"):
+    """
+    Load a policy exported in TorchScript format (see export_policy), which maps raw observations (bs, input_size) to actions (bs, actions_num).
+    """
+    policy = torch.jit.load(filename, map_location=device)
+    policy.eval()
+    return policy
+
+
+class ControllerServer():
+    """
+    Local asyncio service computing actions for many plants with one batched policy forward.
+
+    Clients connect over a Unix socket or TCP on localhost, and exchange newline-delimited JSON messages:
+    - {"id": ..., "obs": [...]} -> {"id": ..., "action": [...]}
+    - {"cmd": "reload", "path": ...} -> {"reloaded": path}; the path is optional and defaults to the current checkpoint
+    - {"cmd": "stats"} -> latency percentiles and batch sizes, see statistics()
+    Errors are reported as {"id": ..., "error": message}; malformed observations are rejected before batching, so they only fail their own request.
+
+    Observation requests are coalesced into micro-batches: a batch is dispatched when it reaches max_batch requests, or max_latency seconds after its first request arrived.
+    The forward pass runs on a single worker thread, so batches and reloads are serialized and the event loop keeps accepting requests meanwhile.
+    The checkpoint file is also reloaded automatically when its modification time changes.
+    """
+    def __init__(self, checkpoint, loader=load_exported_policy, device="cpu", max_batch=256, max_latency=1e-3, history=100000, input_size=None):
+        """
+        Parameters:
+        checkpoint (str): Path of the policy file.
+        loader (callable): Function mapping (path, device) to a policy, i.e., a callable from observations (bs, input_size) to actions (bs, actions_num).
+        device (str): PyTorch device of the forward pass.
+        max_batch (int): Maximum number of requests per forward pass.
+        max_latency (float): Maximum time a request waits for its batch to fill, in seconds.
+        history (int): Number of latest requests kept for the latency statistics.
+        input_size (int): Dimension of the observation; if None, it is set by the first valid observation request.
+        """
+        self.checkpoint = checkpoint
+        self.loader = loader
+        self.device = device
+        self.max_batch = max_batch
+        self.max_latency = max_latency
+        self.input_size = input_size
+        self.policy = loader(checkpoint, device)
+        self.checkpoint_mtime = os.path.getmtime(checkpoint)
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+        self.queue = None
+        self.latencies = collections.deque(maxlen=history)
+        self.batch_sizes = collections.deque(maxlen=history)
+        self.num_reloads = 0
+
+    def statistics(self):
+        """
+        Returns:
+        dict: Number of requests in the history, percentiles of the per-request latency (from arrival to response, in seconds), mean batch size, and number of reloads.
+        """
+        latencies = np.array(self.latencies)
+        percentiles = np.percentile(latencies, [50, 90, 99, 100]) if len(latencies) else [np.nan] * 4
+        return {
+            "requests": len(latencies),
+            "latency_p50": float(percentiles[0]),
+            "latency_p90": float(percentiles[1]),
+            "latency_p99": float(percentiles[2]),
+            "latency_max": float(percentiles[3]),
+            "mean_batch_size": float(np.mean(self.batch_sizes)) if len(self.batch_sizes) else np.nan,
+            "reloads": self.num_reloads,
+        }
+
+    def _reload(self, checkpoint):
+        """Load a policy and swap it in; runs on the worker thread."""
+        self.policy = self.loader(checkpoint, self.device)
+        self.checkpoint = checkpoint
+        self.checkpoint_mtime = os.path.getmtime(checkpoint)
+        self.num_reloads += 1
+
+    def _forward(self, observations):
+        """Compute the actions of a batch; runs on the worker thread."""
+        try:
+            mtime = os.path.getmtime(self.checkpoint)
+            if mtime != self.checkpoint_mtime:
+                try:
+                    self._reload(self.checkpoint)
+                except Exception:
+                    # Keep serving the current policy (e.g., the file is still being written); retried when the file changes again
+                    self.checkpoint_mtime = mtime
+        except OSError:
+            # The file is missing (e.g., deleted to be rewritten); keep serving the current policy
+            pass
+        obs = torch.tensor(np.stack(observations), dtype=torch.float, device=self.device)
+        with torch.no_grad():
+            return self.policy(obs).cpu().numpy()
+
+    async def batcher(self):
+        """Collect requests into batches, run the forward pass, and scatter the actions back to the requests."""
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            deadline = batch[0][2] + self.max_latency
+            while len(batch) < self.max_batch:
+                timeout = deadline - time.perf_counter()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            observations, futures, arrivals = zip(*batch)
+            try:
+                actions = await loop.run_in_executor(self.executor, self._forward, observations)
+            except Exception as e:
+                for future in futures:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            for future, action in zip(futures, actions):
+                if not future.done():
+                    future.set_result(action)
+            self.batch_sizes.append(len(batch))
+
+    def parse_observation(self, obs):
+        """Convert the observation of a request to a float32 vector of dimension input_size; raises ValueError if it is malformed."""
+        try:
+            obs = np.asarray(obs, dtype=np.float32)
+        except (TypeError, ValueError):
+            raise ValueError("obs must be a list of numbers")
+        if obs.ndim != 1:
+            raise ValueError(f"obs must be a flat list, got shape {obs.shape}")
+        if not np.all(np.isfinite(obs)):
+            raise ValueError("obs must be finite")
+        if self.input_size is None:
+            self.input_size = obs.shape[0]
+        if obs.shape[0] != self.input_size:
+            raise ValueError(f"obs must have {self.input_size} elements, got {obs.shape[0]}")
+        return obs
+
+    async def handle_message(self, message):
+        """Process one request; returns the response."""
+        if "cmd" in message:
+            loop = asyncio.get_running_loop()
+            if message["cmd"] == "reload":
+                path = message.get("path", self.checkpoint)
+                await loop.run_in_executor(self.executor, self._reload, path)
+                return {"reloaded": path}
+            elif message["cmd"] == "stats":
+                return self.statistics()
+            raise ValueError(f"Unknown command {message['cmd']}")
+        t_arrival = time.perf_counter()
+        obs = self.parse_observation(message.get("obs"))
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((obs, future, t_arrival))
+        action = await future
+        self.latencies.append(time.perf_counter() - t_arrival)
+        return {"id": message.get("id"), "action": action.tolist()}
+
+    async def handle_client(self, reader, writer):
+        """Serve the requests of one connection; requests are processed concurrently, so that a client can pipeline them."""
+        lock = asyncio.Lock()
+        async def respond(line):
+            message = None
+            try:
+                message = json.loads(line)
+                if not isinstance(message, dict):
+                    raise ValueError("request must be a JSON object")
+                response = await self.handle_message(message)
+            except Exception as e:
+                # Malformed lines get an error response; the connection stays open for the following requests
+                response = {"error": str(e)}
+                if isinstance(message, dict):
+                    response = {"id": message.get("id"), **response}
+            async with lock:
+                writer.write((json.dumps(response) + "\n").encode())
+                await writer.drain()
+
+        tasks = set()
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                task = asyncio.create_task(respond(line))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            if tasks:
+                await asyncio.gather(*tasks)
+        finally:
+            writer.close()
+
+    async def serve(self, unix_path=None, host="127.0.0.1", port=8765):
+        """Run the service until cancelled; listens on unix_path if given, and on (host, port) otherwise."""
+        self.queue = asyncio.Queue()
+        batcher = asyncio.create_task(self.batcher())
+        if unix_path is not None:
+            if os.path.exists(unix_path):
+                os.remove(unix_path)
+            server = await asyncio.start_unix_server(self.handle_client, path=unix_path)
+        else:
+            server = await asyncio.start_server(self.handle_client, host=host, port=port)
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            batcher.cancel()
+            self.executor.shutdown(wait=False)
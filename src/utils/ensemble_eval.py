@@ -0,0 +1,101 @@
+import copy
+import torch
+from torch import nn
+from torch.func import stack_module_state, functional_call, vmap
+
+from ..modules.qp_solver import QPSolver, pdhg_project
+from .torch_utils import bmv
+from .anytime_stats import summarize_interleaved
+
+
+class _QPPolicyFunction(nn.Module):
+    """
+    Stateless forward pass of a QPUnrolledNetwork (learned QP only), computing P, H from the parameters on every call and running PDHG out of place.
+    Used as the base module of functional_call, since the forward pass of the network caches P, H and writes into preallocated buffers, which vmap does not support.
+    """
+    def __init__(self, net):
+        super().__init__()
+        assert net.mpc_baseline is None, "The MPC baseline has no parameters to evaluate"
+        self.net = net
+        n = net.n_qp + 1 if net.force_feasible else net.n_qp
+        self.m = net.m_qp + 1 if net.force_feasible else net.m_qp
+        # Only used for get_AB and get_sol_transform with P, H given per call
+        self.solver_template = QPSolver(net.device, n, self.m, symmetric_constraint=net.symmetric, buffered=net.force_feasible, keep_X=False)
+
+    def forward(self, x):
+        net = self.net
+        solver = self.solver_template
+        mlp_out = net.mlp(x) if net.mlp is not None else None
+        Pinv, H = net.get_PH(mlp_out)
+        q, b = net.get_qb(x, mlp_out)
+        A, B = solver.get_AB(q, b, H=H, Pinv=Pinv)
+        get_sol = solver.get_sol_transform(H, bPinv=Pinv)
+        X = torch.zeros((x.shape[0], 2 * self.m), device=x.device)
+        for _ in range(net.qp_iter):
+            X = bmv(A, X) + B
+            X = pdhg_project(X, self.m, net.symmetric, net.force_feasible, inplace=False)
+        return get_sol(X[:, self.m:], q, b)
+
+
+class EnsembleQPPolicy():
+    """
+    K QPUnrolledNetworks of the same architecture (e.g., checkpoints of different epochs or seeds) evaluated in one batched forward pass,
+    by stacking their parameters with torch.func.stack_module_state and vectorizing over them with vmap.
+    """
+    def __init__(self, nets):
+        """
+        nets: List of QPUnrolledNetwork with the same constructor arguments and loaded state dicts
+        """
+        functions = [_QPPolicyFunction(net) for net in nets]
+        self.num_members = len(nets)
+        self.params, self.buffers = stack_module_state(functions)
+        # The base module only provides the structure; its own tensors are replaced by the stacked ones
+        self.base = copy.deepcopy(functions[0]).to("meta")
+
+    def _call_member(self, params, buffers, x):
+        return functional_call(self.base, (params, buffers), (x,))
+
+    @torch.no_grad()
+    def __call__(self, x):
+        """
+        x: Inputs shared by all members (bs, input_size), or one batch per member (K, bs, input_size)
+
+        Returns: QP solutions of all members (K, bs, n)
+        """
+        in_dims = (0, 0, None if x.dim() == 2 else 0)
+        return vmap(self._call_member, in_dims=in_dims)(self.params, self.buffers, x)
+
+
+@torch.no_grad()
+def evaluate_ensemble(ensemble, env, actions_num, obs_mean=None, obs_var=None, obs_epsilon=1e-5, obs_clip=5., action_low=None, action_high=None):
+    """
+    Run the batch test of all members of an ensemble on one env batch, in one rollout.
+
+    Instance i of the env is controlled by member i % K, so all members face the same distribution of initial conditions and disturbances;
+    observations are normalized and actions rescaled per member, as by the rl_games player.
+
+    Parameters:
+    ensemble (EnsembleQPPolicy): Policies to evaluate.
+    env: Env created with keep_stats=True, with a batch size divisible by the number of members; each instance contributes one episode.
+    actions_num (int): Dimension of the action.
+    obs_mean, obs_var (torch.Tensor): Running statistics of the observation normalizer of each member (K, input_size); None if the observation is not normalized.
+    obs_epsilon, obs_clip (float): Parameters of the observation normalizer.
+    action_low, action_high (torch.Tensor): Bounds of the action space; None if actions are not clipped and rescaled.
+
+    Returns:
+    tuple: Episode statistics of the env (pd.DataFrame), and their summary per member (see summarize_interleaved).
+    """
+    K = ensemble.num_members
+    assert env.bs % K == 0, "The number of env instances must be divisible by the number of members"
+    obs = env.reset()
+    while not env.already_on_stats.all():
+        # (bs, input_size) -> (K, bs / K, input_size), where row j of member k is instance j * K + k
+        obs_k = obs.view(-1, K, obs.shape[-1]).transpose(0, 1)
+        if obs_mean is not None:
+            obs_k = ((obs_k - obs_mean.unsqueeze(1)) / (obs_var.unsqueeze(1) + obs_epsilon).sqrt()).clamp(-obs_clip, obs_clip)
+        action = ensemble(obs_k)[:, :, :actions_num].transpose(0, 1).reshape(-1, actions_num)
+        if action_low is not None:
+            action = action_low + (action_high - action_low) * (action.clamp(-1., 1.) + 1) / 2
+        obs, _, _, _ = env.step(action)
+    stats = env.stats
+    return stats, summarize_interleaved(stats, list(range(K)), "member")
@@ -0,0 +1,35 @@
+import torch
+
+
+class RunningMetrics():
+    """
+    Running sums of scalar diagnostics of an env, kept on the device of the env.
+
+    Adding the batch means of a step is a few device operations with no host synchronization;
+    the averages are only copied to the host, in one transfer, when they are popped at a logging interval.
+    """
+    def __init__(self, device):
+        self.device = device
+        self.sums = {}
+        self.count = 0
+
+    def add(self, **values):
+        """
+        Accumulate the batch mean of each value (tensor of any shape) under its name.
+        """
+        for name, value in values.items():
+            mean = value.detach().to(dtype=torch.float).mean()
+            self.sums[name] = self.sums[name] + mean if name in self.sums else mean
+        self.count += 1
+
+    def pop(self):
+        """
+        Returns the average of each metric over the steps added since the last call (dict of floats), and resets the sums.
+        """
+        if self.count == 0:
+            return {}
+        means = (torch.stack(list(self.sums.values())) / self.count).tolist()
+        result = dict(zip(self.sums.keys(), means))
+        self.sums = {}
+        self.count = 0
+        return result
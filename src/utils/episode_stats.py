@@ -0,0 +1,61 @@
+import numpy as np
+import pandas as pd
+import torch
+
+
+class EpisodeStatsBuffer():
+    """
+    Pre-sized store of episode statistics on the device of the env.
+
+    Since each env instance contributes at most one episode to the statistics, the store has one row per instance;
+    recording the episodes that finished in a step is one masked write per field (torch.where), with no host synchronization.
+    The rows are only copied to the host and converted to a DataFrame when the statistics are read or dumped.
+    """
+    def __init__(self, bs, fields, device):
+        """
+        bs: Number of env instances
+        fields: Dict mapping field name to (shape of one row, dtype), in the order of the columns of the DataFrame
+        device: Device of the env
+        """
+        self.bs = bs
+        self.device = device
+        self.data = {
+            name: torch.zeros((bs, *shape), dtype=dtype, device=device)
+            for (name, (shape, dtype)) in fields.items()
+        }
+
+    def record(self, mask, **values):
+        """
+        Write the given values into the rows selected by mask.
+
+        mask: Boolean tensor (bs,) selecting the instances whose episode is recorded
+        values: Tensors broadcastable to (bs, *shape) of the corresponding field, e.g. (1, n, n) for a matrix shared by all instances
+        """
+        for name, value in values.items():
+            buffer = self.data[name]
+            row_mask = mask.view(-1, *([1] * (buffer.dim() - 1)))
+            buffer.copy_(torch.where(row_mask, value.to(dtype=buffer.dtype).expand_as(buffer), buffer))
+
+    def to_dataframe(self, mask):
+        """
+        Convert the recorded rows to a DataFrame with one row per recorded episode, ordered by instance index.
+        Scalar fields become scalar columns, and other fields become columns of flattened numpy arrays.
+
+        mask: Boolean tensor (bs,) of the instances that have been recorded
+        """
+        indices = mask.nonzero().squeeze(-1)
+        columns = {"i": indices.cpu().numpy()}
+        for name, buffer in self.data.items():
+            rows = buffer[indices].cpu().numpy()
+            columns[name] = rows if rows.ndim == 1 else list(rows.reshape(rows.shape[0], int(np.prod(rows.shape[1:]))))
+        return pd.DataFrame(columns)
+
+
+def write_stats_file(stats, filename):
+    """
+    Write a DataFrame of episode statistics to filename, as Parquet if the extension is .parquet (array columns are kept as arrays), and as CSV otherwise.
+    """
+    if filename.endswith(".parquet"):
+        stats.to_parquet(filename, index=False)
+    else:
+        stats.to_csv(filename, index=False)
@@ -0,0 +1,54 @@
+import torch
+from ..modules.folded_policy import ExportedQPPolicy
+from .numpy_controller import NumpyQPController
+
+
+EXPORT_FORMATS = ["torchscript", "onnx", "numpy"]
+
+def export_policy(policy_net, filename, actions_num, obs_mean=None, obs_var=None, obs_epsilon=1e-5, action_low=None, action_high=None, format="torchscript", opset_version=17):
+    """
+    Export a trained QPUnrolledNetwork as a standalone graph, with observation normalization and action rescaling included.
+
+    The policy is first folded (see QPUnrolledNetwork.fold), so it must be in test mode with shared P, H and affine q, b.
+
+    Parameters:
+    policy_net (QPUnrolledNetwork): Trained policy, with the state dict already loaded.
+    filename (str): Output path.
+    actions_num (int): Dimension of the action.
+    obs_mean, obs_var (torch.Tensor): Running statistics of the observation normalizer; None if the observation is not normalized.
+    obs_epsilon (float): Epsilon of the observation normalizer.
+    action_low, action_high (torch.Tensor or np.ndarray): Bounds of the action space; None if actions are not clipped and rescaled.
+    format (str): One of EXPORT_FORMATS.
+    opset_version (int): ONNX opset version.
+
+    Returns:
+    The exported module (scripted for TorchScript), or a NumpyQPController for the "numpy" format (saved as .npz).
+    """
+    assert format in EXPORT_FORMATS, f"Unknown export format {format}"
+    folded = policy_net.fold()
+    # ONNX does not support in-place updates of slices
+    folded.inplace_projection = (format != "onnx")
+    policy = ExportedQPPolicy(
+        folded, actions_num,
+        obs_mean=obs_mean, obs_var=obs_var, obs_epsilon=obs_epsilon,
+        action_low=action_low, action_high=action_high,
+    ).eval()
+
+    if format == "torchscript":
+        scripted = torch.jit.script(policy)
+        scripted.save(filename)
+        return scripted
+    elif format == "numpy":
+        controller = NumpyQPController.from_exported(policy)
+        controller.save(filename)
+        return controller
+    else:
+        example_obs = torch.zeros((1, folded.input_size), device=folded.c_x.device)
+        torch.onnx.export(
+            policy, (example_obs,), filename,
+            input_names=["obs"],
+            output_names=["action"],
+            dynamic_axes={"obs": {0: "batch"}, "action": {0: "batch"}},
+            opset_version=opset_version,
+        )
+        return policy
@@ -263,11 +263,18 @@ def scenario_robust_mpc(mpc_baseline_parameters, r):
     # Setup MPC
     mpc.setup()
 
+    # Whether the initial guess of the solver has been set; afterwards, do_mpc warm starts each solve from the previous solution
+    initial_guess_set = False
+
     # Control function
     def mpc_control(x0, is_active=True):
+        nonlocal initial_guess_set
         if is_active:
             t = time.time()
             mpc.x0 = x0
+            if not initial_guess_set:
+                mpc.set_initial_guess()
+                initial_guess_set = True
 
             # Solve the MPC problem
             u0 = mpc.make_step(x0)
@@ -393,7 +400,7 @@ def tube_robust_mpc(mpc_baseline_parameters, r):
             t = time.time()
             x0.value = x0_current
             try:
-                problem.solve(solver=cp.MOSEK, verbose=True, mosek_params={'MSK_IPAR_NUM_THREADS': 1})
+                problem.solve(solver=cp.MOSEK, verbose=True, warm_start=True, mosek_params={'MSK_IPAR_NUM_THREADS': 1})
                 if u.value is not None:
                     u0 = u.value[:, 0]
                 else:
@@ -0,0 +1,147 @@
+import numpy as np
+
+
+class NumpyQPController():
+    """
+    Single-instance runtime of a folded QP policy in pure NumPy, for low-latency control loops.
+
+    All matrices are stored as contiguous arrays of one dtype, and every intermediate vector is preallocated,
+    so that computing an action performs no array allocation: each step is a np.dot / np.add / np.clip into an existing buffer.
+    Only depends on NumPy; the controller can be saved to and loaded from a .npz file without torch.
+    """
+    _ARRAYS = ["A", "W_B", "c_B", "W_z", "W_obs", "c_x", "obs_mean", "obs_inv_std", "action_mid", "action_half_range"]
+
+    def __init__(self, A, W_B, c_B, W_z, W_obs, c_x, iters, actions_num,
+            symmetric_constraint=False, buffered=False,
+            obs_mean=None, obs_inv_std=None, obs_clip=5.,
+            action_mid=None, action_half_range=None,
+            dtype=np.float64,
+        ):
+        """
+        Parameters:
+        A, W_B, c_B, W_z, W_obs, c_x (np.ndarray): Matrices of the folded policy (see FoldedQPPolicy), not transposed.
+        iters (int): Number of PDHG iterations.
+        actions_num (int): Number of leading entries of the QP solution used as action.
+        symmetric_constraint, buffered (bool): Projection rules, as in QPSolver.
+        obs_mean, obs_inv_std (np.ndarray): Observation normalization obs -> clip((obs - obs_mean) * obs_inv_std, -obs_clip, obs_clip); skipped if None.
+        action_mid, action_half_range (np.ndarray): Action rescaling a -> action_mid + action_half_range * clip(a, -1, 1); skipped if None.
+        dtype (np.dtype): Floating point type of all arrays.
+        """
+        c = lambda a: np.ascontiguousarray(a, dtype=dtype) if a is not None else None
+        self.A = c(A)
+        self.W_B = c(W_B)
+        self.c_B = c(c_B)
+        self.W_z = c(W_z)
+        self.W_obs = c(W_obs)
+        self.c_x = c(c_x)
+        self.obs_mean = c(obs_mean)
+        self.obs_inv_std = c(obs_inv_std)
+        self.action_mid = c(action_mid)
+        self.action_half_range = c(action_half_range)
+        self.iters = int(iters)
+        self.actions_num = int(actions_num)
+        self.symmetric_constraint = bool(symmetric_constraint)
+        self.buffered = bool(buffered)
+        self.obs_clip = float(obs_clip)
+        self.dtype = np.dtype(dtype)
+
+        self.m = self.A.shape[0] // 2
+        input_size = self.W_B.shape[1]
+
+        # Work buffers, and views into them created once
+        self._obs = np.zeros((input_size,), dtype=dtype)
+        self._B = np.zeros((2 * self.m,), dtype=dtype)
+        self._X = np.zeros((2 * self.m,), dtype=dtype)
+        self._AX = np.zeros((2 * self.m,), dtype=dtype)
+        self._sol = np.zeros((self.c_x.shape[0],), dtype=dtype)
+        self._tmp_sol = np.zeros((self.c_x.shape[0],), dtype=dtype)
+        self._z = self._X[self.m:]
+        self._z_inner = self._X[self.m:-1]
+        self._action = self._sol[:self.actions_num]
+
+    @classmethod
+    def from_exported(cls, policy, dtype=np.float64):
+        """
+        Build the runtime from an ExportedQPPolicy (see src.utils.export), copying its tensors to NumPy.
+        """
+        f = lambda t: t.detach().cpu().double().numpy()
+        folded = policy.folded
+        return cls(
+            f(folded.At).T, f(folded.W_Bt).T, f(folded.c_B), f(folded.W_zt).T, f(folded.W_obst).T, f(folded.c_x),
+            folded.iters, policy.actions_num,
+            symmetric_constraint=folded.symmetric_constraint, buffered=folded.buffered,
+            obs_mean=f(policy.obs_mean) if policy.normalize_obs else None,
+            obs_inv_std=1. / np.sqrt(f(policy.obs_var) + policy.obs_epsilon) if policy.normalize_obs else None,
+            obs_clip=policy.obs_clip,
+            action_mid=(f(policy.action_high) + f(policy.action_low)) / 2 if policy.rescale_action else None,
+            action_half_range=(f(policy.action_high) - f(policy.action_low)) / 2 if policy.rescale_action else None,
+            dtype=dtype,
+        )
+
+    def save(self, filename):
+        """Save the controller to a .npz file."""
+        arrays = {key: getattr(self, key) for key in self._ARRAYS if getattr(self, key) is not None}
+        np.savez(
+            filename,
+            iters=self.iters, actions_num=self.actions_num,
+            symmetric_constraint=self.symmetric_constraint, buffered=self.buffered,
+            obs_clip=self.obs_clip,
+            **arrays,
+        )
+
+    @classmethod
+    def load(cls, filename, dtype=None):
+        """Load a controller saved by save(); dtype defaults to the stored one."""
+        data = np.load(filename)
+        get = lambda key: data[key] if key in data.files else None
+        return cls(
+            *[data[key] for key in cls._ARRAYS[:6]],
+            int(data["iters"]), int(data["actions_num"]),
+            symmetric_constraint=bool(data["symmetric_constraint"]), buffered=bool(data["buffered"]),
+            obs_mean=get("obs_mean"), obs_inv_std=get("obs_inv_std"), obs_clip=float(data["obs_clip"]),
+            action_mid=get("action_mid"), action_half_range=get("action_half_range"),
+            dtype=dtype or data["A"].dtype,
+        )
+
+    def __call__(self, obs):
+        """
+        Compute the action for a single observation of shape (input_size,).
+
+        Returns: Action of shape (actions_num,). The returned array is an internal buffer, overwritten by the next call; copy it if it needs to be kept.
+        """
+        obs_n = self._obs
+        np.copyto(obs_n, obs, casting="same_kind")
+        if self.obs_mean is not None:
+            np.subtract(obs_n, self.obs_mean, out=obs_n)
+            np.multiply(obs_n, self.obs_inv_std, out=obs_n)
+            np.clip(obs_n, -self.obs_clip, self.obs_clip, out=obs_n)
+
+        # PDHG iterations, starting from zero
+        np.dot(self.W_B, obs_n, out=self._B)
+        np.add(self._B, self.c_B, out=self._B)
+        X = self._X
+        X.fill(0.)
+        for _ in range(self.iters):
+            np.dot(self.A, X, out=self._AX)
+            np.add(self._AX, self._B, out=X)
+            if not self.symmetric_constraint:
+                np.maximum(self._z, 0., out=self._z)
+            elif not self.buffered:
+                np.clip(self._z, -1., 1., out=self._z)
+            else:
+                eps = max(X[-1], 0.)
+                X[-1] = eps
+                np.clip(self._z_inner, -1. - eps, 1. + eps, out=self._z_inner)
+
+        # Recover the primal solution
+        np.dot(self.W_z, self._z, out=self._sol)
+        np.dot(self.W_obs, obs_n, out=self._tmp_sol)
+        np.add(self._sol, self._tmp_sol, out=self._sol)
+        np.add(self._sol, self.c_x, out=self._sol)
+
+        action = self._action
+        if self.action_mid is not None:
+            np.clip(action, -1., 1., out=action)
+            np.multiply(action, self.action_half_range, out=action)
+            np.add(action, self.action_mid, out=action)
+        return action
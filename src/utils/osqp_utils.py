@@ -2,21 +2,32 @@ import numpy as np
 import qpsolvers
 
 def osqp_solve_qp_guarantee_return(
-    P, q, G=None, h=None, A=None, b=None, lb=None, ub=None, initvals=None, verbose=False, **kwargs,
+    P, q, G=None, h=None, A=None, b=None, lb=None, ub=None, initvals=None, verbose=False, return_info=False, **kwargs,
 ):
     problem = qpsolvers.problem.Problem(P, q, G, h, A, b, lb, ub)
     solution = qpsolvers.solvers.osqp_.osqp_solve_problem(problem, initvals, verbose, **kwargs)
     sol_returned = solution.x if solution.x.dtype == np.float64 else np.zeros(q.shape[0])
     iter_count = solution.extras["info"].iter
-    return sol_returned, iter_count
+    if not return_info:
+        return sol_returned, iter_count
+    else:
+        return sol_returned, iter_count, solution.extras["info"]
+
+def osqp_oracle(q, b, P, H, return_iter_count=False, max_iter=1000, return_stats=False):
+    """
+    Solve the QP min (1/2)x'Px + q'x s.t. Hx + b >= 0 with OSQP at high accuracy.
 
-def osqp_oracle(q, b, P, H, return_iter_count=False, max_iter=1000):
-    sol, iter_count = osqp_solve_qp_guarantee_return(
+    When return_stats is True, returns (sol, iter_count, run_time, status_val, pri_res, dua_res), as reported by OSQP; this takes precedence over return_iter_count.
+    """
+    sol, iter_count, info = osqp_solve_qp_guarantee_return(
         P=P, q=q, G=-H, h=b,
         A=None, b=None, lb=None, ub=None,
         max_iter=max_iter, eps_abs=1e-10, eps_rel=1e-10,eps_prim_inf=1e-10, eps_dual_inf=1e-10, verbose=False,
+        return_info=True,
     )
-    if not return_iter_count:
+    if return_stats:
+        return sol, iter_count, info.run_time, info.status_val, info.pri_res, info.dua_res
+    elif not return_iter_count:
         return sol
     else:
         return sol, iter_count
@@ -0,0 +1,209 @@
+import time
+import numpy as np
+import torch
+
+from ..modules.qp_solver import QPSolver, one_sided_constraints
+from ..modules.polisher import ActiveSetPolisher
+from .telemetry import STATUS_SOLVED, STATUS_MAX_ITER_REACHED
+
+# Outcome of each instance in a control step
+DEADLINE_CONVERGED = 0          # Residuals below tolerance before the deadline
+DEADLINE_FEASIBLE = 1           # Stopped by the deadline (or max_iters); best feasible iterate returned
+DEADLINE_SLACK_FALLBACK = 2     # No feasible iterate; the slack variable of force_feasible is raised to restore feasibility
+DEADLINE_INFEASIBLE = 3         # No feasible iterate, and no slack to fall back to; last iterate returned
+
+
+class DeadlineQPController():
+    """
+    Real-time controller solving the QP of a QPUnrolledNetwork (learned QP with shared P, H, or the non-robust MPC baseline) under a wall-clock budget per control step, instead of a fixed number of PDHG iterations.
+
+    PDHG runs in blocks of block_iters iterations. Between blocks, the residuals and the elapsed time are checked; the step ends when all residuals are below tol,
+    when max_iters is reached, or when the next block (predicted from a running average of the block time) would not finish before the deadline.
+    At least one block runs per step, so a step can overrun when a single block does not fit into the cycle; overruns are counted in the statistics.
+
+    For each instance, the returned solution is the feasible iterate (among the ends of the blocks) with the lowest residual;
+    if there is none and the QP has the slack variable of force_feasible, the last iterate with the slack raised until the constraints hold is returned instead.
+    """
+    def __init__(self, net, cycle_time, block_iters=5, max_iters=1000, tol=1e-3, feas_tol=1e-4, margin=0., warm_start=True):
+        """
+        Parameters:
+        net (QPUnrolledNetwork): Policy; the learned QP requires shared_PH, and the MPC baseline must not be robust.
+        cycle_time (float): Wall-clock budget per control step, in seconds.
+        block_iters (int): Number of PDHG iterations between checks of time and residuals.
+        max_iters (int): Maximum number of PDHG iterations per step.
+        tol (float): Tolerance on the infinity norms of the primal and dual residuals for early termination.
+        feas_tol (float): Tolerance on the constraint violation for an iterate to be considered feasible.
+        margin (float): Time reserved at the end of each cycle (e.g., for applying the action), in seconds.
+        warm_start (bool): Whether to start PDHG from the last iterate of the previous step; call reset() when the instances restart.
+        """
+        self.net = net
+        self.cycle_time = cycle_time
+        self.block_iters = block_iters
+        self.max_iters = max_iters
+        self.tol = tol
+        self.feas_tol = feas_tol
+        self.margin = margin
+        self.warm_start = warm_start
+
+        self.use_mpc = net.mpc_baseline is not None and not net.imitate_mpc
+        if self.use_mpc:
+            assert net.mpc_baseline.get("robust_method", None) is None, "Robust MPC is not solved by PDHG"
+            self.symmetric, self.buffered = False, False
+        else:
+            assert net.shared_PH, "Requires shared_PH, so that the constraint matrix is the same for all instances"
+            self.symmetric, self.buffered = net.symmetric, net.force_feasible
+        self.mpc_solver = None
+        self.G = None
+
+        self.X = None
+        self.block_time = None      # Running average of the wall time per block
+        self.reset_statistics()
+
+    def reset(self):
+        """Forget the iterate of the previous step."""
+        self.X = None
+
+    def reset_statistics(self):
+        self.num_steps = 0
+        self.num_overruns = 0
+        self.max_overrun = 0.
+        self.total_iters = 0
+        self.total_time = 0.
+        self.status_counts = np.zeros((4,), dtype=np.int64)
+
+    def statistics(self):
+        """
+        Returns:
+        dict: Number of steps, number and maximum length (seconds) of cycle overruns, average iterations and wall time per step, and the number of instances ending in each DEADLINE_* status.
+        """
+        steps = max(self.num_steps, 1)
+        return {
+            "steps": self.num_steps,
+            "overruns": self.num_overruns,
+            "max_overrun": self.max_overrun,
+            "avg_iterations": self.total_iters / steps,
+            "avg_time": self.total_time / steps,
+            "converged": int(self.status_counts[DEADLINE_CONVERGED]),
+            "feasible": int(self.status_counts[DEADLINE_FEASIBLE]),
+            "slack_fallback": int(self.status_counts[DEADLINE_SLACK_FALLBACK]),
+            "infeasible": int(self.status_counts[DEADLINE_INFEASIBLE]),
+        }
+
+    def get_problem(self, obs):
+        """
+        Returns: (solver, q, b, Pinv, H) for the QP at observations obs, where Pinv, H are the arguments passed to the solver (None if fixed in the solver).
+        Also sets self.G, the constraint matrix in one-sided form (see one_sided_constraints).
+        """
+        net = self.net
+        if self.use_mpc:
+            # P, H of the MPC template do not depend on the state
+            n, m, P, q, H, b = net.get_mpc_qp(obs)
+            if self.mpc_solver is None:
+                if net.polish and net.mpc_polisher is None:
+                    net.mpc_polisher = ActiveSetPolisher(obs.device, n, m, H, P=P)
+                self.mpc_solver = QPSolver(obs.device, n, m, P=P, H=H, polisher=net.mpc_polisher, screening=net.screening)
+                self.G = H
+            return self.mpc_solver, q, b, None, None
+        if net.solver is None:
+            net.initialize_solver()
+        q, b = net.get_qb(obs, net.mlp(obs) if net.mlp is not None else None)
+        if net.fixed_PH:
+            Pinv, H = None, None
+            H_eff = net.solver.bH[0]
+        else:
+            Pinv, H = net.PH_cache()
+            H_eff = H[0]
+        self.G, _ = one_sided_constraints(H=H_eff, symmetric_constraint=self.symmetric, buffered=self.buffered)
+        return net.solver, q, b, Pinv, H
+
+    def raise_slack(self, x, g):
+        """Raise the slack variable (last entry of x) by the least amount that satisfies the constraints whose slack depends on it."""
+        coef = self.G[:, -1]
+        slack = x @ self.G.t() + g
+        increase = torch.where(coef > 0, -slack / coef.clamp(min=1e-12), torch.zeros_like(slack)).amax(dim=-1).clamp(min=0)
+        x = x.clone()
+        x[:, -1] += increase
+        return x
+
+    @torch.no_grad()
+    def __call__(self, obs):
+        """
+        Compute the QP solutions for one control step.
+
+        obs: Network inputs (bs, input_size), preprocessed as for the network
+
+        Returns: Solutions (bs, n), and a dict with the number of PDHG iterations, the elapsed time, and the DEADLINE_* status of each instance
+        """
+        t_start = time.perf_counter()
+        deadline = t_start + self.cycle_time - self.margin
+        solver, q, b, Pinv, H = self.get_problem(obs)
+        _, g = one_sided_constraints(b=b, symmetric_constraint=self.symmetric, buffered=self.buffered)
+        bs = q.shape[0]
+
+        X = self.X if (self.warm_start and self.X is not None and self.X.shape[0] == bs) else None
+        best_sol = torch.zeros_like(q)
+        best_residual = torch.full((bs,), float("inf"), device=q.device)
+        # Residuals of the best iterate, for telemetry
+        best_primal_residual = torch.full((bs,), float("inf"), device=q.device)
+        best_dual_residual = torch.full((bs,), float("inf"), device=q.device)
+        iters = 0
+        while True:
+            t_block = time.perf_counter()
+            Xs, primal_sols, (primal_residual, dual_residual) = solver(q, b, Pinv=Pinv, H=H, iters=self.block_iters, return_residuals=True, X0=X)
+            X = Xs[:, -1, :]
+            sol = primal_sols[:, -1, :]
+            primal_residual_norm = primal_residual.abs().amax(dim=-1)
+            dual_residual_norm = dual_residual.abs().amax(dim=-1)
+            residual = torch.maximum(primal_residual_norm, dual_residual_norm)
+            violation = (-(sol @ self.G.t() + g)).clamp(min=0).amax(dim=-1)
+            improved = (violation <= self.feas_tol) & (residual < best_residual)
+            best_sol = torch.where(improved.unsqueeze(-1), sol, best_sol)
+            best_residual = torch.where(improved, residual, best_residual)
+            best_primal_residual = torch.where(improved, primal_residual_norm, best_primal_residual)
+            best_dual_residual = torch.where(improved, dual_residual_norm, best_dual_residual)
+            iters += self.block_iters
+            # .item() waits for the device, so that the block is timed correctly
+            converged = (best_residual <= self.tol).all().item()
+            now = time.perf_counter()
+            self.block_time = (now - t_block) if self.block_time is None else 0.9 * self.block_time + 0.1 * (now - t_block)
+            if converged or iters >= self.max_iters or now + self.block_time > deadline:
+                break
+
+        has_feasible = torch.isfinite(best_residual)
+        result = torch.where(has_feasible.unsqueeze(-1), best_sol, sol)
+        # Instances without a feasible iterate return (a correction of) the last iterate
+        result_primal_residual = torch.where(has_feasible, best_primal_residual, primal_residual_norm)
+        result_dual_residual = torch.where(has_feasible, best_dual_residual, dual_residual_norm)
+        status = torch.full((bs,), DEADLINE_FEASIBLE, dtype=torch.long, device=q.device)
+        status[best_residual <= self.tol] = DEADLINE_CONVERGED
+        if not has_feasible.all().item():
+            fallback = torch.full((bs,), DEADLINE_INFEASIBLE, dtype=torch.long, device=q.device)
+            if self.buffered:
+                sol_slack = self.raise_slack(sol, g)
+                result = torch.where(has_feasible.unsqueeze(-1), result, sol_slack)
+                restored = (-(sol_slack @ self.G.t() + g)).clamp(min=0).amax(dim=-1) <= self.feas_tol
+                fallback[restored] = DEADLINE_SLACK_FALLBACK
+            status = torch.where(has_feasible, status, fallback)
+        if self.warm_start:
+            self.X = X
+
+        elapsed = time.perf_counter() - t_start
+        status_np = status.cpu().numpy()
+        self.num_steps += 1
+        self.total_iters += iters
+        self.total_time += elapsed
+        if elapsed > self.cycle_time:
+            self.num_overruns += 1
+            self.max_overrun = max(self.max_overrun, elapsed - self.cycle_time)
+        self.status_counts += np.bincount(status_np, minlength=4)
+        if self.net.telemetry is not None:
+            self.net.telemetry.record(
+                "pdhg",
+                iterations=iters,
+                wall_time=elapsed / bs,
+                status=np.where(status_np == DEADLINE_CONVERGED, STATUS_SOLVED, STATUS_MAX_ITER_REACHED),
+                primal_residual=result_primal_residual.cpu().numpy(),
+                dual_residual=result_dual_residual.cpu().numpy(),
+                instance=np.arange(bs),
+            )
+        return result, {"iterations": iters, "elapsed": elapsed, "status": status_np}
@@ -49,6 +49,7 @@ class RLGPUAlgoObserver(AlgoObserver):
         self.mean_scores = torch_ext.AverageMeter(1, self.algo.games_to_track).to(self.algo.ppo_device)
         self.ep_infos = []
         self.direct_info = {}
+        self.reward_metrics = None
         self.writer = self.algo.writer
 
     def process_infos(self, infos, done_indices):
@@ -57,6 +58,10 @@ class RLGPUAlgoObserver(AlgoObserver):
             if 'episode' in infos:
                 self.ep_infos.append(infos['episode'])
 
+            # Running sums kept on the device by the env; only read at print time
+            if 'reward_metrics' in infos:
+                self.reward_metrics = infos['reward_metrics']
+
             if len(infos) > 0 and isinstance(infos, dict):  # allow direct logging from env
                 self.direct_info = {}
                 for k, v in infos.items():
@@ -82,6 +87,11 @@ class RLGPUAlgoObserver(AlgoObserver):
                     self.writer.add_scalar('Episode/' + key, value, epoch_num)
             self.ep_infos.clear()
         
+        if self.reward_metrics is not None:
+            for k, v in self.reward_metrics.pop().items():
+                self.writer.add_scalar(f'reward/{k}/frame', v, frame)
+                self.writer.add_scalar(f'reward/{k}/iter', v, epoch_num)
+
         for k, v in self.direct_info.items():
             self.writer.add_scalar(f'{k}/frame', v, frame)
             self.writer.add_scalar(f'{k}/iter', v, epoch_num)
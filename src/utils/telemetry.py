@@ -0,0 +1,160 @@
+import numpy as np
+import pandas as pd
+import os
+
+
+# Backends whose per-solve metrics can be recorded
+TELEMETRY_BACKENDS = ["pdhg", "osqp", "do_mpc", "cvxpy", "ip"]
+
+# Status codes follow the convention of OSQP's status_val; backends without a notion of status use STATUS_UNKNOWN
+STATUS_SOLVED = 1
+STATUS_SOLVED_INACCURATE = 2
+STATUS_MAX_ITER_REACHED = -2
+STATUS_UNKNOWN = 0
+
+TELEMETRY_DTYPE = np.dtype([
+    ("step", np.int64),                 # Index of the record() call that produced the row
+    ("instance", np.int64),             # Index of the simulation instance within the batch
+    ("backend", np.int8),               # Index into TELEMETRY_BACKENDS
+    ("iterations", np.int64),           # Solver iterations; -1 if not reported by the backend
+    ("wall_time", np.float64),          # Seconds spent on the solve
+    ("status", np.int64),               # See STATUS_* above
+    ("primal_residual", np.float64),    # Infinity norm of the primal residual; NaN if not reported
+    ("dual_residual", np.float64),      # Infinity norm of the dual residual; NaN if not reported
+])
+
+_DEFAULTS = {
+    "instance": -1,
+    "iterations": -1,
+    "wall_time": np.nan,
+    "status": STATUS_UNKNOWN,
+    "primal_residual": np.nan,
+    "dual_residual": np.nan,
+}
+
+
+class SolverTelemetry():
+    """
+    Append-only store of per-solve solver metrics.
+
+    Rows are written into pre-sized chunks of TELEMETRY_DTYPE records, so that recording a batch of solves is a slice
+    assignment instead of a concatenation of everything recorded so far.
+
+    If filename is None, chunks are kept in memory as an arena that grows one chunk at a time.
+    Otherwise, a single chunk is reused as a ring buffer: whenever it fills up, its content is appended to the CSV file
+    and the chunk is rewound, so memory usage stays bounded over arbitrarily long tests.
+    """
+    def __init__(self, filename=None, chunk_size=65536):
+        self.filename = filename
+        self.chunk_size = chunk_size
+        self._chunks = [np.empty((chunk_size,), dtype=TELEMETRY_DTYPE)]
+        self._fill = 0               # Number of rows used in the last chunk
+        self._num_flushed = 0        # Number of rows already written to file
+        self._header_written = False
+        self.num_steps = 0
+
+    def __len__(self):
+        return self._num_flushed + (len(self._chunks) - 1) * self.chunk_size + self._fill
+
+    def record(self, backend, iterations=None, wall_time=None, status=None, primal_residual=None, dual_residual=None, instance=None):
+        """
+        Record the metrics of a batch of solves from one backend.
+
+        backend: Name of the backend, one of TELEMETRY_BACKENDS
+        iterations, wall_time, status, primal_residual, dual_residual, instance: Scalars or arrays of shape (k,); at least one of them must be an array to determine k, and unspecified fields are filled with defaults
+        """
+        columns = {
+            "iterations": iterations,
+            "wall_time": wall_time,
+            "status": status,
+            "primal_residual": primal_residual,
+            "dual_residual": dual_residual,
+            "instance": instance,
+        }
+        sizes = [np.size(v) for v in columns.values() if v is not None and np.ndim(v) > 0]
+        if not sizes:
+            return
+        k = sizes[0]
+        assert all(size == k for size in sizes), "All recorded fields must have the same length"
+        columns = {
+            key: np.broadcast_to(np.asarray(_DEFAULTS[key] if value is None else value), (k,))
+            for (key, value) in columns.items()
+        }
+        columns["step"] = np.broadcast_to(np.asarray(self.num_steps), (k,))
+        columns["backend"] = np.broadcast_to(np.asarray(TELEMETRY_BACKENDS.index(backend)), (k,))
+
+        pos = 0
+        while pos < k:
+            if self._fill == self.chunk_size:
+                self._next_chunk()
+            count = min(k - pos, self.chunk_size - self._fill)
+            chunk = self._chunks[-1]
+            for key, value in columns.items():
+                chunk[key][self._fill:self._fill + count] = value[pos:pos + count]
+            self._fill += count
+            pos += count
+        self.num_steps += 1
+
+    def _next_chunk(self):
+        """Make room for more rows once the last chunk is full."""
+        if self.filename is not None:
+            self.flush()
+        else:
+            self._chunks.append(np.empty((self.chunk_size,), dtype=TELEMETRY_DTYPE))
+            self._fill = 0
+
+    def _unflushed(self):
+        """Rows held in memory, in recording order."""
+        return np.concatenate(self._chunks[:-1] + [self._chunks[-1][:self._fill]])
+
+    def flush(self):
+        """Append the rows held in memory to the CSV file and rewind the buffer. No-op for in-memory telemetry."""
+        if self.filename is None or self._fill == 0:
+            return
+        directory = os.path.dirname(self.filename)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        _records_to_dataframe(self._unflushed()).to_csv(self.filename, mode="w" if not self._header_written else "a", header=not self._header_written, index=False)
+        self._header_written = True
+        self._num_flushed += self._fill
+        self._chunks = self._chunks[-1:]
+        self._fill = 0
+
+    def to_dataframe(self):
+        """Return all recorded rows as a DataFrame (reads back the CSV file if the telemetry is file-backed)."""
+        if self.filename is None:
+            return _records_to_dataframe(self._unflushed())
+        self.flush()
+        return read_telemetry(self.filename) if self._header_written else _records_to_dataframe(self._unflushed())
+
+    def query(self, field, backend=None, status=None):
+        """Return the values of one field as an array, optionally filtered by backend and status."""
+        return query_telemetry(self.to_dataframe(), field, backend=backend, status=status)
+
+
+def _records_to_dataframe(records):
+    df = pd.DataFrame({name: records[name] for name in TELEMETRY_DTYPE.names})
+    df["backend"] = np.array(TELEMETRY_BACKENDS)[df["backend"].to_numpy()]
+    return df
+
+def read_telemetry(filename):
+    """Load a telemetry CSV written by SolverTelemetry."""
+    return pd.read_csv(filename)
+
+def query_telemetry(df, field, backend=None, status=None):
+    """
+    Select one field of a telemetry DataFrame.
+
+    df: DataFrame returned by read_telemetry or SolverTelemetry.to_dataframe
+    field: Column name, e.g., "iterations" or "wall_time"
+    backend: Optional backend name (or list of names) to filter on
+    status: Optional status code (or list of codes) to filter on
+
+    Returns: np.ndarray of the selected values, in recording order
+    """
+    mask = np.ones((len(df),), dtype=bool)
+    if backend is not None:
+        mask &= df["backend"].isin([backend] if isinstance(backend, str) else backend).to_numpy()
+    if status is not None:
+        mask &= df["status"].isin(np.atleast_1d(status)).to_numpy()
+    return df[field].to_numpy()[mask]
@@ -2,6 +2,7 @@ import torch
 from torch.nn import functional as F
 from contextlib import nullcontext, contextmanager
 import numpy as np
+import functools
 
 
 def bmv(A, b):
@@ -32,17 +33,24 @@ def bsolve(A, B):
     else:
         return torch.linalg.solve(A, B)
 
+@functools.lru_cache(maxsize=None)
+def _psd_indices(N, device):
+    """Index tensors used by make_psd, cached per (N, device) to avoid re-allocating them on every call."""
+    cholesky_diag_index = torch.arange(N, dtype=torch.long, device=device) + 1
+    cholesky_diag_index = (cholesky_diag_index * (cholesky_diag_index + 1)) // 2 - 1 # computes the indices of the future diagonal elements of the matrix
+    tril_indices = torch.tril_indices(row=N, col=N, offset=0, device=device) # Collection that contains the indices of the non-zero elements of a lower triangular matrix
+    tril_flat_index = tril_indices[0] * N + tril_indices[1]    # Same indices into the flattened matrix
+    return cholesky_diag_index, tril_flat_index
+
 def make_psd(x, min_eig=0.1):
     """Assume x is (bs, N*(N+1)/2), create (bs, N, N) batch of PSD matrices using Cholesky."""
     bs, n_elem = x.shape
     N = (int(np.sqrt(1 + 8 * n_elem)) - 1) // 2
-    cholesky_diag_index = torch.arange(N, dtype=torch.long) + 1
-    cholesky_diag_index = (cholesky_diag_index * (cholesky_diag_index + 1)) // 2 - 1 # computes the indices of the future diagonal elements of the matrix
+    cholesky_diag_index, tril_flat_index = _psd_indices(N, x.device)
     elem = x.clone()
     elem[:, cholesky_diag_index] = np.sqrt(min_eig) + F.softplus(elem[:, cholesky_diag_index])
-    tril_indices = torch.tril_indices(row=N, col=N, offset=0) # Collection that contains the indices of the non-zero elements of a lower triangular matrix
-    cholesky = torch.zeros(size=(bs, N, N), dtype=torch.float, device=elem.device) #initialize a square matrix to zeros
-    cholesky[:, tril_indices[0], tril_indices[1]] = elem # Assigns the elements of the vector to their correct position in the lower triangular matrix
+    # Place the elements of the vector at their positions in the lower triangular matrix; out of place, so that it also works under torch.func.vmap
+    cholesky = torch.zeros(size=(bs, N * N), dtype=torch.float, device=elem.device).index_copy(1, tril_flat_index, elem).view(bs, N, N)
     return cholesky @ cholesky.transpose(1, 2)
 
 def vectorize_upper_triangular(matrices):
@@ -81,10 +89,65 @@ def kron(a, b):
     return res.reshape(siz0 + siz1)
 
 
-def interpolate_state_dicts(state_dict_1, state_dict_2, weight):
-    return {
-        key: (1 - weight) * state_dict_1[key] + weight * state_dict_2[key] for key in state_dict_1.keys()
-    }
+class ParameterAverager():
+    """
+    Keeps the parameters of a target module as an exponential moving average of those of a source module with the same architecture, i.e.,
+    target <- (1 - rate) * target + rate * source, updated in place with a fused foreach kernel.
+
+    maybe_update() only performs the update when the source parameters have been modified since the last update (tracked through their version counters),
+    so that it can be called on every forward pass while the averaging happens once per optimizer step.
+    """
+    def __init__(self, source, target, rate):
+        self.source_params = list(source.parameters())
+        self.target_params = list(target.parameters())
+        self.rate = rate
+        self.source_version = None
+
+    @torch.no_grad()
+    def update(self):
+        torch._foreach_lerp_(self.target_params, self.source_params, self.rate)
+        self.source_version = tuple(p._version for p in self.source_params)
+
+    def maybe_update(self):
+        if self.source_version != tuple(p._version for p in self.source_params):
+            self.update()
+
+
+class ParameterVersionCache():
+    """
+    Memoizes the tensors returned by fn(), a function of the given parameters only, until the parameters are modified (e.g., by an optimizer step).
+
+    Parameter modifications are detected through their version counters and storage pointers.
+    When gradient is enabled, the cached tensors carry the autograd graph, which is freed by backward; hence the cache is also invalidated as soon as
+    gradient flows back through any of the cached tensors, so that a later forward pass builds a fresh graph.
+    """
+    def __init__(self, fn, params):
+        self.fn = fn
+        self.params = params
+        self.key = None
+        self.values = None
+
+    def _invalidate(self, grad):
+        self.key = None
+        self.values = None
+
+    def __call__(self):
+        key = (tuple((p._version, p.data_ptr()) for p in self.params), torch.is_grad_enabled())
+        if key != self.key:
+            self.values = self.fn()
+            self.key = key
+            if torch.is_grad_enabled():
+                for value in self.values:
+                    if value.requires_grad:
+                        value.register_hook(self._invalidate)
+        return self.values
+
+    def __getstate__(self):
+        # Cached tensors (possibly non-leaf) are not copied or pickled
+        state = self.__dict__.copy()
+        state["key"] = None
+        state["values"] = None
+        return state
 
 
 @contextmanager